@@ -0,0 +1,78 @@
+"""Compares the throughput and compression ratio of the archive codecs
+on a synthetic job folder, which contains text outputs (as OUTCAR) and
+binary files of noisy floats (as WAVECAR and CHGCAR).
+
+Usage: python benchmarks/archive_codecs.py [-s SIZE_MB] [-t THREADS]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from array import array
+from tempfile import TemporaryDirectory
+
+# runs from a checkout of the repository without installing mkwind
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mkwind.postprocess.codecs import CODECS
+
+
+LEVELS = {"none": [None], "gzip": [1, 6], "pigz": [1, 6], "zstd": [1, 3, 9]}
+
+
+def make_job_folder(path: os.PathLike, size_mb: float) -> int:
+    """Writes a job folder of approximately `size_mb` MB and returns its size"""
+    os.makedirs(path)
+    rng = random.Random(0)
+
+    n_lines = int(size_mb * 1e6 * 0.3 / 40)
+    with open(os.path.join(path, "OUTCAR"), "w") as f:
+        for i in range(n_lines):
+            f.write(f"  ion {i % 64:4d} {rng.gauss(0, 1):12.6f} {rng.gauss(0, 1):12.6f}\n")
+
+    for name, fraction in (("WAVECAR", 0.5), ("CHGCAR", 0.2)):
+        n = int(size_mb * 1e6 * fraction / 4)
+        data = array("f", (round(rng.gauss(0, 1), 3) for _ in range(n)))
+        with open(os.path.join(path, name), "wb") as f:
+            data.tofile(f)
+
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--size", type=float, default=100, help="size of the folder in MB")
+    parser.add_argument("-t", "--threads", type=int, default=0, help="threads of zstd and pigz")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "job")
+        size = make_job_folder(folder, args.size)
+        print(f"job folder: {size / 1e6:.1f} MB\n")
+        print(f"{'codec':>6} {'level':>5} {'time (s)':>9} {'MB/s':>8} {'ratio':>6}")
+
+        for name, cls in CODECS.items():
+            for level in LEVELS[name]:
+                codec = cls(level=level, threads=args.threads)
+                if not codec.available():
+                    print(f"{name:>6} {'':>5} {'not installed':>9}")
+                    break
+
+                dst = os.path.join(tmp, codec.get_name(f"{name}_{level}"))
+                start = time.perf_counter()
+                codec.compress(folder, dst)
+                elapsed = time.perf_counter() - start
+
+                ratio = size / os.path.getsize(dst)
+                level = "" if level is None else level
+                print(
+                    f"{name:>6} {level:>5} {elapsed:9.2f} "
+                    f"{size / 1e6 / elapsed:8.1f} {ratio:6.2f}"
+                )
+                os.remove(dst)
+
+
+if __name__ == "__main__":
+    main()
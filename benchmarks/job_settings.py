@@ -0,0 +1,35 @@
+"""Compares the cost of building the JobSettings of one job with and
+without reading the environment variables.
+
+Usage: python benchmarks/job_settings.py [-n NUMBER]
+"""
+
+import os
+import sys
+import argparse
+import timeit
+
+# runs from a checkout of the repository without installing mkwind
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pkg_resources import resource_filename
+from mkite_core.external import load_config
+from mkwind.builder.settings import JobSettings, JobEnvSettings
+
+CONFIG_PATH = resource_filename("mkwind.tests.files.clusters", "recipe.yaml")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    data = dict(load_config(CONFIG_PATH))
+
+    for cls in (JobEnvSettings, JobSettings):
+        elapsed = timeit.timeit(lambda: cls(**data), number=args.number)
+        print(f"{cls.__name__:>15}: {elapsed / args.number * 1e6:8.2f} us/job")
+
+
+if __name__ == "__main__":
+    main()
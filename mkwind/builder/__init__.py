@@ -1,3 +1,3 @@
 from .base import JobBuilder
-from .settings import JobSettings
+from .settings import JobSettings, JobEnvSettings
 from .daemon import BuilderDaemon
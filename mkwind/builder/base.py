@@ -1,14 +1,23 @@
 import os
 import shutil
-from typing import Union
+from typing import Dict, List, Tuple, Union
+from collections import Counter
 from tempfile import TemporaryDirectory
+from concurrent.futures import ThreadPoolExecutor
 
 from mkite_core.models import JobInfo, Status
 from mkite_engines import BaseConsumer, LocalProducer
 from mkwind.user import EnvSettings
+from mkwind.user.journal import get_journal
 from mkwind.templates import Template
 
 from .settings import JobSettings, AllJobSettings
+from .timings import StageTimings
+from .claim import claim_infos, ack_infos, release_infos
+from .fairshare import allocate
+
+
+STAGING_DIR = ".staging"
 
 
 class BuilderError(Exception):
@@ -24,15 +33,48 @@ class JobBuilder:
         template: Template,
         explicit_config: bool = True,
         delete_on_build: bool = False,
+        build_workers: int = 1,
     ):
         self.src = src_engine
         self.dst = dst_engine
         self.template = template
         self.explicit_config = explicit_config
-        self.recipe_settings = AllJobSettings.from_file(settings.BUILD_CONFIG)
         self.delete_on_build = delete_on_build
+        self.build_workers = max(build_workers, 1)
+        self.timings = StageTimings()
+
+        self.settings = None
+        self.apply_settings(settings)
+        self.journal = get_journal(settings, self.dst.root_path)
+
+    def apply_settings(self, settings: EnvSettings):
+        """Uses the new `settings` for the next builds. The build config
+        is only loaded again if its path or mode changed, as changes to
+        the file itself are picked up by `recipe_settings`."""
+        config = (settings.BUILD_CONFIG, settings.BUILD_ENV_OVERRIDES)
+        if self.settings is None or config != (
+            self.settings.BUILD_CONFIG,
+            self.settings.BUILD_ENV_OVERRIDES,
+        ):
+            self.recipe_settings = AllJobSettings.from_file(
+                settings.BUILD_CONFIG, env_overrides=settings.BUILD_ENV_OVERRIDES
+            )
+
+        self.staging = settings.BUILD_STAGING
+        if self.staging:
+            self.dst.add_queue(Status.READY)
+            os.makedirs(self.staging_path, exist_ok=True)
+
+        self.settings = settings
+
+    @property
+    def staging_path(self) -> os.PathLike:
+        return os.path.join(self.dst.root_path, STAGING_DIR)
 
     def get_ready(self):
+        if self.journal is not None:
+            return self.journal.count(Status.READY)
+
         ready_jobs = self.dst.list_queue(Status.READY.value)
         return len(ready_jobs)
 
@@ -51,56 +93,194 @@ class JobBuilder:
         # allows building as long as it is not a queue name
         return not Status.has_value(recipe)
 
-    def build_all(self, max_build: int = 1000):
-        n = 0
-        built = []
+    def get_ready_by_recipe(self) -> Dict[str, int]:
+        """Counts the jobs in READY per recipe using the names of the
+        folders, which have the format `{recipe}_{uuid}_{timestamp}`"""
+        if self.journal is not None:
+            return self.journal.count_by_recipe(Status.READY)
+
+        ready = self.dst.list_queue(Status.READY.value)
+        return Counter(name.rsplit("_", 2)[0] for name in ready)
 
-        for queue in self.get_src_queues():
-            while n < max_build:
-                key, info = self.src.get_info(queue)
-                if info is None:
-                    break
+    def get_quotas(self, queues: List[str]) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """Returns the weights of the queues and the number of jobs each
+        of them can still add to READY (None if unlimited)"""
+        ready = self.get_ready_by_recipe()
 
-                job_folder = self.build_job(info)
-                built.append(job_folder)
+        weights, limits = {}, {}
+        for queue in queues:
+            weight, max_ready = self.recipe_settings.get_share(queue)
+            weights[queue] = weight
+            limits[queue] = None if max_ready is None else max(max_ready - ready[queue], 0)
 
-                if self.delete_on_build:
-                    self.src.delete(key)
-                n += 1
+        return weights, limits
+
+    def build_all(self, max_build: int = 1000):
+        """Builds up to `max_build` jobs from the source queues. The slots
+        are shared between queues by weighted round-robin, according to
+        their `weight` and `max_ready` in the config. Slots left by
+        queues that run out of jobs are given to the others.
+
+        The jobs of each queue are claimed in a single batch and built by
+        a pool of `build_workers` threads while the next queue is claimed.
+        Built jobs are acknowledged in a single batch at the end, and jobs
+        that failed to build are returned to their queues. The
+        built folders are returned in the order they were claimed, and
+        the time spent in each stage is stored in `timings`."""
+        timings = StageTimings()
+        futures = []
+        keys = set()
+
+        with timings.measure("total"):
+            weights, limits = self.get_quotas(self.get_src_queues())
+
+            with ThreadPoolExecutor(max_workers=self.build_workers) as pool:
+                while len(futures) < max_build and weights:
+                    allocation = allocate(max_build - len(futures), weights, limits)
+                    if not any(allocation.values()):
+                        break
+
+                    for queue, n in allocation.items():
+                        if n == 0:
+                            continue
+
+                        with timings.measure("fetch"):
+                            claimed = claim_infos(self.src, queue, n, exclude=keys)
+
+                        keys.update(key for key, info in claimed)
+
+                        # the queue ran out of jobs
+                        if len(claimed) < n:
+                            weights.pop(queue)
+
+                        if limits[queue] is not None:
+                            limits[queue] -= len(claimed)
+
+                        futures += [
+                            (queue, key, pool.submit(self.build_timed, info, timings))
+                            for key, info in claimed
+                        ]
+
+                built, done, errors = [], [], []
+                failed: Dict[str, List[str]] = {}
+                for queue, key, future in futures:
+                    try:
+                        built.append(future.result())
+                        done.append(key)
+                    except Exception as e:
+                        errors.append(e)
+                        failed.setdefault(queue, []).append(key)
+
+            if self.delete_on_build:
+                with timings.measure("ack"):
+                    ack_infos(self.src, done)
+
+            for queue, failed_keys in failed.items():
+                release_infos(self.src, queue, failed_keys)
+
+        self.timings = timings
+
+        # jobs that failed to build are not acknowledged
+        if errors:
+            raise errors[0]
 
         return built
 
+    def build_timed(self, info: JobInfo, timings: StageTimings) -> os.PathLike:
+        with timings.measure("build"):
+            return self.build_job(info)
+
     def build_one(self, recipe: str = None):
         if recipe is None:
             recipe = self.get_src_queues()[0]
 
-        key, info = self.src.get_info(recipe)
+        claimed = claim_infos(self.src, recipe, 1)
 
-        if info is None:
-            return key, info, None
+        if not claimed:
+            return None, None, None
 
-        job_folder = self.build_job(info)
+        key, info = claimed[0]
+        try:
+            job_folder = self.build_job(info)
+        except Exception:
+            release_infos(self.src, recipe, [key])
+            raise
 
         if self.delete_on_build:
-            self.src.delete(key)
+            ack_infos(self.src, [key])
 
         return key, info, job_folder
 
     def build_job(self, info: JobInfo) -> os.PathLike:
         job_settings = self.get_settings(info)
+        # the folder name contains a timestamp, so it is computed only once
+        name = info.folder_name
+
+        if self.staging:
+            dst = self.build_staged(info, job_settings, name=name)
+        else:
+            with TemporaryDirectory() as tmp:
+                job_folder = self.write_job(info, job_settings, root=tmp, name=name)
+                dst = self.dst.push(Status.READY.value, job_folder)
+
+        if self.journal is not None:
+            self.journal.record(
+                os.path.basename(dst), Status.READY, recipe=info.recipe["name"]
+            )
+
+        return dst
+
+    def build_staged(
+        self, info: JobInfo, job_settings: JobSettings, name: str = None
+    ) -> os.PathLike:
+        """Builds the job in the staging folder, which is in the same
+        filesystem as the READY queue, and moves it to READY with a
+        single rename. Partially built jobs are never visible in READY."""
+        self.remove_stale(info)
 
-        with TemporaryDirectory() as tmp:
-            job_folder = self.make_folder(info, root=tmp)
-            self.write_template(job_folder, job_settings)
-            self.write_info(info, job_folder, JobInfo.file_name())
-            self.write_info(job_settings, job_folder, JobSettings.file_name())
+        job_folder = self.write_job(info, job_settings, root=self.staging_path, name=name)
+        dst = self.dst.item_path(Status.READY.value, job_folder)
 
-            dst = self.dst.push(Status.READY.value, job_folder)
+        try:
+            if os.path.exists(dst):
+                raise BuilderError("Trying to build jobs with the same name.")
+
+            os.rename(job_folder, dst)
+
+        except (BuilderError, OSError):
+            shutil.rmtree(job_folder, ignore_errors=True)
+            raise
 
         return dst
 
-    def make_folder(self, info: JobInfo, root: os.PathLike) -> os.PathLike:
-        path = os.path.join(root, info.folder_name)
+    def remove_stale(self, info: JobInfo):
+        """Removes the leftovers of builders that stopped in the middle
+        of building `info`. As the timestamp of the folder names changes
+        between builds, leftovers are found by the `{recipe}_{uuid}_` prefix."""
+        prefix = f"{info.folder_prefix}_"
+        for name in os.listdir(self.staging_path):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(self.staging_path, name), ignore_errors=True)
+
+    def write_job(
+        self,
+        info: JobInfo,
+        job_settings: JobSettings,
+        root: os.PathLike,
+        name: str = None,
+    ) -> os.PathLike:
+        job_folder = self.make_folder(info, root=root, name=name)
+        self.write_template(job_folder, job_settings)
+        self.write_info(info, job_folder, JobInfo.file_name())
+        self.write_info(job_settings, job_folder, JobSettings.file_name())
+
+        return job_folder
+
+    def make_folder(
+        self, info: JobInfo, root: os.PathLike, name: str = None
+    ) -> os.PathLike:
+        name = info.folder_name if name is None else name
+        path = os.path.join(root, name)
         if os.path.exists(path):
             raise BuilderError("Trying to build jobs with the same name.")
 
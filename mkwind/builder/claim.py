@@ -0,0 +1,104 @@
+import os
+from typing import Container, List, Tuple
+
+from mkite_core.models import JobInfo
+from mkite_engines import BaseConsumer, LocalConsumer, RedisConsumer
+
+
+def claim_infos(
+    engine: BaseConsumer,
+    queue: str,
+    n: int,
+    info_cls=JobInfo,
+    exclude: Container[str] = (),
+) -> List[Tuple[str, JobInfo]]:
+    """Takes up to `n` jobs from the `queue` of the `engine` in a single
+    batch. Returns a list of (key, info), in the order of the queue.
+    The keys should be acknowledged with `ack_infos` once the jobs
+    are built, or returned with `release_infos` if they failed. Engines
+    that keep the jobs until they are acknowledged (e.g., local) skip the keys in `exclude`, which were already
+    claimed but not yet acknowledged."""
+    if n <= 0:
+        return []
+
+    if isinstance(engine, RedisConsumer):
+        return _claim_redis(engine, queue, n, info_cls)
+
+    if isinstance(engine, LocalConsumer):
+        return _claim_local(engine, queue, n, info_cls, exclude)
+
+    return _claim_generic(engine, queue, n, info_cls, exclude)
+
+
+def ack_infos(engine: BaseConsumer, keys: List[str]):
+    """Deletes the jobs claimed with `claim_infos` from the engine"""
+    if not keys:
+        return
+
+    if isinstance(engine, RedisConsumer):
+        engine.r.delete(*keys)
+        return
+
+    for key in keys:
+        engine.delete(key)
+
+
+def release_infos(engine: BaseConsumer, queue: str, keys: List[str]):
+    """Returns the jobs claimed with `claim_infos` that could not be
+    built to the end of their queue. Other engines keep the jobs until
+    they are acknowledged, so nothing has to be returned."""
+    if not keys:
+        return
+
+    if isinstance(engine, RedisConsumer):
+        engine.r.rpush(engine.format_queue_name(queue), *keys)
+
+
+def _claim_redis(engine: RedisConsumer, queue: str, n: int, info_cls):
+    r = engine.r
+    queue = engine.format_queue_name(queue)
+
+    # takes the first `n` keys atomically, as `lpop` does for one key
+    with r.pipeline(transaction=True) as pipe:
+        pipe.lrange(queue, 0, n - 1)
+        pipe.ltrim(queue, n, -1)
+        keys, _ = pipe.execute()
+
+    keys = [key.decode() for key in keys]
+    if not keys:
+        return []
+
+    with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hget(key, "msg")
+
+        msgs = pipe.execute()
+
+    return [
+        (key, info_cls.decode(msg)) for key, msg in zip(keys, msgs) if msg is not None
+    ]
+
+
+def _claim_local(engine: LocalConsumer, queue: str, n: int, info_cls, exclude):
+    path = engine.get_queue_path(queue)
+    keys = [os.path.join(path, entry) for entry in engine.list_path(path)]
+    keys = [key for key in keys if key not in exclude][:n]
+
+    return [(key, info_cls.from_json(key)) for key in keys]
+
+
+def _claim_generic(engine: BaseConsumer, queue: str, n: int, info_cls, exclude):
+    claimed = []
+    keys = set(exclude)
+    while len(claimed) < n:
+        key, info = engine.get_info(queue, info_cls=info_cls)
+
+        # engines that do not remove jobs when fetching them
+        # return the same job until it is deleted
+        if info is None or key in keys:
+            break
+
+        keys.add(key)
+        claimed.append((key, info))
+
+    return claimed
@@ -2,7 +2,10 @@ import os
 
 from mkite_core.models import Status
 from mkite_engines import EngineRoles, instantiate_from_path
-from mkwind.user import EnvSettings, Logger
+from mkwind.user import EnvSettings, Logger, LoggerLevel
+from mkwind.user.settings import SettingsWatcher
+from mkwind.user.events import DEPARTURES
+from mkwind.user.engines import EnginePool
 from mkwind.templates import Template
 
 from .base import JobBuilder
@@ -14,17 +17,53 @@ class BuilderDaemon:
         builder: JobBuilder,
         settings: EnvSettings,
         logger_stdout: bool = True,
+        watcher: SettingsWatcher = None,
+        logger: Logger = None,
     ):
         self.builder = builder
         self.settings = settings
+        self.watcher = watcher
 
-        log_path = os.path.join(settings.LOG_PATH, "mkwind-build.log")
-        self.logger = Logger.to_file(log_path, stdout=logger_stdout)
+        if logger is None:
+            log_path = os.path.join(settings.LOG_PATH, "mkwind-build.log")
+            logger = Logger.to_file(log_path, stdout=logger_stdout)
+
+        self.logger = logger
         self.log("initializing mkwind BuilderDaemon")
+        self.reconcile()
 
     def log(self, msg: str):
         self.logger.log(msg)
 
+    def reconcile(self):
+        """Brings the journal, if enabled, in sync with the queue folders"""
+        journal = self.builder.journal
+        if journal is None:
+            return
+
+        fixed = journal.reconcile(self.builder.dst)
+        self.log(f"journal reconciled, {fixed} jobs updated")
+
+    def get_watches(self):
+        """Wakes up when jobs leave the READY queue"""
+        return {self.builder.dst.get_queue_path(Status.READY): DEPARTURES}
+
+    def reload_settings(self):
+        """Applies the changes to the settings and to the build config
+        made since the last cycle"""
+        if self.watcher is not None and self.watcher.update(self.logger):
+            self.settings = self.watcher.settings
+            self.builder.apply_settings(self.settings)
+
+        try:
+            changed = self.builder.recipe_settings.reload()
+        except Exception as e:
+            self.logger.log(f"could not reload the build config: {e}", level=LoggerLevel.ERROR)
+            return
+
+        if changed:
+            self.log(f"build config reloaded, changed sections: {', '.join(changed)}")
+
     def build(self):
         self.log("building new jobs")
         num_ready = self.builder.get_ready()
@@ -33,6 +72,7 @@ class BuilderDaemon:
         if num_to_build > 0:
             built = self.builder.build_all(max_build=num_to_build)
             self.log(f"built {len(built)} new jobs")
+            self.log(f"build timings: {self.builder.timings.summary()}")
             return built
 
         self.log("skipping building jobs")
@@ -41,6 +81,7 @@ class BuilderDaemon:
     def run(self):
         self.logger.hbar()
         self.log("entering management loop")
+        self.reload_settings()
         self.build()
 
     @classmethod
@@ -50,9 +91,15 @@ class BuilderDaemon:
         logger_stdout: bool = True,
         explicit_config: bool = True,
         delete_on_build: bool = False,
+        build_workers: int = 1,
+        watcher: SettingsWatcher = None,
+        logger: Logger = None,
+        engines: EnginePool = None,
     ):
-        src = instantiate_from_path(settings.ENGINE_EXTERNAL, role=EngineRoles.consumer)
-        dst = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
+        instantiate = instantiate_from_path if engines is None else engines.get
+
+        src = instantiate(settings.ENGINE_EXTERNAL, role=EngineRoles.consumer)
+        dst = instantiate(settings.ENGINE_LOCAL, role=EngineRoles.producer)
         dst.add_queue(Status.READY)
 
         template = Template.from_name(settings.SCHEDULER)
@@ -64,5 +111,12 @@ class BuilderDaemon:
             template=template,
             explicit_config=explicit_config,
             delete_on_build=delete_on_build,
+            build_workers=build_workers,
+        )
+        return cls(
+            builder,
+            settings,
+            logger_stdout=logger_stdout,
+            watcher=watcher,
+            logger=logger,
         )
-        return cls(builder, settings, logger_stdout=logger_stdout)
@@ -0,0 +1,31 @@
+from typing import Dict
+
+
+def allocate(n: int, weights: Dict[str, float], limits: Dict[str, int] = None) -> Dict[str, int]:
+    """Splits `n` slots among the keys of `weights` by smooth weighted
+    round-robin. Keys never receive more slots than their `limits`
+    (if given) and keys with non-positive weights receive none.
+    Returns the number of slots allocated to each key, in the order
+    of `weights`."""
+    limits = limits or {}
+    allocation = {key: 0 for key in weights}
+    current = {key: 0.0 for key in weights}
+
+    for _ in range(n):
+        candidates = [
+            key
+            for key, weight in weights.items()
+            if weight > 0 and (limits.get(key) is None or allocation[key] < limits[key])
+        ]
+        if not candidates:
+            break
+
+        total = sum(weights[key] for key in candidates)
+        for key in candidates:
+            current[key] += weights[key]
+
+        chosen = max(candidates, key=lambda k: current[k])
+        current[chosen] -= total
+        allocation[chosen] += 1
+
+    return allocation
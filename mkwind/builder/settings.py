@@ -1,10 +1,12 @@
 import os
+import re
 import json
-from typing import List, Dict, Optional
+from fnmatch import fnmatch
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
 from collections.abc import Mapping
 from mkite_core.external import load_config
-from pydantic import Field, DirectoryPath, FilePath
+from pydantic import BaseModel, ConfigDict, Field, DirectoryPath, FilePath, field_validator
 from pydantic_settings import BaseSettings
 
 from mkite_core.models import JobInfo
@@ -22,7 +24,15 @@ def dict_update(d, u):
     return d
 
 
-class JobSettings(BaseSettings):
+class JobSettings(BaseModel):
+    """Resources and commands used to render the job script. This is a
+    plain data model: values come only from the config files or the
+    arguments. Use `JobEnvSettings` to also read them from environment
+    variables (e.g., `NODES`). Instances are immutable, such that the
+    cached settings of a recipe can be shared by all of its jobs."""
+
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     name: Optional[str] = Field(
         None,
         description="Name of the job to be executed",
@@ -129,6 +139,104 @@ class JobSettings(BaseSettings):
         return "runstats.json"
 
 
+class JobEnvSettings(JobSettings, BaseSettings):
+    """Same as `JobSettings`, but the fields that are not given are
+    read from environment variables with the (case-insensitive) field
+    names. Reading the environment makes each instantiation much slower."""
+
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size: Union[int, str]) -> int:
+    """Converts sizes such as `500M` or `2GB` into bytes"""
+    if isinstance(size, int):
+        return size
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*", str(size).upper())
+    if match is None:
+        raise ValueError(f"Invalid size {size}")
+
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+class ArchiveRules(BaseModel):
+    """Selects the files of a job folder that are archived. Patterns
+    without a `/` are matched against the name of each file, and the
+    others against its path relative to the job folder."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    include: Optional[List[str]] = Field(
+        None,
+        description="If given, only files matching one of these patterns are archived",
+    )
+    exclude: List[str] = Field(
+        [],
+        description="Files matching one of these patterns are not archived",
+    )
+    max_size: Optional[int] = Field(
+        None,
+        description="Files larger than this size in bytes (or e.g. 500M) are not archived",
+    )
+
+    @field_validator("max_size", mode="before")
+    @classmethod
+    def parse_max_size(cls, size):
+        return None if size is None else parse_size(size)
+
+    def is_empty(self) -> bool:
+        return self.include is None and not self.exclude and self.max_size is None
+
+    @staticmethod
+    def matches(path: str, patterns: List[str]) -> bool:
+        name = os.path.basename(path)
+        return any(
+            fnmatch(path if "/" in pattern else name, pattern) for pattern in patterns
+        )
+
+    def get_reason(self, path: str, size: int) -> Optional[str]:
+        """Returns why the file at the relative `path` is not archived,
+        or None if it is kept"""
+        if self.include is not None and not self.matches(path, self.include):
+            return "include"
+
+        if self.matches(path, self.exclude):
+            return "exclude"
+
+        if self.max_size is not None and size > self.max_size:
+            return "max_size"
+
+        return None
+
+    def select(self, folder: os.PathLike) -> Tuple[List[str], List[dict]]:
+        """Returns the paths relative to `folder` that are archived,
+        including all directories, and the files that are dropped."""
+        kept, dropped = [], []
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            rel_root = os.path.relpath(root, folder)
+            prefix = "" if rel_root == "." else rel_root.replace(os.sep, "/") + "/"
+
+            kept += [prefix + d for d in dirs]
+            for name in sorted(files):
+                path = prefix + name
+                size = os.lstat(os.path.join(root, name)).st_size
+                reason = self.get_reason(path, size)
+
+                if reason is None:
+                    kept.append(path)
+                else:
+                    dropped.append({"path": path, "size": size, "reason": reason})
+
+        return kept, dropped
+
+
+SHARE_KEYS = ("weight", "max_ready")
+ARCHIVE_KEY = "archive"
+
+
 class AllJobSettings:
     """Aggregates the settings for building recipes based on the system.
     The settings should have the following format (example with YAML):
@@ -156,27 +264,111 @@ class AllJobSettings:
 
     The settings loaded by this function will return
     the settings loaded by `default`, `package`, then
-    `recipe`.
+    `recipe`. If `env_overrides` is True, fields that are
+    not defined in any of them are read from environment
+    variables.
+
+    Two optional keys control how the builder shares the
+    READY queue between recipes, and can also be given
+    in any of the layers above:
+
+    ```
+    vasp:
+        weight: 3
+        max_ready: 50
+    ```
+    `weight` (default 1) is the relative share of new
+    slots given to the recipe, and `max_ready` (default
+    unlimited) the maximum number of its jobs in READY.
+    These keys are not part of the job settings.
+
+    The optional key `archive` selects the files of the
+    finished jobs that are archived (see `ArchiveRules`):
+
+    ```
+    vasp:
+        archive:
+            exclude: ["WAVECAR", "CHGCAR"]
+            max_size: 500M
+    ```
+
+    The resolved settings are cached per recipe, such that
+    lookups do not touch the filesystem. When loaded with
+    `from_file`, `reload` reads the config again (and clears
+    the cache) if the file was modified. Daemons call it once
+    per cycle.
     """
 
-    def __init__(self, settings: Dict[str, dict]):
+    def __init__(
+        self,
+        settings: Dict[str, dict],
+        config_path: os.PathLike = None,
+        env_overrides: bool = False,
+    ):
         self.settings = settings
+        self.config_path = config_path
+        self.settings_cls = JobEnvSettings if env_overrides else JobSettings
+        self._stat = self.get_stat()
+        self._cache: Dict[str, JobSettings] = {}
 
     def __getitem__(self, key: str):
         return self.settings[key]
 
     @classmethod
-    def from_file(cls, config_path: os.PathLike) -> "AllJobSettings":
+    def from_file(
+        cls, config_path: os.PathLike, env_overrides: bool = False
+    ) -> "AllJobSettings":
         config = load_config(config_path)
-        return cls(config)
+        return cls(config, config_path=config_path, env_overrides=env_overrides)
+
+    def get_stat(self):
+        if self.config_path is None:
+            return None
+
+        stat = os.stat(self.config_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> List[str]:
+        """Reloads the config file if it changed since it was last read.
+        Returns the sections (e.g., `default`, `vasp`) that changed. If
+        the new file cannot be loaded, raises an error once and keeps
+        the previous settings until the file changes again."""
+        stat = self.get_stat()
+        if stat == self._stat:
+            return []
+
+        self._stat = stat
+        old = self.settings
+        self.settings = load_config(self.config_path)
+        self._cache = {}
+
+        return [
+            key
+            for key in {**old, **self.settings}
+            if old.get(key) != self.settings.get(key)
+        ]
 
     def get_recipe_settings(self, info: JobInfo) -> JobSettings:
+        recipe = info.recipe["name"]
+        if recipe not in self._cache:
+            self._cache[recipe] = self.resolve_recipe_settings(recipe)
+
+        # the settings are frozen, so the cached instance is shared
+        return self._cache[recipe]
+
+    def resolve_recipe_settings(self, recipe: str) -> JobSettings:
+        data = self.resolve_recipe_data(recipe)
+        for key in (*SHARE_KEYS, ARCHIVE_KEY):
+            data.pop(key, None)
+
+        return self.settings_cls(**data)
+
+    def resolve_recipe_data(self, recipe: str) -> dict:
         data = {}
 
         if "default" in self.settings:
             data = dict_update(data, self["default"])
-        
-        recipe = info.recipe["name"]
+
         package = recipe.split(".")[0]
 
         if package in self.settings:
@@ -185,12 +377,28 @@ class AllJobSettings:
         if recipe in self.settings:
             data = dict_update(data, self[recipe])
 
-        return JobSettings(**data)
+        return data
+
+    def get_share(self, recipe: str) -> Tuple[float, Optional[int]]:
+        """Returns the weight and the maximum number of READY jobs
+        of the recipe"""
+        data = self.resolve_recipe_data(recipe)
+
+        return data.get("weight", 1), data.get("max_ready")
+
+    def get_archive_rules(self, recipe: str) -> Optional[ArchiveRules]:
+        """Returns the rules to archive the jobs of the recipe, or
+        None if all files are archived"""
+        data = self.resolve_recipe_data(recipe).get(ARCHIVE_KEY)
+        if not data:
+            return None
+
+        rules = ArchiveRules(**data)
+        return None if rules.is_empty() else rules
 
     def config_has_recipe(self, recipe: str) -> bool:
         """checks if the settings for building recipes is available on the config_path.
         """
-
         package = recipe.split(".")[0]
 
         recipe_available = (package in self.settings or recipe in self.settings)
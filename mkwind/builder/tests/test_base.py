@@ -1,14 +1,19 @@
 import os
+import time
+import yaml
+from collections import Counter
 from pkg_resources import resource_filename
 
 import unittest as ut
 from freezegun import freeze_time
+from mkite_core.external import load_config
 
 from mkite_core.models import JobInfo, Status
 from mkwind.templates import Template
 from mkwind.user import EnvSettings
 from mkite_engines import LocalConsumer, EngineRoles, instantiate_from_path
 from mkwind.builder import JobBuilder, JobSettings
+from mkwind.builder.base import BuilderError
 from mkite_core.tests.tempdirs import run_in_tempdir
 
 
@@ -17,6 +22,31 @@ BUILD_CONFIG = resource_filename("mkwind.tests.files.clusters", "cluster1.yaml")
 SETTINGS = resource_filename("mkwind.tests.files", "settings.yaml")
 
 
+class FakeConsumer:
+    """Remote engine that removes the jobs when fetching them"""
+
+    def __init__(self, queues: dict):
+        self.queues = queues
+        self.deleted = []
+
+    def list_queue_names(self):
+        return list(self.queues.keys())
+
+    def get_info(self, queue: str, info_cls=JobInfo):
+        time.sleep(0.01)
+        if not self.queues[queue]:
+            return None, None
+
+        uuid = self.queues[queue].pop(0)
+        info = JobInfo.from_json(INFO_PATH)
+        info.recipe["name"] = queue
+        info.job["uuid"] = uuid
+        return uuid, info
+
+    def delete(self, key: str):
+        self.deleted.append(key)
+
+
 class TestBuilder(ut.TestCase):
     def setUp(self):
         self.info = JobInfo.from_json(INFO_PATH)
@@ -26,7 +56,12 @@ class TestBuilder(ut.TestCase):
         self.template = Template.from_name("slurm.sh")
         self.settings = EnvSettings.from_file(SETTINGS)
 
-    def get_builder(self, explicit_config: bool = False, delete_on_build: bool = True):
+    def get_builder(
+        self,
+        explicit_config: bool = False,
+        delete_on_build: bool = True,
+        build_workers: int = 1,
+    ):
         src = instantiate_from_path(
             self.settings.ENGINE_EXTERNAL,
             role=EngineRoles.consumer,
@@ -44,6 +79,7 @@ class TestBuilder(ut.TestCase):
             template=self.template,
             explicit_config=explicit_config,
             delete_on_build=delete_on_build,
+            build_workers=build_workers,
         )
         return builder
 
@@ -117,6 +153,54 @@ class TestBuilder(ut.TestCase):
         }
         self.assertEqual(files, expected_files)
 
+    @run_in_tempdir
+    def test_build_staged(self):
+        self.settings.BUILD_STAGING = True
+        builder = self.get_builder()
+        staging = os.path.join(builder.dst.root_path, ".staging")
+        self.assertTrue(os.path.isdir(staging))
+
+        # leftover of an interrupted build, with an older timestamp
+        os.makedirs(os.path.join(staging, f"{self.info.folder_prefix}_1658793600"))
+        os.makedirs(os.path.join(staging, "other_recipe_1658793600"))
+
+        with freeze_time("2022-07-26 12:00:00"):
+            name = self.info.folder_name
+            path = builder.build_job(self.info)
+
+            expected = builder.dst.item_path(Status.READY.value, name)
+            self.assertEqual(path, expected)
+            self.assertEqual(os.listdir(staging), ["other_recipe_1658793600"])
+            self.assertEqual(builder.dst.list_queue(Status.READY.value), [name])
+
+            files = set(os.listdir(path))
+            expected_files = {
+                Template.FILENAME,
+                JobInfo.file_name(),
+                JobSettings.file_name(),
+            }
+            self.assertEqual(files, expected_files)
+
+            with self.assertRaises(BuilderError):
+                builder.build_job(self.info)
+
+        self.assertEqual(os.listdir(staging), ["other_recipe_1658793600"])
+
+    @run_in_tempdir
+    def test_build_journal(self):
+        self.settings.JOURNAL = True
+        self.settings.JOURNAL_PATH = "journal.db"
+        builder = self.get_builder()
+        self.assertEqual(builder.get_ready(), 0)
+
+        path = builder.build_job(self.info)
+        entry = builder.journal.get(os.path.basename(path))
+
+        self.assertEqual(entry["status"], Status.READY.value)
+        self.assertEqual(entry["recipe"], "vasp.pbe.relax")
+        self.assertEqual(builder.get_ready(), 1)
+        self.assertEqual(builder.get_ready_by_recipe(), {"vasp.pbe.relax": 1})
+
     @run_in_tempdir
     def test_build_explicit_passing(self):
         builder = self.get_builder(explicit_config=True)
@@ -193,6 +277,75 @@ class TestBuilder(ut.TestCase):
         remaining = os.listdir(f"building/{recipe_queue}")
         self.assertEqual(len(remaining), 1)
 
+    @run_in_tempdir
+    def test_build_all_workers(self):
+        builder = self.get_builder(explicit_config=True, build_workers=4)
+        recipe = self.info.recipe["name"]
+        builder.src.add_queue(recipe)
+        recipe_queue = builder.src.format_queue_name(recipe)
+
+        for i in range(3):
+            self.info.job["uuid"] = f"{i}-test-uuid"
+            self.info.to_json(f"building/{recipe_queue}/jobinfo_{i}.json")
+
+        built = builder.build_all(max_build=5)
+        self.assertEqual(len(built), 3)
+        self.assertEqual(os.listdir(f"building/{recipe_queue}"), [])
+        self.assertEqual(
+            set(builder.timings.totals.keys()), {"total", "fetch", "build", "ack"}
+        )
+        self.assertEqual(builder.timings.counts["build"], 3)
+
+    @run_in_tempdir
+    def test_build_all_pipelined(self):
+        builder = self.get_builder(build_workers=4)
+        builder.src = FakeConsumer(
+            {
+                "vasp.pbe.relax": [f"relax-{i}" for i in range(4)],
+                "vasp.pbe.static": [f"static-{i}" for i in range(4)],
+            }
+        )
+
+        built = builder.build_all(max_build=6)
+        uuids = [os.path.basename(folder).split("_")[1] for folder in built]
+        expected = [f"relax-{i}" for i in range(3)] + [f"static-{i}" for i in range(3)]
+        self.assertEqual(uuids, [uuid[:8] for uuid in expected])
+        self.assertEqual(builder.src.deleted, expected)
+        self.assertEqual(len(builder.src.queues["vasp.pbe.relax"]), 1)
+        self.assertEqual(len(builder.src.queues["vasp.pbe.static"]), 1)
+
+    @run_in_tempdir
+    def test_build_all_fairshare(self):
+        config = dict(load_config(BUILD_CONFIG))
+        config["vasp.pbe.relax"] = {"weight": 3}
+        config["vasp.pbe.static"] = {"max_ready": 2}
+        with open("config.yaml", "w") as f:
+            yaml.safe_dump(config, f)
+
+        self.settings.BUILD_CONFIG = "config.yaml"
+        builder = self.get_builder(build_workers=2)
+        builder.src = FakeConsumer(
+            {
+                "vasp.pbe.relax": [f"relax-{i}" for i in range(4)],
+                "vasp.pbe.static": [f"static-{i}" for i in range(4)],
+                "vasp.pbe.band": [f"band-{i}" for i in range(4)],
+            }
+        )
+
+        # 3:1:1 split of the first 5 slots
+        built = builder.build_all(max_build=5)
+        recipes = Counter(os.path.basename(f).rsplit("_", 2)[0] for f in built)
+        self.assertEqual(
+            recipes, {"vasp.pbe.relax": 3, "vasp.pbe.static": 1, "vasp.pbe.band": 1}
+        )
+
+        # static is limited by max_ready, and relax runs out of jobs
+        built = builder.build_all(max_build=10)
+        recipes = Counter(os.path.basename(f).rsplit("_", 2)[0] for f in built)
+        self.assertEqual(
+            recipes, {"vasp.pbe.relax": 1, "vasp.pbe.static": 1, "vasp.pbe.band": 3}
+        )
+
     @run_in_tempdir
     def test_build_one_with_recipe(self):
         builder = self.get_builder(explicit_config=True)
@@ -0,0 +1,108 @@
+import os
+import unittest as ut
+from pkg_resources import resource_filename
+
+from mkite_core.models import JobInfo
+from mkite_engines import LocalConsumer, RedisConsumer, RedisProducer
+from mkwind.builder.claim import claim_infos, ack_infos, release_infos
+from mkite_core.tests.tempdirs import run_in_tempdir
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+INFO_PATH = resource_filename("mkwind.tests.files", "jobinfo.json")
+QUEUE = "vasp.pbe.relax"
+
+
+def get_info(i: int) -> JobInfo:
+    info = JobInfo.from_json(INFO_PATH)
+    info.job["uuid"] = f"{i}-test-uuid"
+    return info
+
+
+class TestClaimLocal(ut.TestCase):
+    def get_engine(self):
+        engine = LocalConsumer(root_path=".")
+        engine.add_queue(QUEUE)
+        path = engine.get_queue_path(QUEUE)
+
+        for i in range(3):
+            get_info(i).to_json(os.path.join(path, f"jobinfo_{i}.json"))
+
+        return engine
+
+    @run_in_tempdir
+    def test_claim(self):
+        engine = self.get_engine()
+        claimed = claim_infos(engine, QUEUE, 2)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(len({key for key, info in claimed}), 2)
+
+        claimed = claim_infos(engine, QUEUE, 5)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(claim_infos(engine, QUEUE, 0), [])
+
+    @run_in_tempdir
+    def test_ack(self):
+        engine = self.get_engine()
+        claimed = claim_infos(engine, QUEUE, 2)
+        ack_infos(engine, [key for key, info in claimed])
+
+        self.assertEqual(len(engine.list_queue(QUEUE)), 1)
+
+
+@ut.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestClaimRedis(ut.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.consumer = RedisConsumer(host="localhost", port=6379)
+        self.consumer._r = fakeredis.FakeStrictRedis(server=server)
+        self.producer = RedisProducer(host="localhost", port=6379)
+        self.producer._r = fakeredis.FakeStrictRedis(server=server)
+
+        for i in range(3):
+            self.producer.push_info(QUEUE, get_info(i))
+
+    def test_claim(self):
+        # `push_info` pushes to the left, so the last job is claimed first
+        expected = [str(get_info(i).uuid) for i in (2, 1)]
+
+        claimed = claim_infos(self.consumer, QUEUE, 2)
+        self.assertEqual([key for key, info in claimed], expected)
+        self.assertEqual([str(info.uuid) for key, info in claimed], expected)
+        self.assertEqual(len(self.consumer.list_queue(QUEUE)), 1)
+
+        claimed = claim_infos(self.consumer, QUEUE, 2)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claim_infos(self.consumer, QUEUE, 2), [])
+
+    def test_ack(self):
+        claimed = claim_infos(self.consumer, QUEUE, 3)
+        keys = [key for key, info in claimed]
+        ack_infos(self.consumer, keys)
+
+        r = self.consumer._r
+        self.assertEqual(sum(r.exists(key) for key in keys), 0)
+
+    def test_release(self):
+        claimed = claim_infos(self.consumer, QUEUE, 2)
+        keys = [key for key, info in claimed]
+        release_infos(self.consumer, QUEUE, keys)
+
+        self.assertEqual(len(self.consumer.list_queue(QUEUE)), 3)
+        reclaimed = claim_infos(self.consumer, QUEUE, 3)
+        self.assertEqual(len(reclaimed), 3)
+        # released jobs go to the end of the queue
+        self.assertEqual([key for key, info in reclaimed[1:]], keys)
+
+
+class TestClaimGeneric(ut.TestCase):
+    def test_repeated(self):
+        class PeekConsumer:
+            def get_info(self, queue, info_cls=JobInfo):
+                return "key", get_info(0)
+
+        claimed = claim_infos(PeekConsumer(), QUEUE, 3)
+        self.assertEqual(len(claimed), 1)
@@ -1,6 +1,6 @@
 import os
 import unittest as ut
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from distutils.dir_util import copy_tree
 from pkg_resources import resource_filename
 
@@ -51,3 +51,21 @@ class TestDaemon(ut.TestCase):
 
         files = set(os.listdir(built))
         self.assertEqual(files, {"jobinfo.json", "job.sh", "runstats.json"})
+
+    @run_in_tempdir
+    def test_reload_settings(self):
+        settings = self.get_settings()
+        self.copy_example_jobs(settings)
+        daemon = self.get_daemon(settings)
+        recipe_settings = daemon.builder.recipe_settings
+
+        new = settings.model_copy(update={"MAX_READY": 0, "BUILD_STAGING": True})
+        daemon.watcher = MagicMock()
+        daemon.watcher.settings = new
+        daemon.watcher.update.return_value = True
+        daemon.reload_settings()
+
+        self.assertIs(daemon.settings, new)
+        self.assertTrue(daemon.builder.staging)
+        self.assertIs(daemon.builder.recipe_settings, recipe_settings)
+        self.assertEqual(daemon.build(), [])
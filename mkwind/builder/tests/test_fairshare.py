@@ -0,0 +1,27 @@
+import unittest as ut
+
+from mkwind.builder.fairshare import allocate
+
+
+class TestAllocate(ut.TestCase):
+    def test_equal(self):
+        allocation = allocate(6, {"a": 1, "b": 1, "c": 1})
+        self.assertEqual(allocation, {"a": 2, "b": 2, "c": 2})
+
+    def test_weighted(self):
+        allocation = allocate(8, {"a": 3, "b": 1})
+        self.assertEqual(allocation, {"a": 6, "b": 2})
+
+        allocation = allocate(1, {"a": 1, "b": 3})
+        self.assertEqual(allocation, {"a": 0, "b": 1})
+
+    def test_limits(self):
+        allocation = allocate(6, {"a": 3, "b": 1}, limits={"a": 1, "b": None})
+        self.assertEqual(allocation, {"a": 1, "b": 5})
+
+        allocation = allocate(6, {"a": 1, "b": 1}, limits={"a": 1, "b": 2})
+        self.assertEqual(allocation, {"a": 1, "b": 2})
+
+    def test_zero_weight(self):
+        allocation = allocate(4, {"a": 0, "b": 1})
+        self.assertEqual(allocation, {"a": 0, "b": 4})
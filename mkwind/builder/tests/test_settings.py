@@ -1,12 +1,20 @@
 import os
+import yaml
 import unittest as ut
 from unittest.mock import patch
+from pydantic import ValidationError
 from mkite_core.external import load_config
 from pkg_resources import resource_filename
 
 from mkite_core.models import JobInfo
 from mkwind.user import EnvSettings
-from mkwind.builder.settings import JobSettings, AllJobSettings
+from mkwind.builder.settings import (
+    JobSettings,
+    JobEnvSettings,
+    AllJobSettings,
+    ArchiveRules,
+    parse_size,
+)
 
 from mkite_core.tests.tempdirs import run_in_tempdir
 
@@ -44,6 +52,24 @@ class TestJobSettings(ut.TestCase):
         }
         self.assertEqual(choices, expected)
 
+    @patch.dict(os.environ, {"NODES": "4", "WALLTIME": "10:00"})
+    def test_ignores_env(self):
+        js = JobSettings.from_yaml(JOB_SETTINGS_PATH)
+        expected = JobSettings(**load_config(JOB_SETTINGS_PATH))
+        self.assertEqual(js, expected)
+        self.assertEqual(JobSettings().nodes, 1)
+        self.assertEqual(JobSettings().walltime, "30:00")
+
+    @patch.dict(os.environ, {"NODES": "4", "WALLTIME": "10:00"})
+    def test_env_overrides(self):
+        js = JobEnvSettings()
+        self.assertEqual(js.nodes, 4)
+        self.assertEqual(js.walltime, "10:00")
+
+    def test_extra_fields(self):
+        with self.assertRaises(ValueError):
+            JobSettings(nonexisting_field=1)
+
 
 class TestAllJobSettings(ut.TestCase):
     @patch.dict(os.environ, ENVIRONMENT)
@@ -75,3 +101,106 @@ class TestAllJobSettings(ut.TestCase):
 
         has_recipe = self.recipe_settings.config_has_recipe("nonexisting")
         self.assertFalse(has_recipe)
+
+    def test_cache(self):
+        self.info.recipe["name"] = "vasp.pbe.relax"
+        settings = self.recipe_settings.get_recipe_settings(self.info)
+        cached = self.recipe_settings.get_recipe_settings(self.info)
+
+        self.assertIs(settings, cached)
+        self.assertIn("vasp.pbe.relax", self.recipe_settings._cache)
+
+        # the cached settings cannot be changed by the jobs sharing them
+        with self.assertRaises(ValidationError):
+            settings.account = "changed"
+
+        self.assertEqual(cached.account, "vasp_default")
+
+        # cached lookups do not touch the filesystem
+        with patch("os.stat") as stat:
+            self.recipe_settings.get_recipe_settings(self.info)
+            self.recipe_settings.get_share("vasp.pbe.relax")
+
+        stat.assert_not_called()
+
+    @run_in_tempdir
+    def test_reload(self):
+        config = load_config(EXAMPLE_SETTINGS_PATH)
+        with open("config.yaml", "w") as f:
+            yaml.safe_dump(dict(config), f)
+
+        recipe_settings = AllJobSettings.from_file("config.yaml")
+        self.info.recipe["name"] = "vasp.pbe.relax"
+        settings = recipe_settings.get_recipe_settings(self.info)
+        self.assertEqual(settings.account, "vasp_default")
+        self.assertFalse(recipe_settings.reload())
+
+        config["vasp"]["account"] = "new_account"
+        with open("config.yaml", "w") as f:
+            yaml.safe_dump(dict(config), f)
+
+        self.assertEqual(recipe_settings.reload(), ["vasp"])
+        settings = recipe_settings.get_recipe_settings(self.info)
+        self.assertEqual(settings.account, "new_account")
+
+        # broken files keep the previous settings
+        with open("config.yaml", "a") as f:
+            f.write("vasp: [")
+
+        with self.assertRaises(Exception):
+            recipe_settings.reload()
+
+        settings = recipe_settings.get_recipe_settings(self.info)
+        self.assertEqual(settings.account, "new_account")
+
+    def test_share(self):
+        settings = AllJobSettings(
+            {"default": {"nodes": 2, "max_ready": 10}, "vasp": {"weight": 3}}
+        )
+        self.assertEqual(settings.get_share("vasp.pbe.relax"), (3, 10))
+        self.assertEqual(settings.get_share("qe.relax"), (1, 10))
+
+        self.info.recipe["name"] = "vasp.pbe.relax"
+        job_settings = settings.get_recipe_settings(self.info)
+        self.assertEqual(job_settings.nodes, 2)
+
+    def test_archive_rules(self):
+        settings = AllJobSettings(
+            {
+                "default": {"nodes": 2, "archive": {"max_size": "1M"}},
+                "vasp": {"archive": {"exclude": ["WAVECAR", "CHG*"]}},
+            }
+        )
+        rules = settings.get_archive_rules("vasp.pbe.relax")
+        self.assertEqual(rules.max_size, 1024**2)
+        self.assertEqual(rules.exclude, ["WAVECAR", "CHG*"])
+        self.assertIsNone(AllJobSettings({"vasp": {}}).get_archive_rules("vasp"))
+
+        self.info.recipe["name"] = "vasp.pbe.relax"
+        job_settings = settings.get_recipe_settings(self.info)
+        self.assertEqual(job_settings.nodes, 2)
+
+    def test_archive_rules_reason(self):
+        rules = ArchiveRules(include=["*CAR", "data/*"], exclude=["WAVECAR"], max_size=10)
+        self.assertIsNone(rules.get_reason("OUTCAR", 5))
+        self.assertIsNone(rules.get_reason("data/out.txt", 5))
+        self.assertEqual(rules.get_reason("run.log", 5), "include")
+        self.assertEqual(rules.get_reason("WAVECAR", 5), "exclude")
+        self.assertEqual(rules.get_reason("CHGCAR", 50), "max_size")
+
+        self.assertEqual(parse_size("2GB"), 2 * 1024**3)
+        self.assertEqual(parse_size("1.5k"), 1536)
+        with self.assertRaises(ValueError):
+            ArchiveRules(max_size="large")
+
+    @patch.dict(os.environ, {"NODES": "4", "GPUS_PER_NODE": "4"})
+    def test_env_overrides(self):
+        settings = self.recipe_settings.get_recipe_settings(self.info)
+        self.assertIsNone(settings.gpus_per_node)
+
+        recipe_settings = AllJobSettings.from_file(
+            EXAMPLE_SETTINGS_PATH, env_overrides=True
+        )
+        settings = recipe_settings.get_recipe_settings(self.info)
+        self.assertEqual(settings.gpus_per_node, 4)
+        self.assertEqual(settings.nodes, 1)
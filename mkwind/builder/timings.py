@@ -0,0 +1,34 @@
+import time
+import threading
+from typing import Dict
+from contextlib import contextmanager
+
+
+class StageTimings:
+    """Accumulates the time spent in each stage of a cycle. Stages
+    running in parallel threads add up, so their total may exceed
+    the wall time of the cycle."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, elapsed: float):
+        with self._lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + elapsed
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{stage}: {total:.2f} s ({self.counts[stage]}x)"
+            for stage, total in self.totals.items()
+        )
@@ -0,0 +1,76 @@
+import os
+import click
+
+from mkite_engines import EngineRoles, instantiate_from_path
+from mkwind.user.settings import get_settings
+from mkwind.postprocess.store import BlobStore, StoreError, STORE_DIR
+
+
+def get_blob_store(settings: str) -> BlobStore:
+    _settings = get_settings(settings)
+    arch = instantiate_from_path(_settings.ENGINE_ARCHIVE, role=EngineRoles.producer)
+    return BlobStore(os.path.join(arch.root_path, STORE_DIR))
+
+
+@click.group("archive")
+def archive():
+    """Manages the deduplicating archive store (ARCHIVE_STORE)"""
+
+
+@archive.command("restore")
+@click.argument("jobids", nargs=-1, required=True)
+@click.option(
+    "-s",
+    "--settings",
+    type=str,
+    default=None,
+    help="path to the settings.yaml file configuring mkwind",
+)
+@click.option(
+    "-d",
+    "--dst",
+    type=str,
+    default=".",
+    help="path to the folder where the job folders are restored",
+)
+def restore(jobids, settings, dst):
+    """Reassembles the folders of the JOBIDS from their manifests"""
+    store = get_blob_store(settings)
+    for jobid in jobids:
+        try:
+            folder = store.restore(jobid, dst)
+        except StoreError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(f"restored {jobid} into {folder}")
+
+
+@archive.command("gc")
+@click.option(
+    "-s",
+    "--settings",
+    type=str,
+    default=None,
+    help="path to the settings.yaml file configuring mkwind",
+)
+@click.option(
+    "-g",
+    "--grace",
+    type=float,
+    default=3600,
+    help="blobs modified in the last `grace` seconds are kept",
+)
+@click.option(
+    "-n",
+    "--dry_run",
+    is_flag=True,
+    default=False,
+    help="If set, only reports the blobs that would be removed",
+)
+def gc(settings, grace, dry_run):
+    """Removes the blobs that are not referenced by any job"""
+    store = get_blob_store(settings)
+    n_removed, size = store.gc(grace=grace, dry_run=dry_run)
+
+    action = "would remove" if dry_run else "removed"
+    click.echo(f"{action} {n_removed} files ({size / 1e6:.1f} MB)")
@@ -1,9 +1,9 @@
-import sys
-import time
 import click
 
 from mkwind.builder import BuilderDaemon
-from mkwind.user.settings import get_settings
+from mkwind.user.settings import get_settings, get_watcher
+
+from .loop import run_daemon
 
 
 @click.command("build")
@@ -30,19 +30,28 @@ from mkwind.user.settings import get_settings
         the config file. An explicit config helps separating which \
         recipes will be built in different machines.",
 )
-def build(settings, sleep, implicit=True):
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=4,
+    help="number of threads used to build jobs while new ones are fetched",
+)
+@click.option(
+    "-e",
+    "--events",
+    is_flag=True,
+    default=False,
+    help="If set, runs as soon as the local queues change (Linux only), \
+        sleeping up to `--sleep` seconds when idle",
+)
+def build(settings, sleep, implicit=True, workers=4, events=False):
+    env = get_settings(settings)
     daemon = BuilderDaemon.from_settings(
-        settings=get_settings(settings),
+        settings=env,
         explicit_config=(not implicit),
+        build_workers=workers,
+        watcher=get_watcher(settings, env),
     )
 
-    if sleep <= 0:
-        daemon.log("running only once, as sleep <= 0")
-        daemon.run()
-        daemon.log("exiting")
-        sys.exit()
-
-    while True:
-        daemon.run()
-        daemon.log(f"sleeping for {sleep} seconds")
-        time.sleep(sleep)
+    run_daemon(daemon, sleep, events=events)
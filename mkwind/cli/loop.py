@@ -0,0 +1,18 @@
+import sys
+
+from mkwind.user.events import EventLoop
+
+
+def run_daemon(daemon, sleep: int, events: bool = False):
+    """Runs the daemon once if `sleep <= 0` or forever otherwise. If
+    `events` is True, the daemon also runs as soon as the folders it
+    watches change."""
+    if sleep <= 0:
+        daemon.log("running only once, as sleep <= 0")
+        daemon.run()
+        daemon.log("exiting")
+        sys.exit()
+
+    watches = daemon.get_watches() if events else None
+    loop = EventLoop(daemon.run, daemon.logger, sleep=sleep, watches=watches)
+    loop.run()
@@ -1,10 +1,10 @@
-import sys
-import time
 import click
 
 from mkwind.user.settings import get_settings
 from mkwind.postprocess import PostprocessDaemon
 
+from .loop import run_daemon
+
 
 @click.command("postprocess")
 @click.option(
@@ -28,19 +28,26 @@ from mkwind.postprocess import PostprocessDaemon
     default=False,
     help="If set, allows restarting jobs on postprocessing",
 )
-def postprocess(settings, sleep, allow_restart=False):
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=1,
+    help="number of processes used to postprocess the jobs",
+)
+@click.option(
+    "-e",
+    "--events",
+    is_flag=True,
+    default=False,
+    help="If set, runs as soon as the local queues change (Linux only), \
+        sleeping up to `--sleep` seconds when idle",
+)
+def postprocess(settings, sleep, allow_restart=False, workers=1, events=False):
     daemon = PostprocessDaemon.from_settings(
         settings=get_settings(settings),
         allow_restart=allow_restart,
+        workers=workers,
     )
 
-    if sleep <= 0:
-        daemon.log("running only once, as sleep <= 0")
-        daemon.run()
-        daemon.log("exiting")
-        sys.exit()
-
-    while True:
-        daemon.run()
-        daemon.log(f"sleeping for {sleep} seconds")
-        time.sleep(sleep)
+    run_daemon(daemon, sleep, events=events)
@@ -1,10 +1,10 @@
 import os
-import sys
-import time
 import click
 
 from mkwind.jobs.daemon import JobDaemon
-from mkwind.user.settings import get_settings
+from mkwind.user.settings import get_settings, get_watcher
+
+from .loop import run_daemon
 
 
 @click.command("run")
@@ -22,16 +22,44 @@ from mkwind.user.settings import get_settings
     default=60,
     help="number of seconds to sleep between runs of the daemon",
 )
-def run(settings, sleep):
-    daemon = JobDaemon.from_settings(get_settings(settings))
-
-    if sleep <= 0:
-        daemon.log("running only once, as sleep <= 0")
-        daemon.run()
-        daemon.log("exiting")
-        sys.exit()
+@click.option(
+    "-a",
+    "--array",
+    is_flag=True,
+    default=False,
+    help="If set, submits READY jobs with identical settings as job arrays",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=4,
+    help="number of threads used to submit jobs concurrently",
+)
+@click.option(
+    "-p",
+    "--pack",
+    type=int,
+    default=1,
+    help="number of READY jobs with identical settings to run \
+        in parallel within a single allocation",
+)
+@click.option(
+    "-e",
+    "--events",
+    is_flag=True,
+    default=False,
+    help="If set, runs as soon as the local queues change (Linux only), \
+        sleeping up to `--sleep` seconds when idle",
+)
+def run(settings, sleep, array=False, workers=4, pack=1, events=False):
+    env = get_settings(settings)
+    daemon = JobDaemon.from_settings(
+        env,
+        watcher=get_watcher(settings, env),
+        array_submission=array,
+        submit_workers=workers,
+        bundle_size=pack,
+    )
 
-    while True:
-        daemon.run()
-        daemon.log(f"sleeping for {sleep} seconds")
-        time.sleep(sleep)
+    run_daemon(daemon, sleep, events=events)
@@ -0,0 +1,122 @@
+import os
+import click
+
+from mkwind.builder import BuilderDaemon
+from mkwind.jobs.daemon import JobDaemon
+from mkwind.postprocess import PostprocessDaemon
+from mkwind.user import Logger
+from mkwind.user.engines import EnginePool
+from mkwind.user.events import Supervisor
+from mkwind.user.settings import get_settings, get_watcher
+
+
+@click.command("serve")
+@click.option(
+    "-s",
+    "--settings",
+    type=str,
+    default=None,
+    help="path to the settings.yaml file configuring mkwind",
+)
+@click.option(
+    "-b",
+    "--build_sleep",
+    type=int,
+    default=60,
+    help="number of seconds to sleep between runs of the builder",
+)
+@click.option(
+    "-r",
+    "--run_sleep",
+    type=int,
+    default=60,
+    help="number of seconds to sleep between runs of the job daemon",
+)
+@click.option(
+    "-p",
+    "--postprocess_sleep",
+    type=int,
+    default=60,
+    help="number of seconds to sleep between runs of the postprocessor",
+)
+@click.option(
+    "-a",
+    "--array",
+    is_flag=True,
+    default=False,
+    help="If set, submits READY jobs with identical settings as job arrays",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=4,
+    help="number of threads used to submit jobs concurrently",
+)
+@click.option(
+    "--pack",
+    type=int,
+    default=1,
+    help="number of READY jobs with identical settings to run \
+        in parallel within a single allocation",
+)
+@click.option(
+    "-e",
+    "--events",
+    is_flag=True,
+    default=False,
+    help="If set, each stage runs as soon as its local queues change \
+        (Linux only), sleeping up to its sleep time when idle",
+)
+def serve(
+    settings,
+    build_sleep,
+    run_sleep,
+    postprocess_sleep,
+    array=False,
+    workers=4,
+    pack=1,
+    events=False,
+):
+    """Builds, runs and postprocesses jobs in a single process"""
+    env = get_settings(settings)
+    logger = Logger.to_file(os.path.join(env.LOG_PATH, "mkwind-serve.log"), stdout=True)
+    engines = EnginePool()
+
+    builder = BuilderDaemon.from_settings(
+        env,
+        watcher=get_watcher(settings, env),
+        logger=logger.with_prefix("build"),
+        engines=engines,
+    )
+    runner = JobDaemon.from_settings(
+        env,
+        watcher=get_watcher(settings, env),
+        logger=logger.with_prefix("run"),
+        array_submission=array,
+        submit_workers=workers,
+        bundle_size=pack,
+        engines=engines,
+    )
+    postproc = PostprocessDaemon.from_settings(
+        env,
+        logger=logger.with_prefix("postprocess"),
+        engines=engines,
+    )
+
+    supervisor = Supervisor(logger)
+    stages = [
+        ("build", builder, build_sleep),
+        ("run", runner, run_sleep),
+        ("postprocess", postproc, postprocess_sleep),
+    ]
+    for name, daemon, sleep in stages:
+        supervisor.add(
+            name,
+            daemon.run,
+            sleep=sleep,
+            watches=daemon.get_watches() if events else None,
+            logger=daemon.logger,
+        )
+
+    supervisor.run()
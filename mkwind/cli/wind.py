@@ -5,6 +5,9 @@ from mkwind.cli.build_one import build_one
 from mkwind.cli.postprocess import postprocess
 from mkwind.cli.runner import run
 from mkwind.cli.cycle import cycle
+from mkwind.cli.worker import worker
+from mkwind.cli.serve import serve
+from mkwind.cli.archive import archive
 
 
 class WindGroup(click.Group):
@@ -21,6 +24,9 @@ wind.add_command(build_one)
 wind.add_command(postprocess)
 wind.add_command(run)
 wind.add_command(cycle)
+wind.add_command(worker)
+wind.add_command(serve)
+wind.add_command(archive)
 
 
 if __name__ == "__main__":
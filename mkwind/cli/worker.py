@@ -0,0 +1,121 @@
+import os
+import time
+
+import click
+from mkite_core.models import Status
+from mkite_engines import EngineRoles, instantiate_from_path
+from mkwind.jobs.worker import PilotWorker, parse_walltime
+from mkwind.schedulers import SCHEDULERS_CLS
+from mkwind.user import Logger
+from mkwind.user.journal import get_journal
+
+from .cycle import _get_managers
+
+
+@click.command("worker")
+@click.option(
+    "-r",
+    "--recipe",
+    type=str,
+    default=None,
+    help="name of the recipe to run. If not provided, runs any of the allowed jobs/recipes",
+)
+@click.option(
+    "-s",
+    "--settings",
+    type=str,
+    default=None,
+    help="path to the settings.yaml file configuring the mkwind builder",
+)
+@click.option(
+    "-d",
+    "--dst",
+    type=str,
+    default=".",
+    help="path to the destination folder where the jobs will be built",
+)
+@click.option(
+    "-n",
+    "--njobs",
+    type=int,
+    default=1,
+    help="maximum number of jobs running at the same time",
+)
+@click.option(
+    "-w",
+    "--walltime",
+    type=str,
+    default=None,
+    help="walltime of the allocation (e.g., 1-12:00:00). If not given, \
+        uses the end time of the Slurm job, if available",
+)
+@click.option(
+    "-m",
+    "--margin",
+    type=int,
+    default=300,
+    help="number of seconds before the end of the walltime to stop claiming jobs",
+)
+@click.option(
+    "-i",
+    "--idle",
+    type=int,
+    default=60,
+    help="number of seconds to wait for new jobs before exiting",
+)
+@click.option(
+    "-l",
+    "--local",
+    is_flag=True,
+    default=False,
+    help="If set, runs the jobs from the local READY queue instead of \
+        building them from the external engine",
+)
+def worker(recipe, settings, dst, njobs, walltime, margin, idle, local=False):
+    settings, builder, pproc = _get_managers(settings, dst)
+
+    consumer, producer, journal = None, None, None
+    if local:
+        builder = None
+        consumer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
+        producer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
+        producer.move = True
+        producer.add_queue(Status.READY)
+        producer.add_queue(Status.DOING)
+        # the daemons of the local engine see the jobs run by the pilot
+        journal = get_journal(settings, producer.root_path)
+        pproc.journal = journal
+
+    log_path = os.path.join(settings.LOG_PATH, "mkwind-worker.log")
+    scheduler_cls = SCHEDULERS_CLS[settings.SCHEDULER]
+    pilot_id = None
+    if scheduler_cls.JOB_ID_VAR is not None:
+        pilot_id = os.environ.get(scheduler_cls.JOB_ID_VAR)
+
+    pilot = PilotWorker(
+        postproc=pproc,
+        builder=builder,
+        consumer=consumer,
+        producer=producer,
+        recipe=recipe,
+        max_jobs=njobs,
+        walltime=_get_walltime(walltime),
+        margin=margin,
+        idle=idle,
+        ntasks_var=scheduler_cls.NTASKS_VAR,
+        pilot_id=pilot_id,
+        logger=Logger.to_file(log_path, stdout=True),
+        journal=journal,
+    )
+    pilot.run()
+
+
+def _get_walltime(walltime):
+    if walltime is not None:
+        return parse_walltime(walltime)
+
+    end_time = os.environ.get("SLURM_JOB_END_TIME")
+    if end_time is not None:
+        return int(end_time) - time.time()
+
+    return None
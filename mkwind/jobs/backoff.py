@@ -0,0 +1,58 @@
+import time
+import threading
+from typing import Dict, Hashable, List
+
+
+class Backoff:
+    """Exponential backoff tracked independently for each key (e.g., a job
+    or a class of errors). Each consecutive failure of a key doubles the
+    time it has to wait before being retried, up to `maximum` seconds."""
+
+    def __init__(self, base: float = 120, maximum: float = 3600):
+        self.base = base
+        self.maximum = maximum
+        self._failures: Dict[Hashable, int] = {}
+        self._until: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._until
+
+    def __len__(self) -> int:
+        return len(self._until)
+
+    def failure(self, key: Hashable) -> float:
+        """Registers a failure of `key` and returns the delay until
+        it can be retried"""
+        with self._lock:
+            n = self._failures.get(key, 0) + 1
+            self._failures[key] = n
+
+            delay = min(self.base * 2 ** (n - 1), self.maximum)
+            self._until[key] = time.monotonic() + delay
+
+        return delay
+
+    def success(self, key: Hashable):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._until.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._failures.clear()
+            self._until.clear()
+
+    def ready(self, key: Hashable) -> bool:
+        """Returns True if `key` is not waiting for a retry"""
+        until = self._until.get(key)
+        return until is None or time.monotonic() >= until
+
+    def blocked(self, key: Hashable) -> bool:
+        """Returns True if `key` is waiting for a retry"""
+        return not self.ready(key)
+
+    def waiting(self) -> List[Hashable]:
+        """Returns the keys that are waiting for a retry"""
+        now = time.monotonic()
+        return [key for key, until in list(self._until.items()) if until > now]
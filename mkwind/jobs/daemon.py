@@ -1,15 +1,33 @@
 import os
+import json
 import time
-from typing import List
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
 
 from mkwind.user import EnvSettings, Logger, LoggerLevel
+from mkwind.user.settings import SettingsWatcher
+from mkwind.user.engines import EnginePool
+from mkwind.user.events import ARRIVALS
+from mkwind.user.journal import get_journal
 from mkwind.schedulers import Scheduler, SchedulerJob, SchedulerError, SCHEDULERS_CLS
-from mkite_core.models import Status
+from mkwind.schedulers.base import JOB_ID_NAME, write_job_id, read_job_id
+from mkite_core.models import JobResults, Status
 from mkite_engines import EngineRoles, instantiate_from_path
+from mkwind.builder.settings import JobSettings
+
+from .groups import GroupRegistry, JobArray, JobBundle, EXIT_STATUS_NAME
+from .backoff import Backoff
+from .throttle import SubmitThrottle
+from .worker import read_pilot_id
 
 
 QUEUES = [Status.READY.value, Status.DOING.value, Status.DONE.value, Status.ERROR.value]
 
+# files left in the job folder once the job finished
+COMPLETION_MARKERS = ["mkwind-complete", JobResults.file_name()]
+
 
 class JobDaemon:
     def __init__(
@@ -18,22 +36,56 @@ class JobDaemon:
         settings: EnvSettings,
         logger_stdout: bool = True,
         error_sleep: int = 120,
+        array_submission: bool = False,
+        submit_workers: int = 1,
+        bundle_size: int = 1,
+        watcher: SettingsWatcher = None,
+        logger: Logger = None,
+        engines: EnginePool = None,
     ):
-        self.producer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
-        self.consumer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
+        instantiate = instantiate_from_path if engines is None else engines.get
+        self.consumer = instantiate(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
 
+        # the producer moves the folders between queues, so it is not
+        # shared with the other daemons, which copy them
+        self.producer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
         self.producer.move = True
 
         for q in QUEUES:
             self.producer.add_queue(q)
 
+        self.journal = get_journal(settings, self.producer.root_path)
+
         self.scheduler = scheduler
         self.settings = settings
+        self.watcher = watcher
         self.error_sleep = error_sleep
+        self.submit_workers = max(submit_workers, 1)
+        self.job_backoff = Backoff(base=error_sleep)
+        self.error_backoff = Backoff(base=error_sleep)
+        self.cycle_errors = Counter()
+        self.cycle_successes = 0
+        self._cycle_lock = threading.Lock()
+        self.throttle = SubmitThrottle(
+            window=settings.MAX_PENDING, slow_latency=settings.SCHEDULER_SLOW_LATENCY
+        )
+        self.array_submission = array_submission and scheduler.supports_arrays
+        self.bundle_size = max(bundle_size, 1)
+        self.missing: Dict[str, float] = {}
+        self.arrays = GroupRegistry(
+            os.path.join(self.producer.root_path, ".arrays"), group_cls=JobArray
+        )
+        self.bundles = GroupRegistry(
+            os.path.join(self.producer.root_path, ".bundles"), group_cls=JobBundle
+        )
+
+        if logger is None:
+            log_path = os.path.join(settings.LOG_PATH, "mkwind-run.log")
+            logger = Logger.to_file(log_path, stdout=logger_stdout)
 
-        log_path = os.path.join(settings.LOG_PATH, "mkwind-run.log")
-        self.logger = Logger.to_file(log_path, stdout=logger_stdout)
+        self.logger = logger
         self.log("initializing mkwind JobDaemon")
+        self.reconcile()
 
     def log(self, msg: str):
         self.logger.log(msg)
@@ -44,9 +96,51 @@ class JobDaemon:
 
         return cls(scheduler, settings, **kwargs)
 
+    def reconcile(self):
+        """Brings the journal, if enabled, in sync with the queue folders,
+        e.g., after the daemon stopped between moving and recording a job"""
+        if self.journal is None:
+            return
+
+        fixed = self.journal.reconcile(self.producer, QUEUES)
+        self.log(f"journal reconciled, {fixed} jobs updated")
+
+    def list_queue(self, queue: str) -> Set[str]:
+        """Names of the jobs in the queue, from the journal if enabled"""
+        if self.journal is not None:
+            return self.journal.names(queue)
+
+        return set(self.consumer.list_queue(queue))
+
+    def get_watches(self):
+        """Wakes up when new jobs are READY. Jobs finishing in the
+        scheduler are still found by polling it."""
+        return {self.producer.get_queue_path(Status.READY): ARRIVALS}
+
+    def reload_settings(self):
+        """Applies the changes to the settings made since the last cycle"""
+        if self.watcher is None or not self.watcher.update(self.logger):
+            return
+
+        self.settings = self.watcher.settings
+        self.scheduler.settings = self.settings
+        self.scheduler.snapshot_ttl = self.settings.SCHEDULER_TTL
+        self.throttle.slow_latency = self.settings.SCHEDULER_SLOW_LATENCY
+
     def change_status(self, item: str, src_queue: str, dst_queue: str):
         item = self.producer.item_path(src_queue, item)
         dst = self.producer.push(dst_queue, item)
+
+        # the exit status and scheduler ID of a previous attempt are not reused
+        if dst_queue == Status.READY.value:
+            for marker in (EXIT_STATUS_NAME, JOB_ID_NAME):
+                path = os.path.join(dst, marker)
+                if os.path.exists(path):
+                    os.remove(path)
+
+        if self.journal is not None:
+            self.journal.record(os.path.basename(dst), dst_queue, src=src_queue)
+
         return dst
 
     def submit(self):
@@ -56,36 +150,252 @@ class JobDaemon:
         n_pending = len(self.scheduler.get_pending())
         self.logger.log(f"{n_pending} jobs pending")
 
-        n_submit = self.settings.MAX_PENDING - n_pending
+        latency = self.scheduler.latency
+        n_submit = self.throttle.limit(
+            n_pending, n_running, self.settings.MAX_PENDING, self.settings.MAX_RUNNING
+        )
         if n_submit > 0:
             self.logger.log(f"{n_submit} slots available in the queue")
             submitted = self.submit_n(n_submit)
             self.logger.log(f"{len(submitted)} jobs submitted")
+
+            # the cached snapshot no longer reflects the queue
+            if submitted:
+                self.track_jobs()
+                self.scheduler.invalidate()
         else:
             submitted = []
             self.logger.log("no jobs to submit")
 
+        window = self.throttle.update(
+            len(submitted), latency=latency, max_window=self.settings.MAX_PENDING
+        )
+        self.logger.log(f"submitting up to {window} jobs in the next cycle")
         return submitted
 
     def submit_n(self, n_submit: int):
-        submitted = []
-        for key, job_folder in self.consumer.get_n(Status.READY.value, n=n_submit):
-            dst = self.change_status(job_folder, Status.READY.value, Status.DOING.value)
-            job = os.path.basename(dst)
-
-            try:
-                self.scheduler.submit_job(dst)
-                self.logger.log(f"submitted job {job}")
-                submitted.append(job)
-
-            # if there is an error, revert the move operation
-            except SchedulerError as e:
+        paused = self.error_backoff.waiting()
+        if paused:
+            self.logger.log(
+                f"submissions paused after repeated errors: {', '.join(map(str, paused))}"
+            )
+            return []
+
+        folders = self.get_ready_folders(n_submit)
+
+        if self.bundle_size > 1:
+            groups = []
+            for group in self.group_by_settings(folders).values():
+                # jobs whose resources cannot be bundled are submitted alone
+                size = self.bundle_size if self.can_bundle(group[0]) else 1
+                groups += [group[i : i + size] for i in range(0, len(group), size)]
+        elif self.array_submission:
+            groups = list(self.group_by_settings(folders).values())
+        else:
+            groups = [[folder] for folder in folders]
+
+        with ThreadPoolExecutor(max_workers=self.submit_workers) as pool:
+            results = list(pool.map(self.submit_group, groups))
+
+        self.update_error_backoff()
+        return [job for jobs in results for job in jobs]
+
+    def get_ready_folders(self, n: int) -> List[os.PathLike]:
+        """Returns up to `n` READY folders that are not backing off
+        from a previous submission error"""
+        folders = [
+            job_folder
+            for key, job_folder in self.consumer.get_n(
+                Status.READY.value, n=n + len(self.job_backoff)
+            )
+            if self.job_backoff.ready(os.path.basename(job_folder))
+        ]
+        return folders[:n]
+
+    def can_bundle(self, folder: os.PathLike) -> bool:
+        return JobBundle.can_bundle(self.read_settings(folder))
+
+    def submit_group(self, folders: List[os.PathLike]) -> List[str]:
+        if len(folders) > 1 and self.bundle_size > 1:
+            return self.submit_bundle(folders)
+
+        if len(folders) > 1:
+            return self.submit_array(folders)
+
+        job = self.submit_one(folders[0])
+        return [] if job is None else [job]
+
+    def submit_one(self, job_folder: os.PathLike):
+        dst = self.change_status(job_folder, Status.READY.value, Status.DOING.value)
+        job = os.path.basename(dst)
+
+        try:
+            job_id = self.scheduler.submit_job(dst)
+            self.save_job_id([dst], job_id)
+            self.logger.log(f"submitted job {job}")
+            self.on_submit_success([job])
+            return job
+
+        # if there is an error, revert the move operation
+        except SchedulerError as e:
+            self.change_status(dst, Status.DOING.value, Status.READY.value)
+            self.logger.log(f"error submitting {job_folder}: {e}", level=LoggerLevel.ERROR)
+            self.on_submit_error([job], e)
+
+        return None
+
+    def save_job_id(self, folders: List[os.PathLike], job_id: Optional[str]):
+        """Stores the scheduler ID in the job folders and in the journal"""
+        if job_id is None:
+            return
+
+        for folder in folders:
+            write_job_id(folder, job_id)
+
+            if self.journal is not None:
+                self.journal.set_scheduler_id(os.path.basename(folder), job_id)
+
+    def get_job_ids(self) -> Optional[Set[str]]:
+        """Returns the scheduler IDs of the jobs in DOING, or None if
+        the ID of any of them is unknown"""
+        if self.journal is not None:
+            doing = self.journal.names(Status.DOING)
+            ids = self.journal.scheduler_ids(Status.DOING)
+            return set(ids.values()) if doing.issubset(ids) else None
+
+        ids = set()
+        for name in self.consumer.list_queue(Status.DOING.value):
+            job_id = read_job_id(self.producer.item_path(Status.DOING.value, name))
+            if job_id is None:
+                return None
+
+            ids.add(job_id)
+
+        return ids
+
+    def track_jobs(self):
+        """Restricts the status queries to the jobs in DOING, if their
+        IDs are known and the scheduler can query jobs by ID"""
+        if self.scheduler.supports_job_ids:
+            self.scheduler.track(self.get_job_ids())
+
+    def on_submit_success(self, jobs: List[str]):
+        for job in jobs:
+            self.job_backoff.success(job)
+
+        with self._cycle_lock:
+            self.cycle_successes += 1
+
+    def on_submit_error(self, jobs: List[str], error: SchedulerError):
+        """Backs off the failed jobs, such that the other jobs are still
+        submitted. The class of the error is only backed off at the end
+        of the cycle, if it affected all submissions (`update_error_backoff`)."""
+        self.throttle.failure()
+        for job in jobs:
+            delay = self.job_backoff.failure(job)
+
+        with self._cycle_lock:
+            self.cycle_errors[(type(error).__name__, error.returncode)] += 1
+
+        self.logger.log(f"retrying {', '.join(jobs)} in {delay:.0f} s", level=LoggerLevel.ERROR)
+
+    def update_error_backoff(self):
+        """Pauses all submissions when no submission of the cycle succeeded
+        and more than one failed, e.g. when the scheduler is down. Errors
+        of single jobs only back off these jobs."""
+        with self._cycle_lock:
+            errors, successes = self.cycle_errors, self.cycle_successes
+            self.cycle_errors, self.cycle_successes = Counter(), 0
+
+        if successes > 0:
+            self.error_backoff.reset()
+            return
+
+        if sum(errors.values()) < 2:
+            return
+
+        for error_class in errors:
+            delay = self.error_backoff.failure(error_class)
+            self.logger.log(
+                f"all submissions failed with {error_class}; "
+                f"pausing submissions for {delay:.0f} s",
+                level=LoggerLevel.ERROR,
+            )
+
+    def read_settings(self, folder: os.PathLike) -> dict:
+        path = os.path.join(folder, JobSettings.file_name())
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def group_by_settings(self, folders: List[os.PathLike]) -> Dict[str, List[os.PathLike]]:
+        """Groups the job folders that have identical JobSettings.
+        Folders without settings are placed in groups of their own."""
+        groups = {}
+        for folder in folders:
+            settings = self.read_settings(folder)
+            if settings is None:
+                key = folder
+            else:
+                key = json.dumps(settings, sort_keys=True)
+
+            groups.setdefault(key, []).append(folder)
+
+        return groups
+
+    def submit_array(self, folders: List[os.PathLike]) -> List[str]:
+        """Submits the job folders, which share the same JobSettings,
+        as a single job array"""
+        return self.submit_grouped(
+            folders, self.arrays, task_var=self.scheduler.ARRAY_TASK_VAR
+        )
+
+    def submit_bundle(self, folders: List[os.PathLike]) -> List[str]:
+        """Submits the job folders, which share the same JobSettings,
+        as a single job that runs all of them in parallel"""
+        return self.submit_grouped(
+            folders, self.bundles, ntasks_var=self.scheduler.NTASKS_VAR
+        )
+
+    def submit_grouped(
+        self,
+        folders: List[os.PathLike],
+        registry: GroupRegistry,
+        **kwargs,
+    ) -> List[str]:
+        settings = self.read_settings(folders[0])
+        dsts = [
+            self.change_status(folder, Status.READY.value, Status.DOING.value)
+            for folder in folders
+        ]
+        jobs = [os.path.basename(dst) for dst in dsts]
+
+        group = registry.create(
+            dsts,
+            template=self.scheduler.TEMPLATE,
+            settings=settings,
+            **kwargs,
+        )
+
+        try:
+            job_id = group.submit(self.scheduler)
+            self.save_job_id(dsts, job_id)
+            self.logger.log(f"submitted {group.name} with {len(group)} jobs")
+            self.on_submit_success(jobs)
+            return jobs
+
+        # if there is an error, revert the move operations
+        except SchedulerError as e:
+            for dst in dsts:
                 self.change_status(dst, Status.DOING.value, Status.READY.value)
-                self.logger.log(f"error submitting {job_folder}: {e}", level=LoggerLevel.ERROR)
-                self.logger.log(f"sleeping for {self.error_sleep}", level=LoggerLevel.ERROR)
-                time.sleep(self.error_sleep)
 
-        return submitted
+            registry.remove(group)
+            self.logger.log(f"error submitting {group.name}: {e}", level=LoggerLevel.ERROR)
+            self.on_submit_error(jobs, e)
+
+        return []
 
     def process_jobs(
         self,
@@ -93,17 +403,155 @@ class JobDaemon:
         src: str,
         dst: str,
     ):
-        jobs_in_src = self.consumer.list_queue(src)
+        """Moves the jobs reported by the scheduler from `src` to `dst`.
+        Jobs are looked up in a set of the names in `src`, and removed
+        from it once moved, so duplicate reports are ignored."""
+        jobs_in_src = self.list_queue(src)
 
         processed = []
         for job in schedjobs:
-            if job.name in jobs_in_src:
-                self.change_status(job.name, src, dst)
-                self.logger.log(f"moving {job.name} to {dst}")
-                processed.append(job.name)
+            bundle = self.bundles.get(job.name)
+            if bundle is not None:
+                processed += self.process_bundle(bundle, jobs_in_src, src, dst)
+                continue
+
+            name = self.get_job_name(job)
+            if name in jobs_in_src:
+                self.change_status(name, src, dst)
+                self.logger.log(f"moving {name} to {dst}")
+                jobs_in_src.discard(name)
+                processed.append(name)
+
+        return processed
+
+    def get_reported(self, schedjobs: List[SchedulerJob]) -> Set[str]:
+        """Names of the job folders that the scheduler reports, in any status"""
+        names = set()
+        for job in schedjobs:
+            group = self.bundles.get(job.name)
+            if group is None and job.array_index is None:
+                group = self.arrays.get(job.name)
+
+            if group is not None:
+                names.update(group.names)
+            else:
+                names.add(self.get_job_name(job))
+
+        return names
+
+    def get_job_id(self, name: str) -> Optional[str]:
+        if self.journal is not None:
+            entry = self.journal.get(name)
+            return None if entry is None else entry["scheduler_id"]
+
+        return read_job_id(self.producer.item_path(Status.DOING.value, name))
+
+    def get_lost_dst(self, name: str) -> str:
+        """Queue for a job that is no longer known to the scheduler. Jobs
+        that left a completion marker are DONE (or ERROR, according to
+        their exit status), and the others are handled by LOST_JOB_POLICY."""
+        folder = self.producer.item_path(Status.DOING.value, name)
+
+        exit_status = os.path.join(folder, EXIT_STATUS_NAME)
+        if os.path.exists(exit_status):
+            with open(exit_status, "r") as f:
+                ok = f.read().strip() == "0"
+
+            return Status.DONE.value if ok else Status.ERROR.value
+
+        if any(os.path.exists(os.path.join(folder, m)) for m in COMPLETION_MARKERS):
+            return Status.DONE.value
+
+        if self.settings.LOST_JOB_POLICY == "error":
+            return Status.ERROR.value
+
+        return Status.READY.value
+
+    def is_pilot_running(self, name: str, reported_ids: Set[str]) -> bool:
+        """Returns True if the job is run by a pilot that is still known
+        to the scheduler, or by a pilot whose ID is unknown"""
+        pilot, pilot_id = read_pilot_id(self.producer.item_path(Status.DOING.value, name))
+        return pilot and (pilot_id is None or pilot_id in reported_ids)
+
+    def process_lost(self):
+        """Handles the jobs in DOING that the scheduler no longer reports,
+        neither by name nor by ID, for at least LOST_JOB_GRACE seconds"""
+        if not self.scheduler.REPORTS_JOBS:
+            return []
+
+        schedjobs = self.scheduler.snapshot()
+        reported = self.get_reported(schedjobs)
+        reported_ids = {str(job.id) for job in schedjobs}
+
+        missing = self.list_queue(Status.DOING.value) - reported
+        missing = {
+            name
+            for name in missing
+            if self.get_job_id(name) not in reported_ids
+            and not self.is_pilot_running(name, reported_ids)
+        }
+
+        # jobs that reappeared or left DOING are no longer tracked
+        now = time.monotonic()
+        self.missing = {name: self.missing.get(name, now) for name in missing}
+
+        lost = [
+            name
+            for name, since in self.missing.items()
+            if now - since >= self.settings.LOST_JOB_GRACE
+        ]
+        for name in lost:
+            dst = self.get_lost_dst(name)
+            self.change_status(name, Status.DOING.value, dst)
+            self.logger.log(f"{name} is no longer known to the scheduler, moving to {dst}")
+            self.missing.pop(name)
+
+        self.logger.log(f"{len(lost)} lost jobs, {len(self.missing)} missing jobs")
+        return lost
+
+    def get_job_name(self, job: SchedulerJob) -> str:
+        """Name of the job folder corresponding to the scheduler job"""
+        if job.array_index is None:
+            return job.name
+
+        name = self.arrays.resolve(job.name, job.array_index)
+        return job.name if name is None else name
+
+    def process_bundle(
+        self,
+        bundle: JobBundle,
+        jobs_in_src: Set[str],
+        src: str,
+        dst: str,
+    ) -> List[str]:
+        """Splits a bundle that left the scheduler into its jobs. Unless
+        the bundle is restarted, each job is moved to DONE or ERROR
+        according to its own exit status."""
+        processed = []
+        for folder in bundle.folders:
+            name = os.path.basename(folder)
+            if name not in jobs_in_src:
+                continue
+
+            jobs_in_src.discard(name)
+
+            job_dst = dst
+            if dst in (Status.DONE.value, Status.ERROR.value):
+                status = bundle.get_exit_status(folder)
+                job_dst = Status.DONE.value if status == 0 else Status.ERROR.value
+
+            self.change_status(name, src, job_dst)
+            self.logger.log(f"moving {name} from {bundle.name} to {job_dst}")
+            processed.append(name)
 
         return processed
 
+    def cleanup_groups(self):
+        doing = self.list_queue(Status.DOING.value)
+        for registry in (self.arrays, self.bundles):
+            for name in registry.cleanup(doing):
+                self.logger.log(f"all jobs from {name} finished")
+
     def process_done(self):
         schedjobs = self.scheduler.get_done()
         done = self.process_jobs(schedjobs, Status.DOING.value, Status.DONE.value)
@@ -126,10 +574,15 @@ class JobDaemon:
         try:
             self.logger.hbar()
             self.logger.log("entering management loop")
+            self.reload_settings()
+            self.track_jobs()
             self.process_done()
             self.submit()
             self.process_error()
             self.process_failed()
+            self.process_lost()
+            self.scheduler.checkpoint()
+            self.cleanup_groups()
 
         except SchedulerError as e:
                 self.logger.log(f"scheduler error: {e}", level=LoggerLevel.ERROR)
@@ -0,0 +1,287 @@
+import os
+import re
+import uuid
+import shutil
+import threading
+from typing import Dict, List, Union
+
+from mkwind.templates import Template
+
+
+MANIFEST_NAME = "manifest.txt"
+EXIT_STATUS_NAME = "mkwind-exit-status"
+
+# resources requested per job, which bundles request for all their jobs
+SCALED_FIELDS = ("gpus", "gres", "memory")
+# resources that cannot be shared between the jobs of a bundle
+UNBUNDLED_FIELDS = ("gpus_per_node",)
+RESOURCE_REGEX = re.compile(r"^(.*?)(\d+)([KMGTP]?i?B?)$", re.IGNORECASE)
+
+
+def scale_resource(value, n: int):
+    """Multiplies the counts of a resource request such as `4`, `16G`,
+    `a100:2` or `gpu:2,nvme:1` by `n`"""
+    if isinstance(value, int):
+        return value * n
+
+    parts = []
+    for part in str(value).split(","):
+        match = RESOURCE_REGEX.match(part.strip())
+        if match is None:
+            raise ValueError(f"Cannot scale the resource request {value}")
+
+        prefix, count, unit = match.groups()
+        parts.append(f"{prefix}{int(count) * n}{unit}")
+
+    return ",".join(parts)
+
+
+class JobGroup:
+    """Set of job folders submitted to the scheduler as a single job.
+    The folders are listed in a manifest, one per line, and the script
+    submitted to the scheduler dispatches the jobs to their folders.
+    """
+
+    PREFIX = "mkwind_group_"
+
+    def __init__(self, name: str, path: os.PathLike, folders: List[str]):
+        self.name = name
+        self.path = path
+        self.folders = folders
+
+    def __len__(self):
+        return len(self.folders)
+
+    @property
+    def manifest(self) -> os.PathLike:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    @property
+    def script(self) -> os.PathLike:
+        return os.path.join(self.path, Template.FILENAME)
+
+    @property
+    def names(self) -> List[str]:
+        return [os.path.basename(f) for f in self.folders]
+
+    def dispatch_cmd(self, **kwargs) -> str:
+        raise NotImplementedError
+
+    def submit(self, scheduler):
+        raise NotImplementedError
+
+    def get_settings(self, settings: dict) -> dict:
+        """Settings of the job submitted to the scheduler"""
+        return settings
+
+    def write(self, template: Template, settings: dict, **kwargs):
+        os.makedirs(self.path, exist_ok=True)
+
+        with open(self.manifest, "w") as f:
+            f.write("\n".join(self.folders) + "\n")
+
+        inputs = {
+            **self.get_settings(settings),
+            "pre_cmd": None,
+            "cmd": self.dispatch_cmd(**kwargs),
+            "post_cmd": None,
+        }
+        return template.render_to(inputs, self.script)
+
+    @classmethod
+    def from_folder(cls, path: os.PathLike) -> "JobGroup":
+        with open(os.path.join(path, MANIFEST_NAME), "r") as f:
+            folders = [line.strip() for line in f if line.strip()]
+
+        return cls(os.path.basename(path), path, folders)
+
+
+class JobArray(JobGroup):
+    """Job folders submitted as a single job array. The i-th task of the
+    array (1-indexed) runs the job in the i-th folder of the manifest."""
+
+    PREFIX = "mkwind_array_"
+
+    def get_folder(self, index: int) -> Union[str, None]:
+        if 1 <= index <= len(self.folders):
+            return self.folders[index - 1]
+
+        return None
+
+    def get_name(self, index: int) -> Union[str, None]:
+        folder = self.get_folder(index)
+        if folder is None:
+            return None
+
+        return os.path.basename(folder)
+
+    def dispatch_cmd(self, task_var: str) -> str:
+        """Command that moves into the folder of the task and runs its job"""
+        return "\n".join(
+            [
+                f'JOB_FOLDER=$(sed -n "${{{task_var}}}p" {self.manifest})',
+                'cd "$JOB_FOLDER" || exit 1',
+                f"bash {Template.FILENAME} > mkwind-array.out 2>&1",
+            ]
+        )
+
+    def submit(self, scheduler):
+        return scheduler.submit_array(self.script, self.name, len(self))
+
+
+class JobBundle(JobGroup):
+    """Job folders packed into a single allocation of the scheduler.
+    All jobs run in parallel as background processes, and the exit
+    status of each job is written to its own folder."""
+
+    PREFIX = "mkwind_bundle_"
+
+    @staticmethod
+    def get_ntasks(settings: dict) -> int:
+        if settings.get("ntasks"):
+            return settings["ntasks"]
+
+        return (settings.get("nodes") or 1) * (settings.get("tasks_per_node") or 1)
+
+    @classmethod
+    def can_bundle(cls, settings: dict) -> bool:
+        """Returns False if the resources of the jobs cannot be requested
+        for the whole bundle, e.g. GPUs per node or unknown `gres` formats"""
+        if settings is None or any(settings.get(f) for f in UNBUNDLED_FIELDS):
+            return False
+
+        try:
+            cls.scale_settings(settings, 2)
+        except ValueError:
+            return False
+
+        return True
+
+    @classmethod
+    def scale_settings(cls, settings: dict, n: int) -> dict:
+        """Settings requesting the resources of `n` jobs"""
+        scaled = {
+            field: scale_resource(settings[field], n)
+            for field in SCALED_FIELDS
+            if settings.get(field)
+        }
+        return {
+            **settings,
+            **scaled,
+            "nodes": None,
+            "tasks_per_node": None,
+            "ntasks": n * cls.get_ntasks(settings),
+        }
+
+    def get_settings(self, settings: dict) -> dict:
+        """Requests the resources of all jobs in the bundle"""
+        return self.scale_settings(settings, len(self))
+
+    def dispatch_cmd(self, ntasks_var: str, ntasks: int) -> str:
+        """Runs each job of the manifest in its folder, in parallel, and
+        limits the number of tasks seen by each job to its own share"""
+        return "\n".join(
+            [
+                "run_job() {",
+                '    cd "$1" || exit 1',
+                f"    {ntasks_var}={ntasks} bash {Template.FILENAME} > mkwind-bundle.out 2>&1",
+                f"    echo $? > {EXIT_STATUS_NAME}",
+                "}",
+                "",
+                "while read -r JOB_FOLDER; do",
+                '    run_job "$JOB_FOLDER" &',
+                f"done < {self.manifest}",
+                "wait",
+            ]
+        )
+
+    def write(self, template: Template, settings: dict, ntasks_var: str):
+        ntasks = self.get_ntasks(settings)
+        return super().write(template, settings, ntasks_var=ntasks_var, ntasks=ntasks)
+
+    def submit(self, scheduler):
+        return scheduler.submit_job(self.path)
+
+    def get_exit_status(self, folder: os.PathLike) -> Union[int, None]:
+        """Returns the exit status of the job in `folder`, or None if
+        the job did not finish"""
+        path = os.path.join(folder, EXIT_STATUS_NAME)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r") as f:
+            status = f.read().strip()
+
+        return int(status) if status.isdigit() else None
+
+
+class GroupRegistry:
+    """Keeps the manifests of the job groups submitted by the JobDaemon,
+    allowing the jobs reported by the scheduler to be mapped back to
+    their job folders."""
+
+    def __init__(self, root: os.PathLike, group_cls=JobArray):
+        self.root = root
+        self.group_cls = group_cls
+        self._groups = None
+        self._lock = threading.Lock()
+
+    @property
+    def groups(self) -> Dict[str, JobGroup]:
+        with self._lock:
+            if self._groups is None:
+                self._groups = self.load()
+
+        return self._groups
+
+    def get(self, name: str) -> Union[JobGroup, None]:
+        return self.groups.get(name)
+
+    def load(self) -> Dict[str, JobGroup]:
+        if not os.path.exists(self.root):
+            return {}
+
+        groups = {}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.exists(os.path.join(path, MANIFEST_NAME)):
+                groups[name] = self.group_cls.from_folder(path)
+
+        return groups
+
+    def create(
+        self,
+        folders: List[str],
+        template: Template,
+        settings: dict,
+        **kwargs,
+    ) -> JobGroup:
+        name = f"{self.group_cls.PREFIX}{uuid.uuid4().hex[:8]}"
+        group = self.group_cls(name, os.path.join(self.root, name), folders)
+        group.write(template, settings, **kwargs)
+        self.groups[name] = group
+        return group
+
+    def remove(self, group: JobGroup):
+        self.groups.pop(group.name, None)
+        if os.path.exists(group.path):
+            shutil.rmtree(group.path)
+
+    def resolve(self, name: str, index: int) -> Union[str, None]:
+        """Returns the name of the job folder of the task `index` of the array"""
+        group = self.get(name)
+        if group is None:
+            return None
+
+        return group.get_name(index)
+
+    def cleanup(self, active: List[str]) -> List[str]:
+        """Removes the groups whose jobs are no longer in the `active` list"""
+        active = set(active)
+        removed = []
+        for group in list(self.groups.values()):
+            if active.isdisjoint(group.names):
+                self.remove(group)
+                removed.append(group.name)
+
+        return removed
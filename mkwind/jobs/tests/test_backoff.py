@@ -0,0 +1,39 @@
+import unittest as ut
+from unittest.mock import patch
+
+from mkwind.jobs.backoff import Backoff
+
+
+class TestBackoff(ut.TestCase):
+    def setUp(self):
+        self.backoff = Backoff(base=10, maximum=25)
+
+    def test_failure(self):
+        self.assertEqual(self.backoff.failure("job"), 10)
+        self.assertEqual(self.backoff.failure("job"), 20)
+        self.assertEqual(self.backoff.failure("job"), 25)
+        self.assertEqual(self.backoff.failure("other"), 10)
+
+    def test_ready(self):
+        self.assertTrue(self.backoff.ready("job"))
+
+        with patch("time.monotonic", return_value=100):
+            self.backoff.failure("job")
+            self.assertFalse(self.backoff.ready("job"))
+            self.assertTrue(self.backoff.ready("other"))
+            self.assertTrue(self.backoff.blocked("job"))
+            self.assertFalse(self.backoff.blocked("other"))
+            self.assertEqual(self.backoff.waiting(), ["job"])
+
+        with patch("time.monotonic", return_value=111):
+            self.assertTrue(self.backoff.ready("job"))
+            self.assertFalse(self.backoff.blocked("job"))
+            self.assertEqual(self.backoff.waiting(), [])
+
+    def test_success(self):
+        self.backoff.failure("job")
+        self.backoff.success("job")
+
+        self.assertTrue(self.backoff.ready("job"))
+        self.assertNotIn("job", self.backoff)
+        self.assertEqual(self.backoff.failure("job"), 10)
@@ -1,5 +1,7 @@
 import os
+import time
 import subprocess
+from typing import List
 from distutils.dir_util import copy_tree
 
 import unittest as ut
@@ -9,11 +11,17 @@ from pkg_resources import resource_filename
 from mkite_core.models import Status
 from mkite_core.external import load_config
 from mkite_core.tests.tempdirs import run_in_tempdir
+from mkite_engines import EngineRoles
 
 from mkwind.user import EnvSettings
+from mkwind.user.engines import EnginePool
 from mkwind.schedulers import SchedulerJob, SchedulerError
+from mkwind.schedulers.base import write_job_id, read_job_id
 from mkwind.schedulers.tests.test_slurm import MockSlurmScheduler
 from mkwind.jobs.daemon import JobDaemon
+from mkwind.jobs.groups import EXIT_STATUS_NAME
+from mkwind.jobs.worker import write_pilot_id
+from mkwind.builder.settings import JobSettings
 
 
 EXAMPLE_JOBS_PATH = resource_filename("mkwind.tests.files", "example_jobs")
@@ -31,7 +39,7 @@ class TestDaemon(ut.TestCase):
         engine_cfg = load_config(ENGINE)
         copy_tree(str(EXAMPLE_JOBS_PATH), str(engine_cfg["root_path"]))
 
-    def get_daemon(self):
+    def get_daemon(self, **kwargs):
         settings = self.get_settings()
         scheduler = MockSlurmScheduler(settings)
         self.copy_example_jobs(settings)
@@ -40,12 +48,43 @@ class TestDaemon(ut.TestCase):
             scheduler=scheduler,
             settings=settings,
             logger_stdout=False,
+            **kwargs,
         )
 
+    def add_ready_jobs(self, daemon: JobDaemon, n: int):
+        """Creates `n` copies of the READY job with the same JobSettings"""
+        ready = daemon.consumer.get_queue_path(Status.READY.value)
+        original = os.path.join(ready, "test_recipe_7615c560_1658944102")
+        JobSettings().to_json(os.path.join(original, JobSettings.file_name()))
+
+        for i in range(n):
+            copy_tree(original, f"{original}_{i}")
+
+        daemon.consumer.delay = 0
+
+    def add_ready_jobs_named(self, daemon: JobDaemon, names: List[str]):
+        ready = daemon.consumer.get_queue_path(Status.READY.value)
+        original = os.path.join(ready, "test_recipe_7615c560_1658944102")
+        for name in names:
+            copy_tree(original, os.path.join(ready, name))
+
     @run_in_tempdir
     def test_instantiate(self):
         daemon = self.get_daemon()
 
+    @run_in_tempdir
+    def test_engine_pool(self):
+        engines = EnginePool()
+        shared = engines.get(self.get_settings().ENGINE_LOCAL, role=EngineRoles.producer)
+        daemon = self.get_daemon(engines=engines)
+
+        consumer = engines.get(daemon.settings.ENGINE_LOCAL, role=EngineRoles.consumer)
+        self.assertIs(daemon.consumer, consumer)
+
+        # the producer of the daemon always moves folders, so it is its own
+        self.assertIsNot(daemon.producer, shared)
+        self.assertTrue(daemon.producer.move)
+
     @run_in_tempdir
     def test_submit_avoidance(self):
         daemon = self.get_daemon()
@@ -54,6 +93,27 @@ class TestDaemon(ut.TestCase):
 
         self.assertEqual(submitted, [])
 
+    @run_in_tempdir
+    def test_get_watches(self):
+        daemon = self.get_daemon()
+        ready = daemon.producer.get_queue_path(Status.READY.value)
+        self.assertEqual(list(daemon.get_watches().keys()), [ready])
+
+    @run_in_tempdir
+    def test_reload_settings(self):
+        watcher = MagicMock()
+        daemon = self.get_daemon(watcher=watcher)
+
+        new = daemon.settings.model_copy(update={"MAX_PENDING": 0, "SCHEDULER_TTL": 5})
+        watcher.settings = new
+        watcher.update.return_value = True
+        daemon.reload_settings()
+
+        self.assertIs(daemon.settings, new)
+        self.assertIs(daemon.scheduler.settings, new)
+        self.assertEqual(daemon.scheduler.snapshot_ttl, 5)
+        self.assertEqual(daemon.submit(), [])
+
     @run_in_tempdir
     def test_submit(self):
         daemon = self.get_daemon()
@@ -62,6 +122,36 @@ class TestDaemon(ut.TestCase):
 
         self.assertEqual(submitted, ["test_recipe_7615c560_1658944102"])
 
+    @run_in_tempdir
+    def test_submit_max_running(self):
+        daemon = self.get_daemon(submit_workers=4)
+        self.add_ready_jobs(daemon, 5)
+        daemon.settings.MAX_PENDING = 10
+
+        # 3 running and 4 pending jobs in the scheduler
+        daemon.settings.MAX_RUNNING = 9
+        submitted = daemon.submit()
+        self.assertEqual(len(submitted), 2)
+
+    @run_in_tempdir
+    def test_track_jobs(self):
+        daemon = self.get_daemon()
+        daemon.settings.MAX_PENDING = 10
+
+        # the job that was already in DOING has no ID
+        daemon.track_jobs()
+        self.assertIsNone(daemon.scheduler.job_ids)
+
+        doing = daemon.producer.item_path(Status.DOING.value, "test_recipe_9c60037b_1658944102")
+        write_job_id(doing, "1010205")
+
+        with patch.object(daemon.scheduler, "submit_job", return_value="1010300"):
+            submitted = daemon.submit()
+
+        folder = daemon.producer.item_path(Status.DOING.value, submitted[0])
+        self.assertEqual(read_job_id(folder), "1010300")
+        self.assertEqual(daemon.scheduler.job_ids, ["1010205", "1010300"])
+
     @run_in_tempdir
     def test_submit_with_error(self):
         def error_submission(*args, **kwargs):
@@ -78,6 +168,206 @@ class TestDaemon(ut.TestCase):
         self.assertEqual(len(jobs_ready), 1)
         self.assertEqual(len(jobs_doing), 1)
 
+    @run_in_tempdir
+    def test_submit_bundle(self):
+        daemon = self.get_daemon(bundle_size=2)
+        self.add_ready_jobs(daemon, 2)
+        daemon.settings.MAX_PENDING = 10
+
+        with patch.object(daemon.scheduler, "submit_job") as submit_job:
+            submitted = daemon.submit()
+
+        self.assertEqual(len(submitted), 3)
+        self.assertEqual(submit_job.call_count, 2)
+        self.assertEqual(len(daemon.bundles.groups), 1)
+
+        # each job of the bundle is moved according to its exit status
+        bundle = list(daemon.bundles.groups.values())[0]
+        done_folder, error_folder = bundle.folders
+        with open(os.path.join(done_folder, EXIT_STATUS_NAME), "w") as f:
+            f.write("0\n")
+
+        info = SchedulerJob(
+            id=1011123,
+            name=bundle.name,
+            start_time="2022-07-26",
+            partition="pdebug",
+            group="normal",
+            status="COMPLETED",
+        )
+        mock_scheduler = Mock()
+        mock_scheduler.get_done.return_value = [info]
+        daemon.scheduler = mock_scheduler
+
+        daemon.process_done()
+        jobs_done = daemon.consumer.list_queue(Status.DONE.value)
+        jobs_error = daemon.consumer.list_queue(Status.ERROR.value)
+
+        self.assertIn(os.path.basename(done_folder), jobs_done)
+        self.assertEqual(jobs_error, [os.path.basename(error_folder)])
+
+        daemon.cleanup_groups()
+        self.assertEqual(daemon.bundles.groups, {})
+
+    @run_in_tempdir
+    def test_submit_bundle_gpus_per_node(self):
+        daemon = self.get_daemon(bundle_size=2)
+        self.add_ready_jobs(daemon, 1)
+        daemon.settings.MAX_PENDING = 10
+
+        for name in daemon.consumer.list_queue(Status.READY.value):
+            folder = daemon.producer.item_path(Status.READY.value, name)
+            JobSettings(gpus_per_node=4).to_json(os.path.join(folder, JobSettings.file_name()))
+
+        with patch.object(daemon.scheduler, "submit_job") as submit_job:
+            submitted = daemon.submit()
+
+        # jobs requesting GPUs per node are not bundled
+        self.assertEqual(len(submitted), 2)
+        self.assertEqual(submit_job.call_count, 2)
+        self.assertEqual(daemon.bundles.groups, {})
+
+    @run_in_tempdir
+    def test_requeue_removes_exit_status(self):
+        name = "test_recipe_9c60037b_1658944102"
+        daemon = self.get_daemon()
+        doing = daemon.producer.item_path(Status.DOING.value, name)
+        with open(os.path.join(doing, EXIT_STATUS_NAME), "w") as f:
+            f.write("1\n")
+
+        dst = daemon.change_status(name, Status.DOING.value, Status.READY.value)
+        self.assertFalse(os.path.exists(os.path.join(dst, EXIT_STATUS_NAME)))
+
+    def check_requeue_job_id(self, daemon: JobDaemon):
+        """A requeued job whose new submission returns no ID is not
+        tracked with the ID of its previous attempt"""
+        name = "test_recipe_9c60037b_1658944102"
+        doing = daemon.producer.item_path(Status.DOING.value, name)
+        daemon.save_job_id([doing], "1010300")
+        self.assertEqual(daemon.get_job_id(name), "1010300")
+
+        dst = daemon.change_status(name, Status.DOING.value, Status.READY.value)
+        self.assertIsNone(read_job_id(dst))
+
+        with patch.object(daemon.scheduler, "submit_job", return_value=None):
+            self.assertEqual(daemon.submit_one(dst), name)
+
+        self.assertIsNone(daemon.get_job_id(name))
+        self.assertIsNone(daemon.get_job_ids())
+
+    @run_in_tempdir
+    def test_requeue_job_id(self):
+        self.check_requeue_job_id(self.get_daemon())
+
+    @run_in_tempdir
+    def test_requeue_job_id_journal(self):
+        settings = self.get_settings().model_copy(
+            update={"JOURNAL": True, "JOURNAL_PATH": "journal.db"}
+        )
+        self.copy_example_jobs(settings)
+        daemon = JobDaemon(MockSlurmScheduler(settings), settings, logger_stdout=False)
+        self.check_requeue_job_id(daemon)
+
+    @run_in_tempdir
+    def test_submit_concurrent(self):
+        daemon = self.get_daemon(submit_workers=4)
+        self.add_ready_jobs(daemon, 5)
+        daemon.settings.MAX_PENDING = 10
+
+        submitted = daemon.submit()
+        jobs_ready = daemon.consumer.list_queue(Status.READY.value)
+        jobs_doing = daemon.consumer.list_queue(Status.DOING.value)
+
+        self.assertEqual(len(submitted), 6)
+        self.assertEqual(jobs_ready, [])
+        self.assertEqual(len(jobs_doing), 7)
+
+    @run_in_tempdir
+    def test_submit_concurrent_folders(self):
+        """Each submission runs from its own folder, without changing
+        the working directory of the daemon"""
+        daemon = self.get_daemon(submit_workers=4)
+        self.add_ready_jobs(daemon, 5)
+        daemon.settings.MAX_PENDING = 10
+
+        # prints the folder of the submission and the `--job-name`
+        daemon.scheduler.SUBMIT_CMD = """sh -c 'sleep 0.05; echo "$(basename "$PWD")|$2"' sh"""
+        outputs = []
+
+        def parse_job_id(out):
+            outputs.append(out.strip())
+            return None
+
+        cwd = os.getcwd()
+        with patch.object(daemon.scheduler, "parse_job_id", side_effect=parse_job_id):
+            submitted = daemon.submit()
+
+        self.assertEqual(len(submitted), 6)
+        self.assertEqual(len(outputs), 6)
+        for out in outputs:
+            folder, name = out.split("|")
+            self.assertEqual(name, f"--job-name={folder}")
+
+        self.assertEqual(os.getcwd(), cwd)
+
+    @run_in_tempdir
+    def test_submit_backoff(self):
+        def error_submission(*args, **kwargs):
+            raise SchedulerError("error", returncode=1)
+
+        daemon = self.get_daemon(error_sleep=1000)
+        self.add_ready_jobs(daemon, 1)
+        daemon.settings.MAX_PENDING = 10
+        submit_job = daemon.scheduler.submit_job
+        daemon.scheduler.submit_job = error_submission
+
+        start = time.monotonic()
+        submitted = daemon.submit()
+        self.assertEqual(submitted, [])
+        self.assertLess(time.monotonic() - start, 10)
+
+        # all submissions failed: the jobs and the error class back off
+        job = "test_recipe_7615c560_1658944102"
+        self.assertFalse(daemon.job_backoff.ready(job))
+        self.assertTrue(daemon.error_backoff.blocked(("SchedulerError", 1)))
+
+        daemon.scheduler.submit_job = submit_job
+        self.assertEqual(daemon.submit(), [])
+
+        daemon.error_backoff.reset()
+        self.assertEqual(daemon.get_ready_folders(10), [])
+
+        daemon.job_backoff.success(job)
+        self.assertEqual(daemon.submit(), [job])
+
+    @run_in_tempdir
+    def test_submit_bad_job(self):
+        bad_job = "test_recipe_7615c560_1658944102"
+        submit_job = MockSlurmScheduler.submit_job
+
+        def submission(scheduler, folder, *args, **kwargs):
+            if os.path.basename(folder) == bad_job:
+                raise SchedulerError("invalid script", returncode=1)
+
+            return submit_job(scheduler, folder, *args, **kwargs)
+
+        daemon = self.get_daemon(error_sleep=1000)
+        self.add_ready_jobs(daemon, 3)
+        daemon.settings.MAX_PENDING = 10
+
+        with patch.object(MockSlurmScheduler, "submit_job", submission):
+            submitted = daemon.submit()
+            self.assertEqual(len(submitted), 3)
+            self.assertNotIn(bad_job, submitted)
+
+            # only the bad job backs off, other jobs are still submitted
+            self.assertTrue(daemon.job_backoff.blocked(bad_job))
+            self.assertEqual(daemon.error_backoff.waiting(), [])
+
+            self.add_ready_jobs_named(daemon, ["new_recipe_1"])
+            self.assertEqual(daemon.submit(), ["new_recipe_1"])
+            self.assertEqual(daemon.consumer.list_queue(Status.READY.value), [bad_job])
+
     @run_in_tempdir
     def test_process_done(self):
         done_info = SchedulerJob(
@@ -98,6 +388,33 @@ class TestDaemon(ut.TestCase):
         done = daemon.process_done()
         self.assertEqual(done, ["test_recipe_9c60037b_1658944102"])
 
+    @run_in_tempdir
+    def test_journal(self):
+        settings = self.get_settings().model_copy(
+            update={"JOURNAL": True, "JOURNAL_PATH": "journal.db"}
+        )
+        self.copy_example_jobs(settings)
+        daemon = JobDaemon(MockSlurmScheduler(settings), settings, logger_stdout=False)
+
+        # the jobs copied to the queues are found when reconciling
+        name = "test_recipe_9c60037b_1658944102"
+        self.assertEqual(daemon.list_queue(Status.DOING.value), {name})
+
+        done_info = SchedulerJob(
+            id=1011123,
+            name=name,
+            start_time="2022-07-26",
+            partition="pdebug",
+            group="normal",
+            status="COMPLETED",
+        )
+        daemon.scheduler = Mock()
+        daemon.scheduler.get_done.return_value = [done_info]
+
+        self.assertEqual(daemon.process_done(), [name])
+        self.assertEqual(daemon.journal.get(name)["status"], Status.DONE.value)
+        self.assertEqual(daemon.list_queue(Status.DOING.value), set())
+
     @run_in_tempdir
     def test_process_error(self):
         info = SchedulerJob(
@@ -137,3 +454,116 @@ class TestDaemon(ut.TestCase):
 
         error = daemon.process_failed()
         self.assertEqual(error, ["test_recipe_9c60037b_1658944102"])
+
+    @run_in_tempdir
+    def test_process_duplicates(self):
+        info = SchedulerJob(
+            id=1011123,
+            name="test_recipe_9c60037b_1658944102",
+            start_time="2022-07-26",
+            partition="pdebug",
+            group="normal",
+            status="PREEMPTED",
+        )
+
+        daemon = self.get_daemon()
+        moved = daemon.process_jobs([info, info], Status.DOING.value, Status.READY.value)
+        self.assertEqual(moved, ["test_recipe_9c60037b_1658944102"])
+
+    @run_in_tempdir
+    def test_process_lost(self):
+        name = "test_recipe_9c60037b_1658944102"
+        daemon = self.get_daemon()
+        doing = daemon.producer.item_path(Status.DOING.value, name)
+
+        # missing jobs are only lost after the grace period
+        daemon.settings.LOST_JOB_GRACE = 1000
+        self.assertEqual(daemon.process_lost(), [])
+        self.assertIn(name, daemon.missing)
+
+        # jobs reported by ID are not missing
+        write_job_id(doing, "1010205")
+        self.assertEqual(daemon.process_lost(), [])
+        self.assertEqual(daemon.missing, {})
+
+        write_job_id(doing, "1")
+        daemon.settings.LOST_JOB_GRACE = 0
+        open(os.path.join(doing, "mkwind-complete"), "w").close()
+        self.assertEqual(daemon.process_lost(), [name])
+        self.assertIn(name, daemon.consumer.list_queue(Status.DONE.value))
+
+    @run_in_tempdir
+    def test_process_lost_pilot(self):
+        name = "test_recipe_9c60037b_1658944102"
+        daemon = self.get_daemon()
+        daemon.settings.LOST_JOB_GRACE = 0
+        doing = daemon.producer.item_path(Status.DOING.value, name)
+
+        # jobs of running pilots, or of pilots with unknown IDs, are not lost
+        write_pilot_id(doing, "1010205")
+        self.assertEqual(daemon.process_lost(), [])
+
+        write_pilot_id(doing, None)
+        self.assertEqual(daemon.process_lost(), [])
+
+        write_pilot_id(doing, "1")
+        self.assertEqual(daemon.process_lost(), [name])
+
+    @run_in_tempdir
+    def test_process_lost_requeue(self):
+        name = "test_recipe_9c60037b_1658944102"
+        daemon = self.get_daemon()
+        daemon.settings.LOST_JOB_GRACE = 0
+
+        self.assertEqual(daemon.process_lost(), [name])
+        self.assertIn(name, daemon.consumer.list_queue(Status.READY.value))
+
+    @run_in_tempdir
+    def test_submit_array(self):
+        daemon = self.get_daemon(array_submission=True)
+        self.add_ready_jobs(daemon, 2)
+        daemon.settings.MAX_PENDING = 10
+
+        with patch.object(daemon.scheduler, "submit_array") as submit_array:
+            submitted = daemon.submit()
+
+        self.assertEqual(len(submitted), 3)
+        self.assertEqual(submit_array.call_count, 1)
+        script, name, n_tasks = submit_array.call_args.args
+        self.assertEqual(n_tasks, 3)
+        self.assertEqual(daemon.consumer.list_queue(Status.READY.value), [])
+
+        # array tasks are mapped back to their folders
+        info = SchedulerJob(
+            id=1011123,
+            name=name,
+            start_time="2022-07-26",
+            partition="pdebug",
+            group="normal",
+            status="COMPLETED",
+            array_index=2,
+        )
+        mock_scheduler = Mock()
+        mock_scheduler.get_done.return_value = [info]
+        daemon.scheduler = mock_scheduler
+
+        done = daemon.process_done()
+        self.assertEqual(done, [daemon.arrays.resolve(name, 2)])
+        self.assertIn(done[0], submitted)
+
+    @run_in_tempdir
+    def test_submit_array_with_error(self):
+        def error_submission(*args, **kwargs):
+            raise SchedulerError("error")
+
+        daemon = self.get_daemon(array_submission=True)
+        self.add_ready_jobs(daemon, 2)
+        daemon.scheduler.submit_array = error_submission
+        daemon.error_sleep = 0
+
+        submitted = daemon.submit()
+        jobs_ready = daemon.consumer.list_queue(Status.READY.value)
+
+        self.assertEqual(submitted, [])
+        self.assertEqual(len(jobs_ready), 3)
+        self.assertEqual(os.listdir(daemon.arrays.root), [])
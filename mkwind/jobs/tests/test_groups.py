@@ -0,0 +1,121 @@
+import os
+import subprocess
+import unittest as ut
+
+from mkite_core.tests.tempdirs import run_in_tempdir
+
+from mkwind.templates import Template
+from mkwind.jobs.groups import JobArray, JobBundle, GroupRegistry, scale_resource
+
+
+SETTINGS = {
+    "nodes": 1,
+    "tasks_per_node": 8,
+    "walltime": "30:00",
+    "partition": "pdebug",
+}
+
+
+class TestGroups(ut.TestCase):
+    def setUp(self):
+        self.template = Template.from_name("slurm.sh")
+        self.folders = ["/queue-doing/job_a", "/queue-doing/job_b"]
+
+    def get_registry(self):
+        return GroupRegistry(os.path.abspath(".arrays"), group_cls=JobArray)
+
+    @run_in_tempdir
+    def test_write(self):
+        registry = self.get_registry()
+        array = registry.create(
+            self.folders, self.template, SETTINGS, task_var="SLURM_ARRAY_TASK_ID"
+        )
+
+        with open(array.manifest, "r") as f:
+            self.assertEqual(f.read().split(), self.folders)
+
+        with open(array.script, "r") as f:
+            script = f.read()
+
+        self.assertIn("#SBATCH --partition=pdebug", script)
+        self.assertIn("${SLURM_ARRAY_TASK_ID}p", script)
+
+        loaded = JobArray.from_folder(array.path)
+        self.assertEqual(loaded.name, array.name)
+        self.assertEqual(loaded.folders, self.folders)
+
+    @run_in_tempdir
+    def test_resolve(self):
+        registry = self.get_registry()
+        array = registry.create(
+            self.folders, self.template, SETTINGS, task_var="SLURM_ARRAY_TASK_ID"
+        )
+
+        # registry loaded from the disk
+        registry = self.get_registry()
+        self.assertEqual(registry.resolve(array.name, 1), "job_a")
+        self.assertEqual(registry.resolve(array.name, 2), "job_b")
+        self.assertIsNone(registry.resolve(array.name, 3))
+        self.assertIsNone(registry.resolve("job_a", 1))
+
+    @run_in_tempdir
+    def test_cleanup(self):
+        registry = self.get_registry()
+        array = registry.create(
+            self.folders, self.template, SETTINGS, task_var="SLURM_ARRAY_TASK_ID"
+        )
+
+        self.assertEqual(registry.cleanup(["job_b"]), [])
+        self.assertTrue(os.path.exists(array.path))
+
+        self.assertEqual(registry.cleanup([]), [array.name])
+        self.assertFalse(os.path.exists(array.path))
+
+    @run_in_tempdir
+    def test_bundle(self):
+        registry = GroupRegistry(os.path.abspath(".bundles"), group_cls=JobBundle)
+        bundle = registry.create(
+            self.folders, self.template, SETTINGS, ntasks_var="SLURM_NTASKS"
+        )
+        self.assertTrue(bundle.name.startswith(JobBundle.PREFIX))
+
+        with open(bundle.script, "r") as f:
+            script = f.read()
+
+        self.assertIn("#SBATCH --ntasks=16", script)
+        self.assertNotIn("--ntasks-per-node", script)
+        self.assertIn("SLURM_NTASKS=8 bash job.sh", script)
+
+    @run_in_tempdir
+    def test_bundle_run(self):
+        folders = [os.path.abspath(name) for name in ["job_a", "job_b", "job_c"]]
+        for folder, code in zip(folders, [0, 3]):
+            os.mkdir(folder)
+            with open(os.path.join(folder, Template.FILENAME), "w") as f:
+                f.write(f"exit {code}\n")
+
+        bundle = JobBundle("bundle", os.path.abspath("bundle"), folders)
+        bundle.write(Template.from_name("local.sh"), SETTINGS, ntasks_var="NTASKS")
+        subprocess.run(["bash", bundle.script], check=True)
+
+        self.assertEqual(bundle.get_exit_status(folders[0]), 0)
+        self.assertEqual(bundle.get_exit_status(folders[1]), 3)
+        self.assertIsNone(bundle.get_exit_status(folders[2]))
+
+    def test_bundle_resources(self):
+        self.assertEqual(scale_resource("gpu:a100:2", 3), "gpu:a100:6")
+        self.assertEqual(scale_resource("16G", 2), "32G")
+        self.assertEqual(scale_resource("gpu:1,nvme:100", 2), "gpu:2,nvme:200")
+        self.assertEqual(scale_resource(4, 2), 8)
+
+        settings = {**SETTINGS, "gpus": "4", "gres": "gpu:4", "memory": "64G"}
+        bundle = JobBundle("bundle", "bundle", self.folders)
+        scaled = bundle.get_settings(settings)
+        self.assertEqual(scaled["gpus"], "8")
+        self.assertEqual(scaled["gres"], "gpu:8")
+        self.assertEqual(scaled["memory"], "128G")
+
+        self.assertTrue(JobBundle.can_bundle(settings))
+        self.assertFalse(JobBundle.can_bundle({**SETTINGS, "gres": "gpu"}))
+        self.assertFalse(JobBundle.can_bundle({**SETTINGS, "gpus_per_node": 4}))
+        self.assertFalse(JobBundle.can_bundle(None))
@@ -0,0 +1,40 @@
+import unittest as ut
+
+from mkwind.jobs.throttle import SubmitThrottle
+
+
+class TestSubmitThrottle(ut.TestCase):
+    def setUp(self):
+        self.throttle = SubmitThrottle(window=10, increase=5, slow_latency=10)
+
+    def test_free_slots(self):
+        self.assertEqual(SubmitThrottle.get_free_slots(5, 0, 40, 400), 35)
+        self.assertEqual(SubmitThrottle.get_free_slots(5, 390, 40, 400), 5)
+        self.assertEqual(SubmitThrottle.get_free_slots(50, 0, 40, 400), 0)
+
+    def test_limit(self):
+        self.assertEqual(self.throttle.limit(0, 0, 40, 400), 10)
+        self.assertEqual(self.throttle.limit(35, 0, 40, 400), 5)
+
+    def test_increase(self):
+        self.assertEqual(self.throttle.update(10), 15)
+        self.assertEqual(self.throttle.update(3), 15)
+        self.assertEqual(self.throttle.update(15, max_window=18), 18)
+
+    def test_failure(self):
+        self.throttle.failure()
+        self.throttle.failure()
+        self.assertEqual(self.throttle.update(10), 5)
+
+        # failures are only counted once
+        self.assertEqual(self.throttle.update(5), 10)
+
+        for _ in range(5):
+            self.throttle.failure()
+            self.throttle.update(0)
+
+        self.assertEqual(self.throttle.window, 1)
+
+    def test_slow_scheduler(self):
+        self.assertEqual(self.throttle.update(10, latency=30), 8)
+        self.assertEqual(self.throttle.update(8, latency=1), 13)
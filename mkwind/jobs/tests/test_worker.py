@@ -0,0 +1,131 @@
+import os
+import time
+import unittest as ut
+from unittest.mock import Mock, patch
+from distutils.dir_util import copy_tree
+from pkg_resources import resource_filename
+
+from mkite_core.models import Status
+from mkite_core.external import load_config
+from mkite_core.tests.tempdirs import run_in_tempdir
+from mkite_engines import EngineRoles, instantiate_from_path
+
+from mkwind.user import EnvSettings
+from mkwind.user.journal import JobJournal
+from mkwind.jobs.daemon import JobDaemon
+from mkwind.jobs.worker import PilotWorker, parse_walltime, read_pilot_id
+from mkwind.schedulers.tests.test_slurm import MockSlurmScheduler
+
+
+EXAMPLE_JOBS_PATH = resource_filename("mkwind.tests.files", "example_jobs")
+SETTINGS = resource_filename("mkwind.tests.files", "settings.yaml")
+ENGINE = resource_filename("mkwind.tests.files.engines", "local.yaml")
+JOB_NAME = "test_recipe_7615c560_1658944102"
+
+
+class TestWorker(ut.TestCase):
+    def get_worker(self, script: str, **kwargs):
+        settings = EnvSettings.from_file(SETTINGS)
+        engine_cfg = load_config(ENGINE)
+        copy_tree(str(EXAMPLE_JOBS_PATH), str(engine_cfg["root_path"]))
+
+        consumer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
+        producer = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
+        producer.move = True
+        consumer.delay = 0
+
+        ready = consumer.get_queue_path(Status.READY.value)
+        with open(os.path.join(ready, JOB_NAME, "job.sh"), "w") as f:
+            f.write(script)
+
+        postproc = Mock()
+        postproc.postprocess_one.return_value = True
+
+        return PilotWorker(
+            postproc=postproc,
+            consumer=consumer,
+            producer=producer,
+            idle=0,
+            poll_interval=0.05,
+            **kwargs,
+        )
+
+    def test_parse_walltime(self):
+        self.assertEqual(parse_walltime("30"), 1800)
+        self.assertEqual(parse_walltime("01:30"), 5400)
+        self.assertEqual(parse_walltime("01:00:10"), 3610)
+        self.assertEqual(parse_walltime("1-00:00:00"), 86400)
+
+    @run_in_tempdir
+    def test_run(self):
+        worker = self.get_worker("touch worker-ran\n", pilot_id="1011")
+        worker.run()
+
+        doing = worker.producer.get_queue_path(Status.DOING.value)
+        folder = os.path.join(doing, JOB_NAME)
+        self.assertTrue(os.path.exists(os.path.join(folder, "worker-ran")))
+        self.assertEqual(read_pilot_id(folder), (True, "1011"))
+        worker.postproc.postprocess_one.assert_called_once_with(folder)
+        self.assertEqual(worker.consumer.list_queue(Status.READY.value), [])
+
+    @run_in_tempdir
+    def test_walltime(self):
+        worker = self.get_worker("sleep 30\n", walltime=1.5, margin=1, grace=1)
+
+        start = time.monotonic()
+        worker.run()
+        self.assertLess(time.monotonic() - start, 10)
+
+        # the unfinished job is returned to the READY queue
+        worker.postproc.postprocess_one.assert_not_called()
+        self.assertEqual(worker.consumer.list_queue(Status.READY.value), [JOB_NAME])
+
+        ready = worker.consumer.get_queue_path(Status.READY.value)
+        self.assertEqual(read_pilot_id(os.path.join(ready, JOB_NAME)), (False, None))
+
+    @run_in_tempdir
+    def test_claim_taken(self):
+        worker = self.get_worker("true\n")
+        ready = worker.consumer.get_queue_path(Status.READY.value)
+        folder = os.path.join(ready, JOB_NAME)
+
+        # another pilot claimed the job after it was listed
+        taken = os.path.join(ready, "taken_recipe_1_1")
+        listed = [("taken", taken), ("job", folder)]
+        with patch.object(worker.consumer, "get_n", return_value=iter(listed)):
+            claimed = worker.claim_local()
+
+        expected = worker.producer.item_path(Status.DOING.value, JOB_NAME)
+        self.assertEqual(claimed, expected)
+        self.assertTrue(os.path.isdir(expected))
+
+        with patch.object(worker.consumer, "get_n", return_value=iter([("taken", taken)])):
+            self.assertIsNone(worker.claim_local())
+
+    @run_in_tempdir
+    def test_journal(self):
+        """A journal-backed daemon sees the jobs claimed, finished and
+        returned by a pilot without reconciling again"""
+        settings = EnvSettings.from_file(SETTINGS).model_copy(
+            update={"JOURNAL": True, "JOURNAL_PATH": "journal.db"}
+        )
+        worker = self.get_worker("true\n", pilot_id="1011")
+        daemon = JobDaemon(MockSlurmScheduler(settings), settings, logger_stdout=False)
+        self.assertIn(JOB_NAME, daemon.list_queue(Status.READY.value))
+
+        # the pilot runs in another process, with its own connection
+        worker.journal = JobJournal("journal.db")
+        folder = worker.claim_local()
+        self.assertNotIn(JOB_NAME, daemon.list_queue(Status.READY.value))
+        self.assertIn(JOB_NAME, daemon.list_queue(Status.DOING.value))
+        self.assertEqual(daemon.get_job_id(JOB_NAME), "1011")
+
+        worker.restore(folder)
+        self.assertIn(JOB_NAME, daemon.list_queue(Status.READY.value))
+        self.assertNotIn(JOB_NAME, daemon.list_queue(Status.DOING.value))
+
+        worker.run()
+        self.assertNotIn(JOB_NAME, daemon.list_queue(Status.READY.value))
+        self.assertNotIn(JOB_NAME, daemon.list_queue(Status.DOING.value))
+        self.assertEqual(daemon.journal.get(JOB_NAME)["status"], Status.DONE.value)
+        self.assertEqual(daemon.journal.get(JOB_NAME)["scheduler_id"], "1011")
@@ -0,0 +1,68 @@
+import threading
+from typing import Optional
+
+
+class SubmitThrottle:
+    """Decides how many jobs can be submitted in each cycle. The number
+    of submissions never exceeds the free slots given by the hard caps
+    (`max_pending` jobs pending and `max_running` jobs pending or running)
+    nor an adaptive window. The window grows by `increase` after each
+    cycle that used it fully, and is halved after cycles with submission
+    errors. Cycles in which querying the scheduler took longer than
+    `slow_latency` seconds shrink the window by a quarter."""
+
+    def __init__(
+        self,
+        window: int = 40,
+        increase: int = 5,
+        min_window: int = 1,
+        slow_latency: float = 10,
+    ):
+        self.min_window = max(min_window, 1)
+        self.window = max(window, self.min_window)
+        self.increase = increase
+        self.slow_latency = slow_latency
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_free_slots(
+        n_pending: int, n_running: int, max_pending: int, max_running: int
+    ) -> int:
+        """Number of jobs that can be submitted without exceeding the
+        hard caps. Submitted jobs start as pending and eventually run."""
+        free_pending = max_pending - n_pending
+        free_running = max_running - n_running - n_pending
+        return max(min(free_pending, free_running), 0)
+
+    def limit(
+        self, n_pending: int, n_running: int, max_pending: int, max_running: int
+    ) -> int:
+        free = self.get_free_slots(n_pending, n_running, max_pending, max_running)
+        return min(free, self.window)
+
+    def failure(self):
+        """Registers a failed submission in the current cycle"""
+        with self._lock:
+            self._failures += 1
+
+    def update(self, n_submitted: int, latency: Optional[float] = None, max_window: int = None) -> int:
+        """Adapts the window to the outcome of the cycle and returns it"""
+        with self._lock:
+            failures = self._failures
+            self._failures = 0
+
+        if failures > 0:
+            window = self.window // 2
+        elif latency is not None and latency > self.slow_latency:
+            window = self.window - self.window // 4
+        elif n_submitted >= self.window:
+            window = self.window + self.increase
+        else:
+            window = self.window
+
+        if max_window is not None:
+            window = min(window, max_window)
+
+        self.window = max(window, self.min_window)
+        return self.window
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import shutil
+import subprocess
+from typing import Dict, List, Optional, Tuple, Union
+
+from mkite_core.models import JobInfo, Status
+from mkite_engines import BaseConsumer, LocalProducer
+from mkwind.user import Logger, LoggerLevel
+from mkwind.user.journal import JobJournal
+from mkwind.builder import JobBuilder, JobSettings
+from mkwind.postprocess import JobPostprocessor
+from mkwind.templates import Template
+
+from .groups import JobBundle
+
+
+# marks the jobs in DOING that are run by a pilot, with the scheduler ID
+# of the pilot, such that the JobDaemon does not consider them lost
+PILOT_NAME = "mkwind-pilot"
+CLAIM_BATCH = 10
+
+
+def write_pilot_id(folder: os.PathLike, pilot_id: Optional[str]):
+    with open(os.path.join(folder, PILOT_NAME), "w") as f:
+        f.write(f"{pilot_id or ''}\n")
+
+
+def read_pilot_id(folder: os.PathLike) -> Tuple[bool, Optional[str]]:
+    """Returns whether the job in `folder` is run by a pilot and the
+    scheduler ID of the pilot, if known"""
+    path = os.path.join(folder, PILOT_NAME)
+    if not os.path.exists(path):
+        return False, None
+
+    with open(path, "r") as f:
+        return True, f.read().strip() or None
+
+
+def parse_walltime(walltime: str) -> int:
+    """Converts a walltime in the format `[D-]HH:MM:SS`, `HH:MM` or
+    `MM` into seconds"""
+    days = 0
+    if "-" in walltime:
+        days, walltime = walltime.split("-")
+        days = int(days)
+
+    parts = [int(p) for p in walltime.split(":")]
+    if len(parts) == 1:
+        seconds = parts[0] * 60
+    elif len(parts) == 2:
+        seconds = parts[0] * 3600 + parts[1] * 60
+    else:
+        seconds = parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+    return days * 86400 + seconds
+
+
+class PilotWorker:
+    """Runs jobs inside an existing allocation of the scheduler. The
+    worker keeps claiming jobs, either by building them from the
+    external engine (`builder`) or by taking them from the local READY
+    queue (`consumer`/`producer`), and runs up to `max_jobs` of them at
+    the same time. Each job is postprocessed as soon as it finishes.
+
+    New jobs are not claimed once less than `margin` seconds remain in
+    the walltime. Jobs still running `grace` seconds before the end of
+    the walltime are terminated and returned to their queues.
+
+    Claimed jobs are marked with `pilot_id`, the scheduler ID of the
+    allocation, such that the JobDaemon does not consider them lost.
+    The moves between the local queues are recorded in the `journal`
+    of the local engine, if given, such that the daemons sharing it
+    see the jobs claimed and finished by the pilot.
+    """
+
+    def __init__(
+        self,
+        postproc: JobPostprocessor,
+        builder: JobBuilder = None,
+        consumer: BaseConsumer = None,
+        producer: LocalProducer = None,
+        recipe: str = None,
+        max_jobs: int = 1,
+        walltime: float = None,
+        margin: float = 300,
+        grace: float = 60,
+        idle: float = 60,
+        poll_interval: float = 5,
+        ntasks_var: str = None,
+        pilot_id: str = None,
+        logger: Logger = None,
+        journal: JobJournal = None,
+    ):
+        self.postproc = postproc
+        self.builder = builder
+        self.consumer = consumer
+        self.producer = producer
+        self.recipe = recipe
+        self.max_jobs = max(max_jobs, 1)
+        self.margin = margin
+        self.grace = grace
+        self.idle = idle
+        self.poll_interval = poll_interval
+        self.ntasks_var = ntasks_var
+        self.pilot_id = pilot_id
+        self.logger = logger if logger is not None else Logger([])
+        self.journal = journal
+
+        self.deadline = None
+        if walltime is not None:
+            self.deadline = time.monotonic() + walltime
+
+        self.running: Dict[str, subprocess.Popen] = {}
+
+    def log(self, msg: str, level: LoggerLevel = LoggerLevel.INFO):
+        self.logger.log(msg, level=level)
+
+    def record(self, folder: os.PathLike, dst: Status, src: Status, scheduler_id: str = None):
+        if self.journal is not None:
+            self.journal.record(
+                os.path.basename(folder), dst, src=src, scheduler_id=scheduler_id
+            )
+
+    @property
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return float("inf")
+
+        return self.deadline - time.monotonic()
+
+    def accepting(self) -> bool:
+        return self.remaining > self.margin
+
+    def expired(self) -> bool:
+        return self.remaining <= self.grace
+
+    def claim(self) -> Union[os.PathLike, None]:
+        """Returns the folder of a new job to run, or None if no job is available"""
+        if self.builder is not None:
+            return self.claim_external()
+
+        return self.claim_local()
+
+    def claim_external(self) -> Union[os.PathLike, None]:
+        if self.recipe is not None:
+            queues = [self.recipe]
+        else:
+            queues = self.builder.get_src_queues(allowed_only=True)
+
+        for queue in queues:
+            key, info, folder = self.builder.build_one(queue)
+            if folder is not None:
+                return folder
+
+        return None
+
+    def claim_local(self) -> Union[os.PathLike, None]:
+        """Claims a READY job with a single rename into DOING. If other
+        pilots claimed the job first, tries the next one."""
+        for key, folder in self.consumer.get_n(Status.READY.value, n=CLAIM_BATCH):
+            dst = self.producer.item_path(Status.DOING.value, folder)
+            try:
+                os.rename(folder, dst)
+            except OSError:
+                continue
+
+            self.record(dst, Status.DOING, src=Status.READY, scheduler_id=self.pilot_id)
+            return dst
+
+        return None
+
+    def get_env(self, folder: os.PathLike) -> dict:
+        """Limits the number of tasks seen by the job to its own share"""
+        env = dict(os.environ)
+        path = os.path.join(folder, JobSettings.file_name())
+        if self.ntasks_var is None or not os.path.exists(path):
+            return env
+
+        with open(path, "r") as f:
+            settings = json.load(f)
+
+        env[self.ntasks_var] = str(JobBundle.get_ntasks(settings))
+        return env
+
+    def start(self, folder: os.PathLike):
+        write_pilot_id(folder, self.pilot_id)
+        with open(os.path.join(folder, "mkwind-worker.out"), "w") as out:
+            proc = subprocess.Popen(
+                ["bash", Template.FILENAME],
+                cwd=folder,
+                env=self.get_env(folder),
+                stdout=out,
+                stderr=subprocess.STDOUT,
+            )
+
+        self.running[folder] = proc
+        self.log(f"started job {os.path.basename(folder)}")
+
+    def fill(self) -> int:
+        """Claims jobs until `max_jobs` are running. Returns the number
+        of jobs that were started."""
+        started = 0
+        while len(self.running) < self.max_jobs:
+            folder = self.claim()
+            if folder is None:
+                break
+
+            self.start(folder)
+            started += 1
+
+        return started
+
+    def poll(self) -> List[os.PathLike]:
+        """Postprocesses the jobs that finished"""
+        finished = [f for f, proc in self.running.items() if proc.poll() is not None]
+
+        for folder in finished:
+            proc = self.running.pop(folder)
+            name = os.path.basename(folder)
+            self.log(f"job {name} finished with exit status {proc.returncode}")
+            if self.builder is None:
+                self.record(folder, Status.DONE, src=Status.DOING)
+
+            if not self.postproc.postprocess_one(folder):
+                self.log(f"job {name} could not be postprocessed", level=LoggerLevel.ERROR)
+
+        return finished
+
+    def restore(self, folder: os.PathLike):
+        """Returns an unfinished job to the queue it was claimed from"""
+        marker = os.path.join(folder, PILOT_NAME)
+        if os.path.exists(marker):
+            os.remove(marker)
+
+        if self.builder is None:
+            self.producer.push(Status.READY.value, folder)
+            self.record(folder, Status.READY, src=Status.DOING)
+            return
+
+        info = JobInfo.from_json(os.path.join(folder, JobInfo.file_name()))
+        recipe = info.recipe.get("name")
+        self.postproc.dst.push_info(recipe, info, status=Status.READY.value)
+        shutil.rmtree(folder)
+
+    def terminate(self) -> List[os.PathLike]:
+        """Stops all running jobs and returns them to their queues"""
+        terminated = list(self.running.keys())
+        for folder, proc in self.running.items():
+            proc.terminate()
+            proc.wait()
+            self.restore(folder)
+            self.log(f"job {os.path.basename(folder)} terminated and returned to the queue")
+
+        self.running = {}
+        return terminated
+
+    def run(self):
+        self.log("starting pilot worker")
+        idle_since = None
+
+        while True:
+            started = self.fill() if self.accepting() else 0
+            self.poll()
+
+            if self.expired():
+                self.log("walltime is almost over")
+                self.terminate()
+                break
+
+            if started == 0 and not self.running:
+                if not self.accepting():
+                    break
+
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= self.idle:
+                    self.log("no jobs available")
+                    break
+            else:
+                idle_since = None
+
+            time.sleep(self.poll_interval)
+
+        self.log("stopping pilot worker")
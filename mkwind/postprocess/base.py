@@ -1,11 +1,23 @@
 import os
+import json
 import shutil
-import subprocess
+import multiprocessing
+from typing import List, Optional, Tuple
 from tempfile import TemporaryDirectory
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from mkite_core.models import JobInfo, JobResults, Status
 from mkite_core.plugins import get_recipe
-from mkite_engines import BaseConsumer, BaseProducer
+from mkite_engines import BaseConsumer, BaseProducer, LocalProducer
+from mkwind.user import Logger, LoggerLevel
+from mkwind.user.journal import JobJournal, get_recipe_name
+from mkwind.builder.settings import AllJobSettings, ArchiveRules
+
+from .codecs import ArchiveCodec, get_codec, compress_folder_python
+from .store import BlobStore
+
+
+MANIFEST_NAME = "mkwind-archive.json"
 
 
 class PostprocessError(Exception):
@@ -21,15 +33,30 @@ class JobPostprocessor:
         archive_engine: BaseProducer,
         compress: bool = True,
         allow_restart: bool = False,
+        journal: JobJournal = None,
+        workers: int = 1,
+        codec: ArchiveCodec = None,
+        recipe_settings: AllJobSettings = None,
+        store: BlobStore = None,
+        logger: Logger = None,
     ):
         self.src = src_engine
         self.dst = dst_engine
         self.err = error_engine
         self.archive = archive_engine
         self.compress = compress
+        self.codec = codec if compress and codec is not None else get_codec(compress=compress)
         self.allow_restart = allow_restart
+        self.journal = journal
+        self.workers = max(workers, 1)
+        self.recipe_settings = recipe_settings
+        self.store = store
+        self.logger = logger if logger is not None else Logger([])
 
     def postprocess_all(self):
+        if self.workers > 1:
+            return self.postprocess_parallel(list(self.src.get_n(Status.DONE.value)))
+
         done = []
         errors = []
 
@@ -44,6 +71,55 @@ class JobPostprocessor:
 
         return done, errors
 
+    def postprocess_parallel(self, items: List[Tuple[str, str]]):
+        """Postprocesses the (key, folder) `items` with a pool of `workers`
+        processes. The workers read the results and compress the folders,
+        while this process pushes the results and archives to the engines
+        and sends the folders with errors to `on_error`."""
+        done = []
+        errors = []
+        if not items:
+            return done, errors
+
+        base_path = os.path.dirname(os.path.abspath(items[0][1]))
+        archive_dir = self.get_archive_dir()
+
+        # hidden, such that it is not listed as a job of the queue
+        with TemporaryDirectory(prefix=".mkwind-", dir=base_path) as tmp:
+            # spawned, as the daemons may be running other threads
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                futures = {
+                    pool.submit(
+                        archive_job,
+                        folder,
+                        os.path.join(tmp, str(i)),
+                        self.codec,
+                        archive_dir,
+                        self.get_archive_rules(folder),
+                        self.store,
+                    ): (key, folder)
+                    for i, (key, folder) in enumerate(items)
+                }
+
+                for future in as_completed(futures):
+                    key, folder = futures[future]
+                    try:
+                        info, jobid, tar_path = future.result()
+                        self.push_info_to_parsing(info)
+                        if archive_dir is None and self.store is None:
+                            self.archive.push(Status.ARCHIVE.value, tar_path)
+
+                        shutil.rmtree(folder)
+                        self.record(folder, Status.ARCHIVE, src=Status.DONE)
+                        done.append(key)
+
+                    except (PostprocessError, FileNotFoundError) as e:
+                        self.on_error(folder)
+                        errors.append(key)
+
+        return done, errors
+
     def postprocess_one(self, folder: str):
         try:
             self.postprocess_job(folder)
@@ -68,60 +144,97 @@ class JobPostprocessor:
             raise PostprocessError(f"Could not decode JobInfo. Error: {e}")
 
     def get_jobresults(self, folder: os.PathLike):
-        results_file = os.path.join(folder, JobResults.file_name())
-
-        if not os.path.exists(results_file):
-            raise FileNotFoundError(f"Results {JobResults.file_name()} does not exist")
-
-        try:
-            info = JobResults.from_json(results_file)
-            return info
-
-        except Exception as e:
-            raise PostprocessError(f"Could not decode JobResults. Error: {e}")
+        return get_jobresults(folder)
 
     def postprocess_job(self, folder: os.PathLike, delete: bool = True):
         info = self.get_jobresults(folder)
         jobid = self.get_jobid(info, folder)
         self.push_info_to_parsing(info)
-        self.compress_folder(folder, name=jobid)
+        rules = self.get_archive_rules(folder)
+        if self.store is not None:
+            store_folder(self.store, folder, jobid, rules=rules)
+        else:
+            self.compress_folder(folder, name=jobid, rules=rules)
 
         if delete:
             shutil.rmtree(folder)
 
+        self.record(folder, Status.ARCHIVE, src=Status.DONE)
         return jobid
 
-    def get_jobid(self, info: JobResults, folder: os.PathLike):
-        if "uuid" in info.job:
-            return info.job["uuid"]
+    def record(self, folder: os.PathLike, dst: Status, src: Status = None):
+        if self.journal is not None:
+            self.journal.record(os.path.basename(folder), dst, src=src)
 
-        elif "id" in info.job:
-            return str(info.job["id"])
-
-        return os.path.basename(folder)
+    def get_jobid(self, info: JobResults, folder: os.PathLike):
+        return get_jobid(info, folder)
 
     def push_info_to_parsing(self, info: JobResults):
         return self.dst.push_info(
             Status.PARSING.value, info, status=Status.PARSING.value
         )
 
+    def get_archive_rules(self, folder: os.PathLike) -> Optional[ArchiveRules]:
+        """Returns the archive rules of the recipe of the job in `folder`,
+        whose name has the format `{recipe}_{uuid}_{timestamp}`. Invalid
+        rules are ignored, such that no file is dropped by mistake."""
+        if self.recipe_settings is None:
+            return None
+
+        recipe = get_recipe_name(os.path.basename(os.path.abspath(folder)))
+        try:
+            return self.recipe_settings.get_archive_rules(recipe)
+        except ValueError as e:
+            self.logger.log(
+                f"invalid archive rules for {recipe}, archiving all files: {e}",
+                level=LoggerLevel.ERROR,
+            )
+
+        return None
+
+    def get_archive_dir(self) -> Optional[str]:
+        """Returns the path of the archive queue if the archive engine
+        is local, such that archives can be written there directly.
+        Returns None for other engines."""
+        if not isinstance(self.archive, LocalProducer):
+            return None
+
+        if Status.ARCHIVE.value not in self.archive.queues:
+            self.archive.add_queue(Status.ARCHIVE.value)
+
+        return self.archive.get_queue_path(Status.ARCHIVE.value)
+
     def compress_folder(
         self,
         folder: os.PathLike,
         name: str = None,
-        compresslevel: int = 6,
+        compresslevel: int = None,
+        rules: ArchiveRules = None,
     ) -> os.PathLike:
+        """Archives the folder with the codec of the postprocessor. If
+        given, `compresslevel` overrides the level of the codec and only
+        the files selected by `rules` are archived. Local archive engines
+        receive the archive directly in their queue."""
         if name is None:
             name = os.path.basename(folder)
 
-        if not name.endswith(".tar.gz"):
-            name += ".tar.gz"
+        name = self.codec.get_name(name)
+
+        archive_dir = self.get_archive_dir()
+        if archive_dir is not None:
+            tar_path = os.path.join(archive_dir, name)
+            write_archive(
+                folder, tar_path, codec=self.codec, level=compresslevel, rules=rules
+            )
+            return tar_path
 
         base_path = os.path.dirname(os.path.abspath(folder))
 
         with TemporaryDirectory(dir=base_path) as tmp:
             tar_path = os.path.join(tmp, name)
-            compress_folder(folder, tar_path)
+            compress_folder(
+                folder, tar_path, codec=self.codec, level=compresslevel, rules=rules
+            )
 
             self.archive.push(Status.ARCHIVE.value, tar_path)
 
@@ -168,32 +281,136 @@ class JobPostprocessor:
         finally:
             # self.err is where the error folders are stored locally
             self.err.push(Status.ERROR.value, folder)
+            self.record(folder, Status.ERROR, src=Status.DONE)
 
         return
 
 
-def compress_folder(src, dst):
-    """Compresses the source folder src into the tar.gz file
-    dst using the tar command"""
-    src = os.path.abspath(src)
-    base = os.path.dirname(src)
-    name = os.path.basename(src)
-    cmd = [
-        "tar",
-        "-czf",
-        dst,
-        "-C",
-        base,
-        name,
-    ]
-    return subprocess.run(cmd)
-
-
-def compress_folder_python(src, dst):
-    """Compresses the source folder src into the tar.gz file
-    dst using the tarfile library. Can be extremely slow for
-    larger tar files."""
-    import tarfile
-
-    with tarfile.open(dst, "w:gz", compresslevel=6) as tar:
-        tar.add(src, arcname=os.path.basename(dst))
+def get_jobresults(folder: os.PathLike) -> JobResults:
+    results_file = os.path.join(folder, JobResults.file_name())
+
+    if not os.path.exists(results_file):
+        raise FileNotFoundError(f"Results {JobResults.file_name()} does not exist")
+
+    try:
+        info = JobResults.from_json(results_file)
+        return info
+
+    except Exception as e:
+        raise PostprocessError(f"Could not decode JobResults. Error: {e}")
+
+
+def get_jobid(info: JobResults, folder: os.PathLike) -> str:
+    if "uuid" in info.job:
+        return info.job["uuid"]
+
+    elif "id" in info.job:
+        return str(info.job["id"])
+
+    return os.path.basename(folder)
+
+
+def archive_job(
+    folder: os.PathLike,
+    tmp: os.PathLike,
+    codec: ArchiveCodec = None,
+    archive_dir: os.PathLike = None,
+    rules: ArchiveRules = None,
+    store: BlobStore = None,
+) -> Tuple[JobResults, str, str]:
+    """Reads the results of the job in `folder` and adds the folder to
+    the `store`, if given, or compresses it into `archive_dir`, if given,
+    or into `tmp`. Runs in the worker processes of `postprocess_parallel`."""
+    info = get_jobresults(folder)
+    jobid = get_jobid(info, folder)
+    codec = codec if codec is not None else get_codec()
+
+    if store is not None:
+        store_folder(store, folder, jobid, rules=rules)
+        return info, jobid, store.manifest_path(jobid)
+
+    if archive_dir is not None:
+        tar_path = os.path.join(archive_dir, codec.get_name(jobid))
+        write_archive(folder, tar_path, codec=codec, rules=rules)
+        return info, jobid, tar_path
+
+    os.makedirs(tmp, exist_ok=True)
+    tar_path = os.path.join(tmp, codec.get_name(jobid))
+    compress_folder(folder, tar_path, codec=codec, rules=rules)
+
+    return info, jobid, tar_path
+
+
+def compress_folder(
+    src, dst, codec: ArchiveCodec = None, level: int = None, rules: ArchiveRules = None
+):
+    """Compresses the source folder src into the archive dst
+    using the `tar` command and the codec (by default, gzip).
+    If `rules` are given, only the selected files are archived,
+    together with a manifest of the files that were dropped."""
+    codec = codec if codec is not None else get_codec()
+
+    members = None
+    if rules is not None:
+        members = write_manifest(src, rules)
+
+    result = codec.compress(src, dst, level=level, members=members)
+
+    if result is not None and result.returncode != 0:
+        raise PostprocessError(f"Could not compress {src}: exit status {result.returncode}")
+
+    return result
+
+
+def store_folder(
+    store: BlobStore, folder: os.PathLike, jobid: str, rules: ArchiveRules = None
+) -> dict:
+    """Adds the folder to the deduplicating `store`. If `rules` are given,
+    only the selected files are stored, together with a manifest of the
+    files that were dropped."""
+    members = None
+    if rules is not None:
+        members = write_manifest(folder, rules)
+
+    try:
+        return store.put_folder(folder, jobid, members=members)
+    except OSError as e:
+        raise PostprocessError(f"Could not store {folder}: {e}")
+
+
+def write_manifest(folder: os.PathLike, rules: ArchiveRules) -> List[str]:
+    """Writes the manifest of the files of `folder` that are dropped
+    by `rules` and returns the paths that are archived"""
+    manifest = os.path.join(folder, MANIFEST_NAME)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+
+    members, dropped = rules.select(folder)
+    with open(manifest, "w") as f:
+        json.dump(
+            {"rules": rules.model_dump(exclude_none=True), "dropped": dropped},
+            f,
+            indent=4,
+        )
+
+    return members + [MANIFEST_NAME]
+
+
+def write_archive(
+    src, dst, codec: ArchiveCodec = None, level: int = None, rules: ArchiveRules = None
+):
+    """Compresses the folder src into a hidden partial file next to dst,
+    then renames it to dst. As the rename is atomic, the archive is only
+    visible once complete, and is written only once."""
+    folder, name = os.path.split(os.path.abspath(dst))
+    partial = os.path.join(folder, f".{name}.partial")
+
+    try:
+        compress_folder(src, partial, codec=codec, level=level, rules=rules)
+        os.replace(partial, dst)
+
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return dst
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tarfile
+import subprocess
+from typing import Dict, List, Optional
+
+
+class ArchiveCodec:
+    """Compresses job folders into tar archives. `level` and `threads`
+    are passed to the compression program, which is given to `tar`
+    with `-I`. If `threads` is 0, all cores are used when supported."""
+
+    NAME: str = None
+    EXTENSION: str = ".tar"
+    PROGRAM: str = None
+
+    def __init__(self, level: Optional[int] = None, threads: int = 0):
+        self.level = level
+        self.threads = threads
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} level={self.level} threads={self.threads}>"
+
+    def available(self) -> bool:
+        return self.PROGRAM is None or shutil.which(self.PROGRAM) is not None
+
+    def get_program(self, level: Optional[int] = None) -> List[str]:
+        level = self.level if level is None else level
+        program = [self.PROGRAM]
+        if level is not None:
+            program.append(f"-{level}")
+
+        return program
+
+    def get_name(self, name: str) -> str:
+        """Adds the extension of the archive to `name`, if missing"""
+        if not name.endswith(self.EXTENSION):
+            name += self.EXTENSION
+
+        return name
+
+    def get_cmd(
+        self,
+        src: os.PathLike,
+        dst: os.PathLike,
+        level: int = None,
+        members: Optional[List[str]] = None,
+    ) -> List[str]:
+        src = os.path.abspath(src)
+        base = os.path.dirname(src)
+        name = os.path.basename(src)
+
+        cmd = ["tar"]
+        if self.PROGRAM is not None:
+            cmd += ["-I", " ".join(self.get_program(level))]
+
+        if members is not None:
+            # the selected entries are read from stdin
+            return cmd + ["-cf", dst, "-C", base, "--null", "--no-recursion", "-T", "-"]
+
+        return cmd + ["-cf", dst, "-C", base, name]
+
+    def compress(
+        self,
+        src: os.PathLike,
+        dst: os.PathLike,
+        level: int = None,
+        members: Optional[List[str]] = None,
+    ):
+        """Compresses the folder `src` into the archive `dst`. If given,
+        only the `members` (paths relative to `src`) are archived."""
+        cmd = self.get_cmd(src, dst, level=level, members=members)
+        if members is None:
+            return subprocess.run(cmd)
+
+        return subprocess.run(cmd, input=get_member_list(src, members))
+
+
+class TarCodec(ArchiveCodec):
+    """Plain tar archive, without compression"""
+
+    NAME = "none"
+
+
+class GzipCodec(ArchiveCodec):
+    NAME = "gzip"
+    EXTENSION = ".tar.gz"
+    PROGRAM = "gzip"
+
+    def compress(
+        self,
+        src: os.PathLike,
+        dst: os.PathLike,
+        level: int = None,
+        members: Optional[List[str]] = None,
+    ):
+        if not self.available():
+            return compress_folder_python(
+                src, dst, compresslevel=level or self.level or 6, members=members
+            )
+
+        return super().compress(src, dst, level=level, members=members)
+
+
+class PigzCodec(ArchiveCodec):
+    """Parallel gzip. The archives can be read with gzip."""
+
+    NAME = "pigz"
+    EXTENSION = ".tar.gz"
+    PROGRAM = "pigz"
+
+    def get_program(self, level: Optional[int] = None) -> List[str]:
+        program = super().get_program(level)
+        if self.threads > 0:
+            program += ["-p", str(self.threads)]
+
+        return program
+
+
+class ZstdCodec(ArchiveCodec):
+    NAME = "zstd"
+    EXTENSION = ".tar.zst"
+    PROGRAM = "zstd"
+
+    def get_program(self, level: Optional[int] = None) -> List[str]:
+        return super().get_program(level) + [f"-T{self.threads}"]
+
+
+CODECS: Dict[str, ArchiveCodec] = {
+    cls.NAME: cls for cls in (TarCodec, GzipCodec, PigzCodec, ZstdCodec)
+}
+
+
+def get_codec(
+    name: str = "gzip",
+    level: Optional[int] = None,
+    threads: int = 0,
+    compress: bool = True,
+) -> ArchiveCodec:
+    """Returns the codec `name`, or a plain tar codec if `compress` is
+    False. Codecs whose program is not installed fall back to gzip."""
+    if not compress:
+        return TarCodec()
+
+    if name not in CODECS:
+        raise ValueError(f"Unknown archive codec {name}. Options: {', '.join(CODECS)}")
+
+    codec = CODECS[name](level=level, threads=threads)
+    if not codec.available():
+        return GzipCodec(level=level, threads=threads)
+
+    return codec
+
+
+def get_member_list(src: os.PathLike, members: List[str]) -> bytes:
+    """Null-separated list of the archive entries for `tar -T`"""
+    name = os.path.basename(os.path.abspath(src))
+    entries = [name] + [f"{name}/{member}" for member in members]
+    return b"\0".join(os.fsencode(entry) for entry in entries) + b"\0"
+
+
+def compress_folder_python(src, dst, compresslevel: int = 6, members: List[str] = None):
+    """Compresses the source folder src into the tar.gz file
+    dst using the tarfile library. Can be extremely slow for
+    larger tar files."""
+    name = os.path.basename(os.path.abspath(src))
+    with tarfile.open(dst, "w:gz", compresslevel=compresslevel) as tar:
+        if members is None:
+            tar.add(src, arcname=name)
+            return
+
+        tar.add(src, arcname=name, recursive=False)
+        for member in members:
+            tar.add(os.path.join(src, member), arcname=f"{name}/{member}", recursive=False)
@@ -1,10 +1,16 @@
 import os
 
-from mkwind.user import EnvSettings, Logger
+from mkwind.user import EnvSettings, Logger, LoggerLevel
+from mkwind.user.events import ARRIVALS
+from mkwind.user.engines import EnginePool
+from mkwind.user.journal import get_journal
 from mkite_core.models import Status
 from mkite_engines import EngineRoles, instantiate_from_path
+from mkwind.builder.settings import AllJobSettings
 
 from .base import JobPostprocessor
+from .codecs import get_codec
+from .store import get_store
 
 
 class PostprocessDaemon:
@@ -13,18 +19,44 @@ class PostprocessDaemon:
         postproc: JobPostprocessor,
         settings: EnvSettings,
         logger_stdout: bool = True,
+        logger: Logger = None,
     ):
         self.settings = settings
         self.postproc = postproc
 
-        log_path = os.path.join(settings.LOG_PATH, "mkwind-postproc.log")
-        self.logger = Logger.to_file(log_path, stdout=logger_stdout)
+        if logger is None:
+            log_path = os.path.join(settings.LOG_PATH, "mkwind-postproc.log")
+            logger = Logger.to_file(log_path, stdout=logger_stdout)
+
+        self.logger = logger
+        self.postproc.logger = logger
         self.log("initializing mkwind PostprocessDaemon")
 
     def log(self, msg: str):
         self.logger.log(msg)
 
+    def get_watches(self):
+        """Wakes up when jobs are DONE"""
+        return {self.postproc.src.get_queue_path(Status.DONE): ARRIVALS}
+
+    def reload_settings(self):
+        """Applies the changes to the build config made since the last
+        cycle, such that the archive rules are read once per cycle"""
+        recipe_settings = self.postproc.recipe_settings
+        if recipe_settings is None:
+            return
+
+        try:
+            changed = recipe_settings.reload()
+        except Exception as e:
+            self.logger.log(f"could not reload the build config: {e}", level=LoggerLevel.ERROR)
+            return
+
+        if changed:
+            self.log(f"build config reloaded, changed sections: {', '.join(changed)}")
+
     def postprocess(self):
+        self.reload_settings()
         done, errors = self.postproc.postprocess_all()
         return done, errors
 
@@ -41,20 +73,29 @@ class PostprocessDaemon:
         settings: EnvSettings,
         compress: bool = True,
         allow_restart: bool = False,
+        workers: int = 1,
         logger_stdout: bool = True,
+        logger: Logger = None,
+        engines: EnginePool = None,
     ):
-        src = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
+        instantiate = instantiate_from_path if engines is None else engines.get
+
+        src = instantiate(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
         src.add_queue(Status.DONE)
 
-        dst = instantiate_from_path(settings.ENGINE_EXTERNAL, role=EngineRoles.producer)
+        dst = instantiate(settings.ENGINE_EXTERNAL, role=EngineRoles.producer)
         dst.add_queue(Status.PARSING)
 
-        err = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.producer)
+        err = instantiate(settings.ENGINE_LOCAL, role=EngineRoles.producer)
         err.add_queue(Status.ERROR)
 
-        arch = instantiate_from_path(settings.ENGINE_ARCHIVE, role=EngineRoles.producer)
+        arch = instantiate(settings.ENGINE_ARCHIVE, role=EngineRoles.producer)
         arch.add_queue(Status.ARCHIVE)
 
+        recipe_settings = None
+        if settings.BUILD_CONFIG is not None:
+            recipe_settings = AllJobSettings.from_file(settings.BUILD_CONFIG)
+
         postproc = JobPostprocessor(
             src_engine=src,
             dst_engine=dst,
@@ -62,5 +103,15 @@ class PostprocessDaemon:
             archive_engine=arch,
             compress=compress,
             allow_restart=allow_restart,
+            journal=get_journal(settings, err.root_path),
+            workers=workers,
+            codec=get_codec(
+                settings.ARCHIVE_CODEC,
+                level=settings.ARCHIVE_LEVEL,
+                threads=settings.ARCHIVE_THREADS,
+                compress=compress,
+            ),
+            recipe_settings=recipe_settings,
+            store=get_store(settings, arch, compress=compress),
         )
-        return cls(postproc, settings, logger_stdout=logger_stdout)
+        return cls(postproc, settings, logger_stdout=logger_stdout, logger=logger)
@@ -0,0 +1,306 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+from tempfile import NamedTemporaryFile
+
+from mkite_engines import BaseProducer, LocalProducer
+
+
+STORE_DIR = "store"
+BLOBS_DIR = "blobs"
+MANIFESTS_DIR = "manifests"
+CHUNK_SIZE = 1024**2
+
+
+class StoreError(Exception):
+    pass
+
+
+class BlobStore:
+    """Content-addressed store of archived job folders. Each file is
+    saved once as a blob named after the sha256 of its contents, and
+    each job as a small manifest listing its entries and blobs:
+
+    ```
+    root/
+        blobs/ab/ab3f...    (gzip-compressed with `compresslevel`)
+        manifests/{jobid}.json
+    ```
+    Files repeated across jobs (e.g., pseudopotentials or inputs) are
+    therefore written and stored only once. Blobs and manifests are
+    written to hidden temporary files and renamed into place, such that
+    readers only see complete files."""
+
+    def __init__(self, root: os.PathLike, compresslevel: int = 6):
+        self.root = os.path.abspath(root)
+        self.compresslevel = compresslevel
+        os.makedirs(self.blobs_path, exist_ok=True)
+        os.makedirs(self.manifests_path, exist_ok=True)
+
+    def __repr__(self):
+        return f"<BlobStore {self.root}>"
+
+    @property
+    def blobs_path(self) -> str:
+        return os.path.join(self.root, BLOBS_DIR)
+
+    @property
+    def manifests_path(self) -> str:
+        return os.path.join(self.root, MANIFESTS_DIR)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blobs_path, digest[:2], digest)
+
+    def manifest_path(self, jobid: str) -> str:
+        return os.path.join(self.manifests_path, f"{jobid}.json")
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.exists(self.blob_path(digest))
+
+    def list_manifests(self) -> List[str]:
+        return sorted(
+            name[: -len(".json")]
+            for name in os.listdir(self.manifests_path)
+            if name.endswith(".json") and not name.startswith(".")
+        )
+
+    def list_blobs(self) -> Dict[str, str]:
+        """Returns the paths of all complete blobs by digest"""
+        blobs = {}
+        for prefix in os.listdir(self.blobs_path):
+            folder = os.path.join(self.blobs_path, prefix)
+            for name in os.listdir(folder):
+                if not name.startswith("."):
+                    blobs[name] = os.path.join(folder, name)
+
+        return blobs
+
+    @staticmethod
+    def hash_file(path: os.PathLike) -> str:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def open_blob(self, digest: str):
+        return gzip.open(self.blob_path(digest), "rb")
+
+    def put_file(self, path: os.PathLike) -> Tuple[str, bool]:
+        """Adds the file to the store. Returns its digest and whether
+        a new blob was written."""
+        digest = self.hash_file(path)
+        dst = self.blob_path(digest)
+
+        if os.path.exists(dst):
+            # refreshes the blob, such that `gc` does not remove it
+            # before the manifest referencing it is written
+            os.utime(dst)
+            return digest, False
+
+        folder = os.path.dirname(dst)
+        os.makedirs(folder, exist_ok=True)
+
+        with NamedTemporaryFile(dir=folder, prefix=".", delete=False) as tmp:
+            try:
+                with open(path, "rb") as src, gzip.GzipFile(
+                    fileobj=tmp, mode="wb", compresslevel=self.compresslevel, mtime=0
+                ) as gz:
+                    shutil.copyfileobj(src, gz, CHUNK_SIZE)
+
+            except BaseException:
+                os.remove(tmp.name)
+                raise
+
+        os.replace(tmp.name, dst)
+        return digest, True
+
+    def put_folder(
+        self, folder: os.PathLike, jobid: str, members: List[str] = None
+    ) -> dict:
+        """Adds the files of `folder` to the store and writes the manifest
+        of the job `jobid`. If given, only the `members` (paths relative
+        to `folder`, as returned by `ArchiveRules.select`) are stored.
+        Returns the manifest."""
+        folder = os.path.abspath(folder)
+        if members is None:
+            members = list_members(folder)
+
+        entries = []
+        written = 0
+        for member in members:
+            path = os.path.join(folder, member)
+            stat = os.lstat(path)
+
+            if os.path.islink(path):
+                entries.append({"path": member, "type": "link", "target": os.readlink(path)})
+
+            elif os.path.isdir(path):
+                entries.append({"path": member, "type": "dir", "mode": stat.st_mode & 0o7777})
+
+            else:
+                digest, new = self.put_file(path)
+                written += stat.st_size if new else 0
+                entries.append(
+                    {
+                        "path": member,
+                        "type": "file",
+                        "mode": stat.st_mode & 0o7777,
+                        "size": stat.st_size,
+                        "digest": digest,
+                    }
+                )
+
+        manifest = {
+            "name": os.path.basename(folder),
+            "jobid": jobid,
+            "created": time.time(),
+            "size": sum(e.get("size", 0) for e in entries),
+            "written": written,
+            "entries": entries,
+        }
+        self.write_manifest(jobid, manifest)
+        return manifest
+
+    def write_manifest(self, jobid: str, manifest: dict):
+        with NamedTemporaryFile(
+            "w", dir=self.manifests_path, prefix=".", suffix=".json", delete=False
+        ) as tmp:
+            json.dump(manifest, tmp, indent=4)
+
+        os.replace(tmp.name, self.manifest_path(jobid))
+
+    def get_manifest(self, jobid: str) -> dict:
+        path = self.manifest_path(jobid)
+        if not os.path.exists(path):
+            raise StoreError(f"Job {jobid} is not in the store")
+
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def delete(self, jobid: str):
+        """Removes the manifest of the job. Its blobs are removed by
+        `gc` if no other job references them."""
+        os.remove(self.manifest_path(jobid))
+
+    def restore(self, jobid: str, dst: os.PathLike = ".", verify: bool = True) -> str:
+        """Reassembles the folder of the job `jobid` inside `dst`
+        and returns its path"""
+        manifest = self.get_manifest(jobid)
+        folder = os.path.join(os.path.abspath(dst), manifest["name"])
+        if os.path.exists(folder):
+            raise StoreError(f"Cannot restore {jobid}: {folder} already exists")
+
+        os.makedirs(folder)
+        for entry in manifest["entries"]:
+            path = os.path.join(folder, entry["path"])
+
+            if entry["type"] == "dir":
+                os.makedirs(path, exist_ok=True)
+
+            elif entry["type"] == "link":
+                os.symlink(entry["target"], path)
+
+            else:
+                self.restore_file(entry, path, verify=verify)
+
+        # directories are made read-only last, if needed
+        for entry in reversed(manifest["entries"]):
+            if entry["type"] == "dir":
+                os.chmod(os.path.join(folder, entry["path"]), entry["mode"])
+
+        return folder
+
+    def restore_file(self, entry: dict, path: os.PathLike, verify: bool = True):
+        digest = entry["digest"]
+        if not self.has_blob(digest):
+            raise StoreError(f"Blob {digest} of {entry['path']} is missing")
+
+        sha = hashlib.sha256()
+        with self.open_blob(digest) as src, open(path, "wb") as f:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+                f.write(chunk)
+
+        if verify and sha.hexdigest() != digest:
+            raise StoreError(f"Blob {digest} of {entry['path']} is corrupted")
+
+        os.chmod(path, entry["mode"])
+
+    def referenced_blobs(self) -> Set[str]:
+        digests = set()
+        for jobid in self.list_manifests():
+            manifest = self.get_manifest(jobid)
+            digests.update(e["digest"] for e in manifest["entries"] if e["type"] == "file")
+
+        return digests
+
+    def gc(self, grace: float = 3600, dry_run: bool = False) -> Tuple[int, int]:
+        """Removes the blobs not referenced by any manifest and the
+        temporary files left by interrupted writes. Files modified in
+        the last `grace` seconds are kept, as they may belong to jobs
+        being archived. Returns the number and size of removed files."""
+        cutoff = time.time() - grace
+        referenced = self.referenced_blobs()
+
+        garbage = [path for digest, path in self.list_blobs().items() if digest not in referenced]
+        garbage += list_partial(self.blobs_path) + list_partial(self.manifests_path)
+
+        n_removed, size = 0, 0
+        for path in garbage:
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+
+            if not dry_run:
+                os.remove(path)
+
+            n_removed += 1
+            size += stat.st_size
+
+        return n_removed, size
+
+
+def get_store(settings, engine: BaseProducer, compress: bool = True) -> Optional[BlobStore]:
+    """Returns the store within the root of the archive `engine` if
+    enabled in the settings, or None otherwise. The store can only be
+    used with local archive engines."""
+    if not settings.ARCHIVE_STORE:
+        return None
+
+    if not isinstance(engine, LocalProducer):
+        raise ValueError(
+            f"ARCHIVE_STORE requires a local archive engine, got {engine.__class__.__name__}"
+        )
+
+    level = settings.ARCHIVE_LEVEL if settings.ARCHIVE_LEVEL is not None else 6
+    return BlobStore(
+        os.path.join(engine.root_path, STORE_DIR), compresslevel=level if compress else 0
+    )
+
+
+def list_partial(folder: os.PathLike) -> List[str]:
+    """Returns the hidden temporary files within `folder`"""
+    return [
+        os.path.join(root, name)
+        for root, _, files in os.walk(folder)
+        for name in files
+        if name.startswith(".")
+    ]
+
+
+def list_members(folder: os.PathLike) -> List[str]:
+    """Returns the paths of all entries of `folder`, relative to it"""
+    members = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        rel_root = os.path.relpath(root, folder)
+        prefix = "" if rel_root == "." else rel_root.replace(os.sep, "/") + "/"
+        members += [prefix + name for name in dirs + sorted(files)]
+
+    return members
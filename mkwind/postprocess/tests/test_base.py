@@ -1,15 +1,20 @@
 import os
+import json
+import tarfile
+import subprocess
 import unittest as ut
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from freezegun import freeze_time
 from mkite_core.external import load_config
 from mkite_core.models import JobInfo, JobResults, Status
 from mkite_core.tests.tempdirs import run_in_tempdir
 from mkite_engines import EngineRoles, instantiate_from_path
-from mkwind.postprocess.base import JobPostprocessor, PostprocessError
-from mkwind.user import EnvSettings
+from mkwind.builder.settings import AllJobSettings
+from mkwind.postprocess.base import JobPostprocessor, PostprocessError, MANIFEST_NAME
+from mkwind.postprocess.store import BlobStore
+from mkwind.user import EnvSettings, LoggerLevel
 from pkg_resources import resource_filename
 
 
@@ -19,7 +24,7 @@ SETTINGS = resource_filename("mkwind.tests.files", "settings.yaml")
 
 
 class TestPostprocessor(ut.TestCase):
-    def get_postproc(self):
+    def get_postproc(self, workers: int = 1):
         settings = self.get_settings()
         src = instantiate_from_path(settings.ENGINE_LOCAL, role=EngineRoles.consumer)
         src.add_queue(Status.DONE)
@@ -38,6 +43,7 @@ class TestPostprocessor(ut.TestCase):
             dst_engine=dst,
             error_engine=err,
             archive_engine=arch,
+            workers=workers,
         )
 
         queue_done = src.format_queue_name(Status.DONE.value)
@@ -101,6 +107,113 @@ class TestPostprocessor(ut.TestCase):
         expected = [os.path.basename(tar_path)]
         self.assertEqual(archived, expected)
 
+    @run_in_tempdir
+    def test_compress_folder_in_place(self):
+        postproc = self.get_postproc()
+        folder = self.get_folder(postproc, self.jobfolder)
+
+        with patch.object(postproc.archive, "push") as push:
+            tar_path = postproc.compress_folder(folder, name="uuid")
+
+        push.assert_not_called()
+        queue = postproc.archive.get_queue_path(Status.ARCHIVE)
+        self.assertEqual(tar_path, os.path.join(queue, "uuid.tar.gz"))
+        self.assertEqual(os.listdir(queue), ["uuid.tar.gz"])
+
+        # no temporary copies are left next to the job folder
+        queue_done = postproc.src.get_queue_path(Status.DONE)
+        self.assertFalse([f for f in os.listdir(queue_done) if f.startswith(".")])
+
+    @run_in_tempdir
+    def test_compress_folder_failed(self):
+        postproc = self.get_postproc()
+        folder = self.get_folder(postproc, self.jobfolder)
+
+        def fail(src, dst, level=None, members=None):
+            Path(dst).touch()
+            return subprocess.CompletedProcess(args=[], returncode=2)
+
+        with patch.object(postproc.codec, "compress", side_effect=fail):
+            with self.assertRaises(PostprocessError):
+                postproc.compress_folder(folder, name="uuid")
+
+        queue = postproc.archive.get_queue_path(Status.ARCHIVE)
+        self.assertEqual(os.listdir(queue), [])
+
+    @run_in_tempdir
+    def test_compress_folder_rules(self):
+        postproc = self.get_postproc()
+        postproc.recipe_settings = AllJobSettings(
+            {"recipe": {"archive": {"exclude": ["WAVECAR"]}}}
+        )
+        folder = self.get_folder(postproc, self.jobfolder)
+        Path(folder, "WAVECAR").write_bytes(b"\0" * 100)
+
+        rules = postproc.get_archive_rules(folder)
+        tar_path = postproc.compress_folder(folder, name="uuid", rules=rules)
+
+        with tarfile.open(tar_path) as tar:
+            names = sorted(tar.getnames())
+            manifest = json.load(tar.extractfile(f"{self.jobfolder}/{MANIFEST_NAME}"))
+
+        self.assertNotIn(f"{self.jobfolder}/WAVECAR", names)
+        self.assertIn(f"{self.jobfolder}/jobresults.json", names)
+        self.assertEqual(
+            manifest["dropped"], [{"path": "WAVECAR", "size": 100, "reason": "exclude"}]
+        )
+
+    @run_in_tempdir
+    def test_compress_folder_invalid_rules(self):
+        postproc = self.get_postproc()
+        postproc.logger = MagicMock()
+        postproc.recipe_settings = AllJobSettings(
+            {"recipe": {"archive": {"exclude": ["WAVECAR"], "max_size": "large"}}}
+        )
+        folder = self.get_folder(postproc, self.jobfolder)
+        Path(folder, "WAVECAR").write_bytes(b"\0" * 100)
+
+        # invalid rules are logged and all files are archived
+        rules = postproc.get_archive_rules(folder)
+        self.assertIsNone(rules)
+        postproc.logger.log.assert_called_once()
+        self.assertEqual(postproc.logger.log.call_args.kwargs["level"], LoggerLevel.ERROR)
+
+        tar_path = postproc.compress_folder(folder, name="uuid", rules=rules)
+        with tarfile.open(tar_path) as tar:
+            self.assertIn(f"{self.jobfolder}/WAVECAR", tar.getnames())
+
+    def check_postprocess_store(self, workers: int):
+        postproc = self.get_postproc(workers=workers)
+        postproc.store = BlobStore(os.path.join(postproc.archive.root_path, "store"))
+
+        done, errors = postproc.postprocess_all()
+        self.assertEqual(done, [self.jobfolder])
+        self.assertEqual(postproc.archive.list_queue(Status.ARCHIVE), [])
+
+        uuid = self.info.job["uuid"]
+        self.assertEqual(postproc.store.list_manifests(), [uuid])
+        folder = postproc.store.restore(uuid, "restored")
+        self.assertEqual(JobResults.from_json(f"{folder}/jobresults.json"), self.info)
+
+    @run_in_tempdir
+    def test_postprocess_store(self):
+        self.check_postprocess_store(workers=1)
+
+    @run_in_tempdir
+    def test_postprocess_store_parallel(self):
+        self.check_postprocess_store(workers=2)
+
+    @run_in_tempdir
+    def test_compress_disabled(self):
+        postproc = self.get_postproc()
+        postproc = JobPostprocessor(
+            postproc.src, postproc.dst, postproc.err, postproc.archive, compress=False
+        )
+
+        folder = self.get_folder(postproc, self.jobfolder)
+        postproc.compress_folder(folder, name="uuid")
+        self.assertEqual(postproc.archive.list_queue(Status.ARCHIVE), ["uuid.tar"])
+
     @run_in_tempdir
     def test_postprocess_job(self):
         postproc = self.get_postproc()
@@ -127,3 +240,17 @@ class TestPostprocessor(ut.TestCase):
 
         expected_errors = ["invalid_folder"]
         self.assertEqual(errors, expected_errors)
+
+    @run_in_tempdir
+    def test_postprocess_parallel(self):
+        postproc = self.get_postproc(workers=2)
+
+        done, errors = postproc.postprocess_all()
+
+        self.assertEqual(done, [self.jobfolder])
+        self.assertEqual(errors, ["invalid_folder"])
+
+        archived = postproc.archive.list_queue(Status.ARCHIVE)
+        self.assertEqual(archived, [self.info.job["uuid"] + ".tar.gz"])
+        self.assertEqual(postproc.src.list_queue(Status.DONE), [])
+        self.assertEqual(postproc.err.list_queue(Status.ERROR), ["invalid_folder"])
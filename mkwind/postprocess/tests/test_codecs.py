@@ -0,0 +1,94 @@
+import os
+import tarfile
+import unittest as ut
+from unittest.mock import patch
+
+from mkite_core.tests.tempdirs import run_in_tempdir
+from mkwind.postprocess.codecs import (
+    GzipCodec,
+    PigzCodec,
+    TarCodec,
+    ZstdCodec,
+    get_codec,
+    compress_folder_python,
+)
+
+
+def make_folder(name: str = "job"):
+    os.mkdir(name)
+    with open(os.path.join(name, "OUTCAR"), "w") as f:
+        f.write("energy = -1.0\n" * 1000)
+
+    return name
+
+
+class TestCodecs(ut.TestCase):
+    def test_get_codec(self):
+        self.assertIsInstance(get_codec(), GzipCodec)
+        self.assertIsInstance(get_codec("zstd", compress=False), TarCodec)
+
+        with patch("shutil.which", return_value=None):
+            codec = get_codec("pigz", level=3)
+
+        self.assertIsInstance(codec, GzipCodec)
+        self.assertEqual(codec.level, 3)
+
+        with self.assertRaises(ValueError):
+            get_codec("bzip")
+
+    def test_get_cmd(self):
+        cmd = ZstdCodec(level=3, threads=4).get_cmd("job", "job.tar.zst")
+        self.assertEqual(cmd[:3], ["tar", "-I", "zstd -3 -T4"])
+
+        cmd = PigzCodec(threads=8).get_cmd("job", "job.tar.gz", level=1)
+        self.assertEqual(cmd[2], "pigz -1 -p 8")
+
+        cmd = TarCodec().get_cmd("job", "job.tar")
+        self.assertEqual(cmd[:2], ["tar", "-cf"])
+
+    def test_get_name(self):
+        self.assertEqual(ZstdCodec().get_name("uuid"), "uuid.tar.zst")
+        self.assertEqual(GzipCodec().get_name("uuid.tar.gz"), "uuid.tar.gz")
+
+    @run_in_tempdir
+    def test_compress(self):
+        folder = make_folder()
+        for codec in (TarCodec(), GzipCodec(level=1)):
+            dst = codec.get_name("archive")
+            codec.compress(folder, dst)
+
+            with tarfile.open(dst) as tar:
+                self.assertEqual(sorted(tar.getnames()), ["job", "job/OUTCAR"])
+
+    @run_in_tempdir
+    @ut.skipUnless(ZstdCodec().available(), "zstd is not installed")
+    def test_compress_zstd(self):
+        folder = make_folder()
+        ZstdCodec(level=3, threads=2).compress(folder, "archive.tar.zst")
+        self.assertGreater(os.path.getsize("archive.tar.zst"), 0)
+
+    @run_in_tempdir
+    def test_compress_python(self):
+        folder = make_folder()
+        compress_folder_python(folder, "fast.tar.gz", compresslevel=1)
+        compress_folder_python(folder, "small.tar.gz", compresslevel=9)
+
+        with tarfile.open("small.tar.gz") as tar:
+            self.assertIn("job/OUTCAR", tar.getnames())
+
+        self.assertLessEqual(os.path.getsize("small.tar.gz"), os.path.getsize("fast.tar.gz"))
+
+    @run_in_tempdir
+    def test_compress_members(self):
+        folder = make_folder()
+        os.mkdir(os.path.join(folder, "sub"))
+        with open(os.path.join(folder, "WAVECAR"), "wb") as f:
+            f.write(b"\0" * 100)
+
+        expected = ["job", "job/OUTCAR", "job/sub"]
+        GzipCodec().compress(folder, "tar.tar.gz", members=["OUTCAR", "sub"])
+        compress_folder_python(folder, "python.tar.gz", members=["OUTCAR", "sub"])
+
+        for dst in ("tar.tar.gz", "python.tar.gz"):
+            with tarfile.open(dst) as tar:
+                self.assertEqual(sorted(tar.getnames()), expected)
@@ -6,6 +6,7 @@ from pkg_resources import resource_filename
 
 from mkwind.user import EnvSettings
 from mkite_core.models import Status
+from mkite_engines import RedisProducer
 from mkite_core.external import load_config
 from mkwind.postprocess.daemon import PostprocessDaemon
 from mkite_core.tests.tempdirs import run_in_tempdir
@@ -50,3 +51,18 @@ class TestDaemon(ut.TestCase):
             for fname in daemon.postproc.dst.list_queue(Status.PARSING.value)
         ]
         self.assertEqual(parsing_folders, done)
+
+    @run_in_tempdir
+    def test_remote_archive(self):
+        with open("redis.yaml", "w") as f:
+            f.write("_module: mkite_engines.redis\nhost: localhost\nport: 6379\n")
+
+        settings = self.get_settings()
+        settings = settings.model_copy(update={"ENGINE_ARCHIVE": os.path.abspath("redis.yaml")})
+        daemon = self.get_daemon(settings)
+        self.assertIsInstance(daemon.postproc.archive, RedisProducer)
+        self.assertIsNone(daemon.postproc.store)
+
+        settings = settings.model_copy(update={"ARCHIVE_STORE": True})
+        with self.assertRaises(ValueError):
+            self.get_daemon(settings)
@@ -0,0 +1,89 @@
+import os
+import unittest as ut
+from pathlib import Path
+
+from mkite_core.tests.tempdirs import run_in_tempdir
+from mkwind.postprocess.store import BlobStore, StoreError
+
+
+def make_folder(name: str, outcar: str):
+    os.makedirs(os.path.join(name, "inputs"))
+    Path(name, "POTCAR").write_text("PAW_PBE Si\n" * 1000)
+    Path(name, "OUTCAR").write_text(outcar)
+    Path(name, "inputs", "INCAR").write_text("ENCUT = 520\n")
+    os.symlink("POTCAR", os.path.join(name, "POTCAR.link"))
+    return name
+
+
+class TestBlobStore(ut.TestCase):
+    @run_in_tempdir
+    def test_put_folder(self):
+        store = BlobStore("store")
+        first = store.put_folder(make_folder("job1", "energy = -1.0\n"), "uuid1")
+        second = store.put_folder(make_folder("job2", "energy = -2.0\n"), "uuid2")
+
+        # POTCAR and INCAR are shared by both jobs
+        self.assertEqual(len(store.list_blobs()), 4)
+        self.assertEqual(first["written"], first["size"])
+        self.assertEqual(second["written"], len("energy = -2.0\n"))
+        self.assertEqual(store.list_manifests(), ["uuid1", "uuid2"])
+
+        types = {e["path"]: e["type"] for e in second["entries"]}
+        self.assertEqual(types["inputs"], "dir")
+        self.assertEqual(types["POTCAR.link"], "link")
+
+    @run_in_tempdir
+    def test_restore(self):
+        store = BlobStore("store")
+        store.put_folder(make_folder("job", "energy = -1.0\n"), "uuid")
+        os.chmod("job/OUTCAR", 0o600)
+        store.put_folder("job", "uuid")
+
+        folder = store.restore("uuid", "restored")
+        self.assertEqual(folder, os.path.abspath("restored/job"))
+        for name in ("OUTCAR", "POTCAR", "inputs/INCAR"):
+            self.assertEqual(Path(folder, name).read_text(), Path("job", name).read_text())
+
+        self.assertEqual(os.stat(os.path.join(folder, "OUTCAR")).st_mode & 0o777, 0o600)
+        self.assertEqual(os.readlink(os.path.join(folder, "POTCAR.link")), "POTCAR")
+
+        with self.assertRaises(StoreError):
+            store.restore("uuid", "restored")
+
+        with self.assertRaises(StoreError):
+            store.restore("unknown", "restored")
+
+    @run_in_tempdir
+    def test_restore_corrupted(self):
+        store = BlobStore("store", compresslevel=1)
+        manifest = store.put_folder(make_folder("job", "energy = -1.0\n"), "uuid")
+
+        digests = {e["path"]: e.get("digest") for e in manifest["entries"]}
+        os.replace(store.blob_path(digests["POTCAR"]), store.blob_path(digests["OUTCAR"]))
+
+        with self.assertRaises(StoreError):
+            store.restore("uuid", "restored")
+
+    @run_in_tempdir
+    def test_gc(self):
+        store = BlobStore("store")
+        store.put_folder(make_folder("job1", "energy = -1.0\n"), "uuid1")
+        store.put_folder(make_folder("job2", "energy = -2.0\n"), "uuid2")
+        Path(store.blobs_path, "ab").mkdir()
+        Path(store.blobs_path, "ab", ".partial").write_text("interrupted")
+
+        store.delete("uuid1")
+
+        # recent files are kept
+        self.assertEqual(store.gc(), (0, 0))
+
+        n_removed, size = store.gc(grace=-1, dry_run=True)
+        self.assertEqual(n_removed, 2)
+        self.assertEqual(len(store.list_blobs()), 4)
+
+        store.gc(grace=-1)
+        self.assertEqual(len(store.list_blobs()), 3)
+        self.assertEqual(os.listdir(os.path.join(store.blobs_path, "ab")), [])
+
+        folder = store.restore("uuid2", "restored")
+        self.assertEqual(Path(folder, "OUTCAR").read_text(), "energy = -2.0\n")
@@ -1,5 +1,9 @@
+import os
+import re
+import time
+import threading
 import subprocess
-from typing import Union
+from typing import Iterable, List, Optional, Union
 from pydantic import BaseModel
 from abc import ABC, abstractmethod
 
@@ -14,55 +18,191 @@ class SchedulerJob(BaseModel):
     partition: str = ""
     group: str
     status: str
+    array_index: Optional[int] = None
+
+
+JOB_ID_NAME = "mkwind-job-id"
+
+
+def write_job_id(folder: os.PathLike, job_id: str):
+    """Stores the scheduler ID of the job submitted from `folder`"""
+    with open(os.path.join(folder, JOB_ID_NAME), "w") as f:
+        f.write(f"{job_id}\n")
+
+
+def read_job_id(folder: os.PathLike) -> Optional[str]:
+    path = os.path.join(folder, JOB_ID_NAME)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as f:
+        return f.read().strip() or None
 
 
 class SchedulerError(Exception):
-    pass
+    def __init__(self, msg: str = "", returncode: Optional[int] = None):
+        super().__init__(msg)
+        self.returncode = returncode
+
+
+def expand_array_indices(spec: str) -> List[int]:
+    """Expands the task indices of a job array given by the scheduler,
+    e.g. `[1-3,7%2]` (Slurm) or `1-10:2` (SGE), into a list of ints."""
+    spec = spec.strip("[]").split("%")[0]
+
+    indices = []
+    for part in spec.split(","):
+        if not part:
+            continue
+
+        step = 1
+        if ":" in part:
+            part, step = part.split(":")
+            step = int(step)
+
+        if "-" in part:
+            start, end = part.split("-")
+            indices += list(range(int(start), int(end) + 1, step))
+        else:
+            indices.append(int(part))
+
+    return indices
 
 
 class Scheduler(ABC):
+    """Base class for the schedulers. The status of all jobs from
+    the user is obtained with a single call to `get_all`, which is
+    cached for `settings.SCHEDULER_TTL` seconds. All `get_*` methods
+    are answered from this snapshot by filtering the jobs according
+    to the statuses defined in each subclass.
+
+    Submissions return the ID of the new job, parsed from the output
+    of `SUBMIT_CMD` with `SUBMIT_ID_REGEX`. Schedulers that support it
+    can restrict the status queries to the IDs given to `track`.
+    """
     TEMPLATE: Template = None
     SUBMIT_CMD: str = None
     STATUS_CMD: str = None
+    ARRAY_TASK_VAR: str = None
+    NTASKS_VAR: str = "MKWIND_NTASKS"
+    # environment variable with the ID of the job, within a job
+    JOB_ID_VAR: str = None
+    SUBMIT_ID_REGEX: re.Pattern = None
+    # whether the snapshot lists the jobs by name, allowing the jobs
+    # that are no longer known to the scheduler to be detected
+    REPORTS_JOBS: bool = True
+    ID_CHUNK_SIZE: int = 500
+
+    QUEUED_STATUS: List[str] = []
+    PENDING_STATUS: List[str] = []
+    RUNNING_STATUS: List[str] = []
+    DONE_STATUS: List[str] = []
+    ERROR_STATUS: List[str] = []
+    FAILED_STATUS: List[str] = []
 
     def __init__(self, settings: EnvSettings):
         self.settings = settings
-
-    def _run(self, cmd) -> str:
+        self.snapshot_ttl = settings.SCHEDULER_TTL
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        self._lock = threading.Lock()
+        self.job_ids = None
+        self.latency = None
+
+    def _run(self, cmd, cwd: os.PathLike = None) -> str:
+        """Runs `cmd` within the folder `cwd`, if given. The working
+        directory of the process is not changed, such that jobs can
+        be submitted from several threads."""
         try:
-            out = subprocess.check_output(cmd, shell=True).decode()
+            out = subprocess.check_output(cmd, shell=True, cwd=cwd).decode()
             return out
         except subprocess.CalledProcessError as e:
-            raise SchedulerError(str(e))
+            raise SchedulerError(str(e), returncode=e.returncode)
 
     @abstractmethod
-    def submit_job(self, job):
+    def submit_job(self, job) -> Optional[str]:
         pass
 
-    @abstractmethod
-    def get_all(self, job) -> SchedulerJob:
-        pass
+    def parse_job_id(self, out: str) -> Optional[str]:
+        """Returns the job ID from the output of the submission, or
+        None if the output does not contain it"""
+        if self.SUBMIT_ID_REGEX is None or not out:
+            return None
 
-    @abstractmethod
-    def get_queued(self) -> SchedulerJob:
-        pass
+        match = self.SUBMIT_ID_REGEX.search(out)
+        return None if match is None else match.group(1)
 
-    @abstractmethod
-    def get_pending(self) -> SchedulerJob:
-        pass
+    @property
+    def supports_job_ids(self) -> bool:
+        """Whether the status can be queried for a list of job IDs"""
+        return False
 
-    @abstractmethod
-    def get_running(self) -> SchedulerJob:
-        pass
+    def track(self, job_ids: Optional[Iterable[str]]):
+        """Restricts the next status queries to the jobs with `job_ids`,
+        if supported. If None, all jobs from the user are queried."""
+        with self._lock:
+            self.job_ids = None if job_ids is None else sorted(set(job_ids))
 
-    @abstractmethod
-    def get_done(self) -> SchedulerJob:
-        pass
+    def chunk_ids(self, job_ids: List[str]) -> List[List[str]]:
+        size = self.ID_CHUNK_SIZE
+        return [job_ids[i : i + size] for i in range(0, len(job_ids), size)]
+
+    @property
+    def supports_arrays(self) -> bool:
+        return self.ARRAY_TASK_VAR is not None
+
+    def submit_array(self, script: os.PathLike, name: str, n_tasks: int):
+        """Submits `script` as a job array with tasks numbered from 1 to `n_tasks`"""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support job arrays"
+        )
 
     @abstractmethod
-    def get_error(self) -> SchedulerJob:
+    def get_all(self) -> List[SchedulerJob]:
         pass
 
-    @abstractmethod
-    def get_failed(self) -> SchedulerJob:
+    def snapshot(self) -> List[SchedulerJob]:
+        """Returns the jobs from the user, querying the scheduler
+        only if the cached snapshot is older than the TTL. Threads
+        sharing the scheduler wait for a single query."""
+        with self._lock:
+            age = time.monotonic() - self._snapshot_time
+            if self._snapshot is None or age >= self.snapshot_ttl:
+                start = time.monotonic()
+                self._snapshot = self.get_all()
+                self._snapshot_time = time.monotonic()
+                self.latency = self._snapshot_time - start
+
+            return self._snapshot
+
+    def invalidate(self):
+        """Discards the cached snapshot, e.g., after submitting jobs."""
+        with self._lock:
+            self._snapshot = None
+            self._snapshot_time = 0.0
+
+    def checkpoint(self):
+        """Persists the state needed to resume polling the scheduler.
+        Called once the jobs in the snapshot have been processed."""
         pass
+
+    def get_by_status(self, status_list: List[str]) -> List[SchedulerJob]:
+        return [j for j in self.snapshot() if j.status in status_list]
+
+    def get_queued(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.QUEUED_STATUS)
+
+    def get_pending(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.PENDING_STATUS)
+
+    def get_running(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.RUNNING_STATUS)
+
+    def get_done(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.DONE_STATUS)
+
+    def get_error(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.ERROR_STATUS)
+
+    def get_failed(self) -> List[SchedulerJob]:
+        return self.get_by_status(self.FAILED_STATUS)
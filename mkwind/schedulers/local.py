@@ -1,7 +1,6 @@
 import os
 from typing import List
 
-from mkwind.jobs.dirmanager import TemporaryChdir
 from mkwind.templates import Template
 
 from .base import Scheduler, SchedulerJob
@@ -13,14 +12,14 @@ class LocalScheduler(Scheduler):
     TEMPLATE = Template.from_name("local.sh")
     SUBMIT_CMD = f"exec -a {LOCAL_JOB_IDENTIFIER} bash"
     STATUS_CMD = f"ps aux | grep \"exec -a {LOCAL_JOB_IDENTIFIER}\" | grep -v grep | awk '{{print $2}}'"
+    REPORTS_JOBS = False
 
     def submit_job(self, job_folder: os.PathLike):
         name = os.path.basename(job_folder)
-        with TemporaryChdir(to=job_folder):
-            cmd = f"bash -c \"{self.SUBMIT_CMD} {self.TEMPLATE.FILENAME}\""
-            out = self._run(cmd)
+        cmd = f"bash -c \"{self.SUBMIT_CMD} {self.TEMPLATE.FILENAME}\""
+        out = self._run(cmd, cwd=job_folder)
 
-        return out
+        return self.parse_job_id(out)
 
     def get_all(self) -> List[SchedulerJob]:
         cmd = f"{self.STATUS_CMD}"
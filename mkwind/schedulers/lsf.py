@@ -1,9 +1,9 @@
 import os
+import re
 import json
 from enum import Enum
 from typing import List
 
-from mkwind.jobs.dirmanager import TemporaryChdir
 from mkwind.templates import Template
 
 from .base import Scheduler, SchedulerJob
@@ -21,14 +21,32 @@ class LsfScheduler(Scheduler):
         "start_time",
         "name",
     ]
+    QUEUED_STATUS = ["RUN", "PEND", "PSUSP"]
+    PENDING_STATUS = ["PEND"]
+    RUNNING_STATUS = ["RUN"]
+    # `bjobs -d` reports all recently finished jobs
+    DONE_STATUS = ["DONE", "EXIT"]
+    ERROR_STATUS = ["EXIT"]
+    FAILED_STATUS = ["EXIT"]
+    ARRAY_TASK_VAR = "LSB_JOBINDEX"
+    NTASKS_VAR = "LSB_DJOB_NUMPROC"
+    JOB_ID_VAR = "LSB_JOBID"
+    SUBMIT_ID_REGEX = re.compile(r"Job <(\d+)> is submitted")
+    ARRAY_NAME_REGEX = re.compile(r"^(.*)\[(\d+)\]$")
 
     def submit_job(self, job_folder: os.PathLike):
         name = os.path.basename(job_folder)
-        with TemporaryChdir(to=job_folder):
-            cmd = f"{self.SUBMIT_CMD} -J {name} < {self.TEMPLATE.FILENAME}"
-            out = self._run(cmd)
+        cmd = f"{self.SUBMIT_CMD} -J {name} < {self.TEMPLATE.FILENAME}"
+        out = self._run(cmd, cwd=job_folder)
 
-        return out
+        return self.parse_job_id(out)
+
+    def submit_array(self, script: os.PathLike, name: str, n_tasks: int):
+        folder, script = os.path.split(os.path.abspath(script))
+        cmd = f'{self.SUBMIT_CMD} -J "{name}[1-{n_tasks}]" -o {name}_%I.out < {script}'
+        out = self._run(cmd, cwd=folder)
+
+        return self.parse_job_id(out)
 
     @property
     def user_filter(self):
@@ -47,43 +65,18 @@ class LsfScheduler(Scheduler):
         jobs = []
         for stat in jobstatus:
             jobdict = dict(zip(self.STATUS_HEADER, stat.values()))
+
+            # elements of job arrays are named as `name[index]`
+            match = self.ARRAY_NAME_REGEX.match(jobdict["name"])
+            if match is not None:
+                jobdict["name"] = match.group(1)
+                jobdict["array_index"] = int(match.group(2))
+
             jobs.append(SchedulerJob(**jobdict))
 
         return jobs
 
     def get_all(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter}"
-        out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_by_status(self, status_list: List[str]) -> List[SchedulerJob]:
-        jobs = self.get_all()
-        return [
-            j for j in jobs
-            if j.status in status_list
-        ]
-
-    def get_queued(self) -> List[SchedulerJob]:
-        return self.get_by_status(["RUN", "PEND", "PSUSP"])
-
-    def get_pending(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -p"
+        cmd = f"{self.STATUS_CMD} {self.user_filter} -a"
         out = self._run(cmd)
         return self.format_output(out)
-
-    def get_running(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -r"
-        out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_done(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -d"
-        out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_error(self) -> List[SchedulerJob]:
-        return self.get_by_status(["EXIT"])
-
-    def get_failed(self) -> List[SchedulerJob]:
-        return self.get_error()
-
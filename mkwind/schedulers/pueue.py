@@ -1,8 +1,8 @@
 import os
+import re
 import msgspec as msg
 from typing import List, Union, Dict, BinaryIO
 
-from mkwind.jobs.dirmanager import TemporaryChdir
 from mkwind.templates import Template
 
 from .base import Scheduler, SchedulerJob
@@ -25,17 +25,23 @@ class PueueScheduler(Scheduler):
     TEMPLATE = Template.from_name("slurm.sh")
     SUBMIT_CMD = f"pueue add"
     STATUS_CMD = f"pueue log --json"
+    QUEUED_STATUS = ["Queued"]
+    PENDING_STATUS = ["Queued"]
+    RUNNING_STATUS = ["Running"]
+    DONE_STATUS = ["Success"]
+    ERROR_STATUS = ["Error"]
+    FAILED_STATUS = ["Error"]
+    SUBMIT_ID_REGEX = re.compile(r"\(id (\d+)\)")
 
     def submit_job(self, job_folder: os.PathLike):
         name = os.path.basename(job_folder)
-        with TemporaryChdir(to=job_folder):
-            cmd = f"chmod +x ./{self.TEMPLATE.FILENAME}"
-            out = self._run(cmd)
+        cmd = f"chmod +x ./{self.TEMPLATE.FILENAME}"
+        out = self._run(cmd, cwd=job_folder)
 
-            cmd = f"{self.SUBMIT_CMD} -l {name} ./{self.TEMPLATE.FILENAME}"
-            out = self._run(cmd)
+        cmd = f"{self.SUBMIT_CMD} -l {name} ./{self.TEMPLATE.FILENAME}"
+        out = self._run(cmd, cwd=job_folder)
 
-        return out
+        return self.parse_job_id(out)
 
     def format_output(self, tasks: Dict[str, PueueTask]):
         schedjobs = []
@@ -74,23 +80,4 @@ class PueueScheduler(Scheduler):
         return self.format_output(self.status)
 
     def get_filtered_by_status(self, status: str) -> List[SchedulerJob]:
-        jobs = self.get_all()
-        return [j for j in jobs if j.status == status]
-
-    def get_queued(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Queued")
-
-    def get_pending(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Queued")
-
-    def get_running(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Running")
-
-    def get_done(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Success")
-
-    def get_error(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Error")
-
-    def get_failed(self) -> List[SchedulerJob]:
-        return self.get_filtered_by_status("Error")
+        return self.get_by_status([status])
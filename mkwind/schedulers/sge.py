@@ -1,12 +1,12 @@
 import os
+import re
 from enum import Enum
 from typing import List
 from xml.etree import ElementTree as ET
 
-from mkwind.jobs.dirmanager import TemporaryChdir
 from mkwind.templates import Template
 
-from .base import Scheduler, SchedulerJob
+from .base import Scheduler, SchedulerJob, expand_array_indices
 
 
 def parse_qacct(text):
@@ -71,14 +71,27 @@ class SGEScheduler(Scheduler):
         "status": "failed",
         "partition": "qname",
     }
+    QUEUED_STATUS = ["qw", "hqw", "p", "s", "S"]
+    PENDING_STATUS = ["qw", "hqw", "p"]
+    RUNNING_STATUS = ["r", "t"]
+    ARRAY_TASK_VAR = "SGE_TASK_ID"
+    NTASKS_VAR = "NSLOTS"
+    JOB_ID_VAR = "JOB_ID"
+    SUBMIT_ID_REGEX = re.compile(r"Your job(?:-array)? (\d+)")
 
     def submit_job(self, job_folder: os.PathLike):
         name = os.path.basename(job_folder)
-        with TemporaryChdir(to=job_folder):
-            cmd = f"{self.SUBMIT_CMD} -N {name} {self.TEMPLATE.FILENAME}"
-            out = self._run(cmd)
+        cmd = f"{self.SUBMIT_CMD} -N {name} {self.TEMPLATE.FILENAME}"
+        out = self._run(cmd, cwd=job_folder)
 
-        return out
+        return self.parse_job_id(out)
+
+    def submit_array(self, script: os.PathLike, name: str, n_tasks: int):
+        folder, script = os.path.split(os.path.abspath(script))
+        cmd = f"{self.SUBMIT_CMD} -N {name} -t 1-{n_tasks} {script}"
+        out = self._run(cmd, cwd=folder)
+
+        return self.parse_job_id(out)
 
     @property
     def user_filter(self):
@@ -91,49 +104,61 @@ class SGEScheduler(Scheduler):
     def get_all(self) -> List[SchedulerJob]:
         cmd = f"{self.STATUS_CMD} {self.user_filter}"
         out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_queued(self) -> List[SchedulerJob]:
-        return self.get_pending()
+        jobs = self.format_output(out)
 
-    def get_pending(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -s ps"
+        cmd = f"{self.backlog}"
         out = self._run(cmd)
-        return self.format_output(out)
+        return jobs + self.format_qacct(parse_qacct(out))
 
-    def get_running(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -s r"
-        out = self._run(cmd)
-        return self.format_output(out)
+    def is_finished(self, job: SchedulerJob) -> bool:
+        """Jobs from `qacct` carry the `failed` code as status"""
+        status = job.status.split()
+        return len(status) > 0 and status[0].isdigit()
 
     def get_done(self) -> List[SchedulerJob]:
-        cmd = f"{self.backlog}"
-        out = self._run(cmd)
-        jobs = parse_qacct(out)
-        jobs = [job for job in jobs if job["failed"] == "0"]
-        return self.format_qacct(jobs)
+        return [
+            job for job in self.snapshot()
+            if self.is_finished(job) and job.status == "0"
+        ]
 
     def get_error(self) -> List[SchedulerJob]:
         return self.get_failed()
 
     def get_failed(self) -> List[SchedulerJob]:
-        cmd = f"{self.backlog}"
-        out = self._run(cmd)
-        jobs = parse_qacct(out)
-        jobs = [job for job in jobs if job["failed"] != "0"]
-        return self.format_qacct(jobs)
+        return [
+            job for job in self.snapshot()
+            if self.is_finished(job) and job.status != "0"
+        ]
 
     def format_output(self, out) -> List[SchedulerJob]:
         root = ET.fromstring(out)
-        jobs = [
-            {name: job.findtext(tag) for name, tag in self.STATUS_TAGS.items()}
-            for job in root.findall(".//job_list")
-        ]
-        return [SchedulerJob(**jdict) for jdict in jobs]
+
+        jobs = []
+        for job in root.findall(".//job_list"):
+            jdict = {name: job.findtext(tag) for name, tag in self.STATUS_TAGS.items()}
+
+            # tasks of job arrays, e.g. `4` or `1-10:1` when pending
+            tasks = job.findtext("tasks")
+            if not tasks:
+                jobs.append(SchedulerJob(**jdict))
+                continue
+
+            jobs += [
+                SchedulerJob(array_index=idx, **jdict)
+                for idx in expand_array_indices(tasks)
+            ]
+
+        return jobs
 
     def format_qacct(self, jobs: List[dict]) -> List[SchedulerJob]:
-        jobs = [
-            {name: job[val] for name, val in self.QACCT_TAGS.items()}
-            for job in jobs
-        ]
-        return [SchedulerJob(**jdict) for jdict in jobs]
+        sjobs = []
+        for job in jobs:
+            jdict = {name: job[val] for name, val in self.QACCT_TAGS.items()}
+
+            taskid = job.get("taskid", "undefined")
+            if taskid.isdigit():
+                jdict["array_index"] = int(taskid)
+
+            sjobs.append(SchedulerJob(**jdict))
+
+        return sjobs
@@ -1,11 +1,15 @@
 import os
+import re
+import json
 from enum import Enum
-from typing import List
+from typing import List, Union
+from datetime import datetime, timedelta
 
-from mkwind.jobs.dirmanager import TemporaryChdir
 from mkwind.templates import Template
 
-from .base import Scheduler, SchedulerJob
+from mkwind.user import EnvSettings
+
+from .base import Scheduler, SchedulerJob, SchedulerError, expand_array_indices
 
 
 class SlurmFormats(Enum):
@@ -18,6 +22,65 @@ class SlurmFormats(Enum):
     STATE = "%T"
 
 
+SACCT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class SacctCursor:
+    """Persists the last time the accounting database was polled,
+    such that only jobs that changed since then are requested
+    to `sacct`. The cursor is only moved forward once `commit`
+    is called, so completions are not lost if the daemon stops
+    before processing the jobs."""
+
+    def __init__(
+        self,
+        path: os.PathLike,
+        lookback: str = "now-1days",
+        overlap: int = 60,
+    ):
+        self.path = path
+        self.lookback = lookback
+        self.overlap = overlap
+        self.next = None
+
+    def load(self) -> Union[str, None]:
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, "r") as f:
+            return json.load(f).get("start")
+
+    @property
+    def start(self) -> str:
+        start = self.load()
+        if start is None:
+            return self.lookback
+
+        return start
+
+    def advance(self):
+        """Marks the beginning of a new query. Only the earliest query
+        since the last commit is kept, as the jobs of later queries
+        may not have been processed yet. The overlap accounts for
+        clock skews between the node and the controller."""
+        if self.next is not None:
+            return
+
+        now = datetime.now() - timedelta(seconds=self.overlap)
+        self.next = now.strftime(SACCT_TIME_FORMAT)
+
+    def commit(self):
+        if self.next is None:
+            return
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"start": self.next}, f)
+
+        os.replace(tmp, self.path)
+        self.next = None
+
+
 class SlurmScheduler(Scheduler):
     TEMPLATE = Template.from_name("slurm.sh")
     SUBMIT_CMD = "sbatch"
@@ -30,53 +93,121 @@ class SlurmScheduler(Scheduler):
         "group",
         "status",
     ]
+    QUEUED_STATUS = [
+        "CONFIGURING",
+        "COMPLETING",
+        "PENDING",
+        "RUNNING",
+        "RESIZING",
+        "SUSPENDED",
+    ]
+    PENDING_STATUS = ["PENDING"]
+    RUNNING_STATUS = ["RUNNING"]
+    DONE_STATUS = ["COMPLETED"]
+    ERROR_STATUS = ["CANCELLED", "FAILED", "TIMEOUT", "OUT_OF_MEMORY"]
+    FAILED_STATUS = ["PREEMPTED", "NODE_FAIL"]
+    ACCT_CMD = "sacct -n -X -P --format=JobID,JobName,Start,Partition,QOS,State"
+    CURSOR_FILE = "mkwind-sacct.json"
+    ARRAY_TASK_VAR = "SLURM_ARRAY_TASK_ID"
+    NTASKS_VAR = "SLURM_NTASKS"
+    JOB_ID_VAR = "SLURM_JOB_ID"
+    # `sbatch --parsable` prints `jobid[;cluster]`
+    SUBMIT_ID_REGEX = re.compile(r"^(?:Submitted batch job )?(\d+)(?:;\S+)?\s*$", re.M)
+
+    def __init__(self, settings: EnvSettings):
+        super().__init__(settings)
+        self.accounting = settings.SCHEDULER_ACCOUNTING
+        self.cursor = SacctCursor(os.path.join(settings.LOG_PATH, self.CURSOR_FILE))
 
     def submit_job(self, job_folder: os.PathLike):
         name = os.path.basename(job_folder)
-        with TemporaryChdir(to=job_folder):
-            cmd = f"{self.SUBMIT_CMD} --job-name={name} {self.TEMPLATE.FILENAME}"
-            out = self._run(cmd)
+        cmd = f"{self.SUBMIT_CMD} --parsable --job-name={name} {self.TEMPLATE.FILENAME}"
+        out = self._run(cmd, cwd=job_folder)
+
+        return self.parse_job_id(out)
 
-        return out
+    def submit_array(self, script: os.PathLike, name: str, n_tasks: int):
+        folder, script = os.path.split(os.path.abspath(script))
+        cmd = (
+            f"{self.SUBMIT_CMD} --parsable --job-name={name} --array=1-{n_tasks} "
+            f"--output={name}_%a.out {script}"
+        )
+        out = self._run(cmd, cwd=folder)
+
+        return self.parse_job_id(out)
 
     @property
     def user_filter(self):
         return f"-u {self.settings.USER}"
 
-    def get_all(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter}"
-        out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_queued(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t CONFIGURING,COMPLETING,PENDING,RUNNING,RESIZING,SUSPENDED"
-        out = self._run(cmd)
-        return self.format_output(out)
+    @property
+    def finished_status(self) -> List[str]:
+        return self.DONE_STATUS + self.ERROR_STATUS + self.FAILED_STATUS
 
-    def get_pending(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t PENDING"
-        out = self._run(cmd)
-        return self.format_output(out)
+    @property
+    def supports_job_ids(self) -> bool:
+        return True
 
-    def get_running(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t RUNNING"
-        out = self._run(cmd)
+    def get_all(self) -> List[SchedulerJob]:
+        if self.job_ids is None:
+            return self.query(self.user_filter)
+
+        return [
+            job
+            for chunk in self.chunk_ids(self.job_ids)
+            for job in self.query(f"-j {','.join(chunk)}", n_ids=len(chunk))
+        ]
+
+    def query(self, job_filter: str, n_ids: int = None) -> List[SchedulerJob]:
+        """Queries the jobs selected by `job_filter`, which lists `n_ids`
+        job IDs or, if None, selects all jobs from the user"""
+        if self.accounting:
+            return self.get_active(job_filter, n_ids) + self.get_accounting(job_filter, n_ids)
+
+        cmd = f"{self.STATUS_CMD} {job_filter} -t all"
+        out = self._run_squeue(cmd, n_ids)
         return self.format_output(out)
 
-    def get_done(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t COMPLETED"
+    def _run_squeue(self, cmd: str, n_ids: int = None) -> str:
+        try:
+            return self._run(cmd)
+        except SchedulerError:
+            # squeue fails when a single job ID is given and the job
+            # is no longer known by the controller
+            if n_ids == 1:
+                return ""
+
+            raise
+
+    def get_active(self, job_filter: str = None, n_ids: int = None) -> List[SchedulerJob]:
+        """Jobs that are still in the queue, as reported by squeue"""
+        job_filter = self.user_filter if job_filter is None else job_filter
+        cmd = f"{self.STATUS_CMD} {job_filter}"
+        out = self._run_squeue(cmd, n_ids)
+        jobs = self.format_output(out)
+        return [j for j in jobs if j.status not in self.finished_status]
+
+    def get_accounting(self, job_filter: str = None, n_ids: int = None) -> List[SchedulerJob]:
+        """Jobs that finished since the last committed poll, as
+        reported by the accounting database. When querying by job
+        ID, the jobs are requested regardless of their end time."""
+        if n_ids is not None:
+            out = self._run(f"{self.ACCT_CMD} {job_filter}")
+            jobs = self.format_accounting(out)
+            return [j for j in jobs if j.status in self.finished_status]
+
+        job_filter = self.user_filter if job_filter is None else job_filter
+        states = ",".join(self.finished_status)
+        start = self.cursor.start
+        self.cursor.advance()
+
+        cmd = f"{self.ACCT_CMD} {job_filter} -S {start} -E now -s {states}"
         out = self._run(cmd)
-        return self.format_output(out)
+        return self.format_accounting(out)
 
-    def get_error(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t CANCELLED,FAILED,TIMEOUT"
-        out = self._run(cmd)
-        return self.format_output(out)
-
-    def get_failed(self) -> List[SchedulerJob]:
-        cmd = f"{self.STATUS_CMD} {self.user_filter} -t PREEMPTED,NODE_FAIL"
-        out = self._run(cmd)
-        return self.format_output(out)
+    def checkpoint(self):
+        if self.accounting:
+            self.cursor.commit()
 
     def format_output(self, out) -> List[SchedulerJob]:
         out = out.strip()
@@ -87,6 +218,33 @@ class SlurmScheduler(Scheduler):
         jobs = []
         for jobline in lines:
             jobdict = dict(zip(self.STATUS_HEADER, jobline.split(" ")))
-            jobs.append(SchedulerJob(**jobdict))
+            jobs += self.make_jobs(jobdict)
+
+        return jobs
+
+    def make_jobs(self, jobdict: dict) -> List[SchedulerJob]:
+        """Creates the jobs from the output of the scheduler. Tasks
+        from job arrays (e.g. `1234_5` or `1234_[6-10]`) are expanded
+        into one job per task."""
+        if "_" not in jobdict["id"]:
+            return [SchedulerJob(**jobdict)]
+
+        jobid, tasks = jobdict.pop("id").split("_", 1)
+        return [
+            SchedulerJob(id=jobid, array_index=idx, **jobdict)
+            for idx in expand_array_indices(tasks)
+        ]
+
+    def format_accounting(self, out) -> List[SchedulerJob]:
+        out = out.strip()
+        if not out:
+            return []
+
+        jobs = []
+        for jobline in out.split("\n"):
+            jobdict = dict(zip(self.STATUS_HEADER, jobline.split("|")))
+            # e.g. "CANCELLED by 12345"
+            jobdict["status"] = jobdict["status"].split(" ")[0]
+            jobs += self.make_jobs(jobdict)
 
         return jobs
@@ -4,36 +4,36 @@ from unittest.mock import patch
 
 from pkg_resources import resource_filename
 from mkwind.user import EnvSettings
-from mkwind.schedulers.base import SchedulerJob, Scheduler
+from mkwind.schedulers.base import SchedulerJob, Scheduler, expand_array_indices
 
 
 SETTINGS = resource_filename("mkwind.tests.files", "settings.yaml")
 
 
 class MockScheduler(Scheduler):
-    def submit_job(self, job):
-        pass
-
-    def get_all(self, job):
-        pass
-
-    def get_queued(self):
-        pass
+    RUNNING_STATUS = ["RUNNING"]
+    PENDING_STATUS = ["PENDING"]
 
-    def get_pending(self):
-        pass
-
-    def get_running(self):
-        pass
-
-    def get_done(self):
-        pass
-
-    def get_error(self):
+    def submit_job(self, job):
         pass
 
-    def get_failed(self):
-        pass
+    def get_all(self):
+        return [
+            SchedulerJob(
+                id=1,
+                name="job1",
+                start_time=None,
+                group="normal",
+                status="RUNNING",
+            ),
+            SchedulerJob(
+                id=2,
+                name="job2",
+                start_time=None,
+                group="normal",
+                status="PENDING",
+            ),
+        ]
 
 
 class TestSchedulerJob(ut.TestCase):
@@ -51,6 +51,11 @@ class TestSchedulerJob(ut.TestCase):
         sjob = SchedulerJob(**self.example)
         self.assertEqual(sjob.id, 12345678)
 
+    def test_expand_array_indices(self):
+        self.assertEqual(expand_array_indices("4"), [4])
+        self.assertEqual(expand_array_indices("[1-3,7%2]"), [1, 2, 3, 7])
+        self.assertEqual(expand_array_indices("1-7:3"), [1, 4, 7])
+
 
 class TestScheduler(ut.TestCase):
     def setUp(self):
@@ -62,3 +67,27 @@ class TestScheduler(ut.TestCase):
         out = self.sched._run(cmd)
 
         self.assertEqual(out, "testing\n")
+
+    def test_snapshot(self):
+        with patch.object(self.sched, "get_all", wraps=self.sched.get_all) as get_all:
+            self.assertEqual(len(self.sched.get_running()), 1)
+            self.assertEqual(len(self.sched.get_pending()), 1)
+            self.assertEqual(len(self.sched.get_done()), 0)
+
+        self.assertEqual(get_all.call_count, 1)
+
+    def test_snapshot_invalidate(self):
+        with patch.object(self.sched, "get_all", wraps=self.sched.get_all) as get_all:
+            self.sched.get_running()
+            self.sched.invalidate()
+            self.sched.get_running()
+
+        self.assertEqual(get_all.call_count, 2)
+
+    def test_snapshot_ttl(self):
+        self.sched.snapshot_ttl = 0
+        with patch.object(self.sched, "get_all", wraps=self.sched.get_all) as get_all:
+            self.sched.get_running()
+            self.sched.get_pending()
+
+        self.assertEqual(get_all.call_count, 2)
@@ -92,12 +92,12 @@ STATUS = """
 class MockLsfScheduler(LsfScheduler):
     SUBMIT_CMD = "printf '%s ' \"${*}\""
 
-    def _run(self, cmd):
+    def _run(self, cmd, cwd=None):
         if self.STATUS_CMD in cmd:
             return self._run_status(cmd)
 
         if self.SUBMIT_CMD in cmd:
-            return super()._run(cmd).strip()
+            return super()._run(cmd, cwd=cwd).strip()
 
         raise ValueError(f"command {cmd} does not have the expected format")
 
@@ -137,10 +137,21 @@ class TestLsfScheduler(ut.TestCase):
         os.mkdir(NAME)
         Path(f"{NAME}/job.sh").touch()
 
-        out = self.sched.submit_job(NAME)
-        expected = f"-J testname"
+        out = "Job <1234> is submitted to queue <normal>."
+        with patch.object(self.sched, "_run", return_value=out) as run:
+            job_id = self.sched.submit_job(NAME)
 
-        self.assertEqual(out, expected)
+        self.assertEqual(job_id, "1234")
+        self.assertIn("-J testname", run.call_args.args[0])
+
+    def test_format_array(self):
+        status = json.loads(STATUS)
+        status["RECORDS"][0]["JOB_NAME"] = "mkwind_array_1[3]"
+        sjobs = self.sched.format_output(json.dumps(status))
+
+        self.assertEqual(sjobs[0].name, "mkwind_array_1")
+        self.assertEqual(sjobs[0].array_index, 3)
+        self.assertIsNone(sjobs[1].array_index)
 
     def test_status(self):
         sjobs = self.sched.get_all()
@@ -37,10 +37,11 @@ class TestPueueScheduler(ut.TestCase):
         os.mkdir(NAME)
         Path(f"{NAME}/job.sh").touch()
 
-        out = self.sched.submit_job(NAME)
-        expected = f"-l {NAME} ./job.sh\n"
+        with patch.object(self.sched, "_run", return_value="New task added (id 5).") as run:
+            job_id = self.sched.submit_job(NAME)
 
-        self.assertEqual(out, expected)
+        self.assertEqual(job_id, "5")
+        self.assertIn(f"-l {NAME} ./job.sh", run.call_args.args[0])
 
     def test_status(self):
         jobs = self.sched.status
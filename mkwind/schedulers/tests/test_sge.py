@@ -4,6 +4,7 @@ from pkg_resources import resource_filename
 
 import unittest as ut
 from unittest.mock import patch
+from xml.etree import ElementTree as ET
 
 from mkwind.user import EnvSettings
 from mkwind.schedulers.base import SchedulerJob
@@ -20,7 +21,7 @@ QSTAT_P_FILE = resource_filename("mkwind.schedulers.tests.files", "sge_qstat_p.x
 class MockSGEScheduler(SGEScheduler):
     SUBMIT_CMD = "echo"
 
-    def _run(self, cmd):
+    def _run(self, cmd, cwd=None):
         if "qstat" in cmd:
             if "-s r" in cmd:
                 return self._read_file(QSTAT_R_FILE)
@@ -28,9 +29,21 @@ class MockSGEScheduler(SGEScheduler):
             if "-s p" in cmd:
                 return self._read_file(QSTAT_P_FILE)
 
+            return self._merge_qstat(QSTAT_R_FILE, QSTAT_P_FILE)
+
         if "qacct" in cmd:
             return self._read_file(QACCT_FILE)
 
+    def _merge_qstat(self, *files):
+        root = ET.fromstring(self._read_file(files[0]))
+        queue = root.find("queue_info")
+        for file in files[1:]:
+            other = ET.fromstring(self._read_file(file))
+            for job in other.findall(".//job_list"):
+                queue.append(job)
+
+        return ET.tostring(root, encoding="unicode")
+
     def _read_file(self, file):
         with open(file, "r") as f:
             out = f.read()
@@ -46,6 +59,23 @@ class TestSGEScheduler(ut.TestCase):
         self.assertEqual(len(self.sched.get_running()), 2)
         self.assertEqual(len(self.sched.get_pending()), 3)
 
+    def test_parse_job_id(self):
+        out = 'Your job 4132 ("test_recipe_7615c560_1658944102") has been submitted'
+        self.assertEqual(self.sched.parse_job_id(out), "4132")
+
+        out = 'Your job-array 4133.1-3:1 ("mkwind_array_1") has been submitted'
+        self.assertEqual(self.sched.parse_job_id(out), "4133")
+
     def test_get_qacct(self):
         self.assertEqual(len(self.sched.get_done()), 2)
         self.assertEqual(len(self.sched.get_error()), 1)
+
+    def test_snapshot(self):
+        with patch.object(self.sched, "_run", wraps=self.sched._run) as run:
+            self.sched.get_running()
+            self.sched.get_pending()
+            self.sched.get_done()
+            self.sched.get_failed()
+
+        # one call to qstat and one call to qacct
+        self.assertEqual(run.call_count, 2)
@@ -7,7 +7,7 @@ from unittest.mock import patch
 from pkg_resources import resource_filename
 
 from mkwind.user import EnvSettings
-from mkwind.schedulers.base import SchedulerJob
+from mkwind.schedulers.base import SchedulerJob, SchedulerError
 from mkwind.schedulers.slurm import SlurmScheduler
 from mkite_core.tests.tempdirs import run_in_tempdir
 
@@ -29,15 +29,25 @@ STATUS = """
 """
 
 
+ACCT_STATUS = """
+1010190|test_recipe_9c60037b_1658944102|2022-07-25T23:01:02|pbatch|normal|COMPLETED
+1010191|job.sh|2022-07-25T23:01:02|pbatch|normal|CANCELLED by 1234
+1010192|job.sh|2022-07-25T23:01:02|pbatch|normal|NODE_FAIL
+"""
+
+
 class MockSlurmScheduler(SlurmScheduler):
     SUBMIT_CMD = "echo"
 
-    def _run(self, cmd):
+    def _run(self, cmd, cwd=None):
         if self.STATUS_CMD in cmd:
             return self._run_status(cmd)
 
+        if self.ACCT_CMD in cmd:
+            return ACCT_STATUS
+
         if self.SUBMIT_CMD in cmd:
-            return super()._run(cmd)
+            return super()._run(cmd, cwd=cwd)
 
         raise ValueError(f"command {cmd} does not have the expected format")
 
@@ -70,10 +80,16 @@ class TestSlurmScheduler(ut.TestCase):
         os.mkdir(NAME)
         Path(f"{NAME}/job.sh").touch()
 
-        out = self.sched.submit_job(NAME)
-        expected = f"--job-name={NAME} job.sh\n"
+        with patch.object(self.sched, "_run", return_value="1010300;cluster\n") as run:
+            job_id = self.sched.submit_job(NAME)
+
+        self.assertEqual(job_id, "1010300")
+        self.assertIn(f"--parsable --job-name={NAME} job.sh", run.call_args.args[0])
 
-        self.assertEqual(out, expected)
+    def test_parse_job_id(self):
+        self.assertEqual(self.sched.parse_job_id("1010300\n"), "1010300")
+        self.assertEqual(self.sched.parse_job_id("Submitted batch job 12"), "12")
+        self.assertIsNone(self.sched.parse_job_id("--job-name=test_recipe_7615c560 job.sh"))
 
     def test_format(self):
         out = "\n".join(STATUS.strip().split("\n")[:2])
@@ -83,6 +99,47 @@ class TestSlurmScheduler(ut.TestCase):
         self.assertIsInstance(sjobs, list)
         self.assertIsInstance(sjobs[0], SchedulerJob)
 
+    def test_format_array(self):
+        out = "\n".join([
+            "1010300_1 mkwind_array_1 2022-07-26T00:01:02 pbatch normal RUNNING",
+            "1010300_[2-4,6%2] mkwind_array_1 N/A pbatch normal PENDING",
+        ])
+        sjobs = self.sched.format_output(out)
+
+        self.assertEqual(len(sjobs), 5)
+        self.assertEqual([j.array_index for j in sjobs], [1, 2, 3, 4, 6])
+        self.assertEqual({j.id for j in sjobs}, {1010300})
+
+    @run_in_tempdir
+    def test_submit_array(self):
+        Path("job.sh").touch()
+        with patch.object(self.sched, "_run", return_value="1010300\n") as run:
+            job_id = self.sched.submit_array("job.sh", "testname", 3)
+
+        self.assertEqual(job_id, "1010300")
+        self.assertIn("--array=1-3", run.call_args.args[0])
+
+    def test_status_by_ids(self):
+        self.sched.ID_CHUNK_SIZE = 2
+        self.sched.track(["1010205", "1010202", "1010205", "1010208"])
+
+        with patch.object(self.sched, "_run", return_value=STATUS) as run:
+            self.sched.get_all()
+
+        cmds = [call.args[0] for call in run.call_args_list]
+        self.assertEqual(len(cmds), 2)
+        self.assertIn("-j 1010202,1010205 -t all", cmds[0])
+        self.assertIn("-j 1010208 -t all", cmds[1])
+        self.assertNotIn("-u ", cmds[0])
+
+        # jobs no longer known by the controller
+        self.sched.track(["1010202"])
+        with patch.object(self.sched, "_run", side_effect=SchedulerError("invalid")):
+            self.assertEqual(self.sched.get_all(), [])
+
+        self.sched.track([])
+        self.assertEqual(self.sched.get_all(), [])
+
     def test_status(self):
         sjobs = self.sched.get_all()
         nlines = len(STATUS.strip().split("\n"))
@@ -108,3 +165,60 @@ class TestSlurmScheduler(ut.TestCase):
     def test_pending(self):
         sjobs = self.sched.get_pending()
         self.assertEqual(len(sjobs), 4)
+
+    def test_snapshot(self):
+        with patch.object(self.sched, "_run", wraps=self.sched._run) as run:
+            self.sched.get_running()
+            self.sched.get_pending()
+            self.sched.get_done()
+            self.sched.get_error()
+            self.sched.get_failed()
+
+        self.assertEqual(run.call_count, 1)
+
+
+class TestSlurmAccounting(ut.TestCase):
+    def setUp(self):
+        settings = EnvSettings.from_file(SETTINGS)
+        settings.SCHEDULER_ACCOUNTING = True
+        self.sched = MockSlurmScheduler(settings=settings)
+
+    def test_format_accounting(self):
+        sjobs = self.sched.format_accounting(ACCT_STATUS)
+        self.assertEqual(len(sjobs), 3)
+        self.assertEqual(sjobs[1].status, "CANCELLED")
+
+    @run_in_tempdir
+    def test_status(self):
+        self.sched.cursor.path = "cursor.json"
+
+        # finished jobs from squeue are ignored
+        self.assertEqual(len(self.sched.get_done()), 1)
+        self.assertEqual(len(self.sched.get_error()), 1)
+        self.assertEqual(len(self.sched.get_failed()), 1)
+        self.assertEqual(len(self.sched.get_running()), 3)
+        self.assertEqual(len(self.sched.get_pending()), 4)
+
+    @run_in_tempdir
+    def test_cursor(self):
+        self.sched.cursor.path = "cursor.json"
+        self.assertEqual(self.sched.cursor.start, self.sched.cursor.lookback)
+
+        with patch.object(self.sched, "_run", wraps=self.sched._run) as run:
+            self.sched.get_done()
+
+        cmd = run.call_args_list[-1].args[0]
+        self.assertIn(f"-S {self.sched.cursor.lookback}", cmd)
+
+        # the cursor is only persisted after the checkpoint
+        self.assertFalse(os.path.exists("cursor.json"))
+        expected = self.sched.cursor.next
+        self.sched.checkpoint()
+        self.assertEqual(self.sched.cursor.start, expected)
+
+        self.sched.invalidate()
+        with patch.object(self.sched, "_run", wraps=self.sched._run) as run:
+            self.sched.get_done()
+
+        cmd = run.call_args_list[-1].args[0]
+        self.assertIn(f"-S {expected}", cmd)
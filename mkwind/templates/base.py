@@ -1,14 +1,35 @@
 import os
-from pkg_resources import resource_filename
-from jinja2 import Template as JinjaTemplate
+import threading
+from typing import Dict
+from importlib.resources import files
+from jinja2 import (
+    Environment,
+    FunctionLoader,
+    FileSystemBytecodeCache,
+    Template as JinjaTemplate,
+)
 
 
 class Template:
+    """Job script rendered from a Jinja template file. The template
+    is only compiled when it is first rendered."""
+
     FILENAME = "job.sh"
 
     def __init__(self, template_file: os.PathLike):
-        with open(template_file, "r") as f:
-            self.jtemplate = JinjaTemplate(f.read())
+        self.template_file = template_file
+        self._jtemplate = None
+
+    @property
+    def jtemplate(self) -> JinjaTemplate:
+        if self._jtemplate is None:
+            self._jtemplate = self.compile()
+
+        return self._jtemplate
+
+    def compile(self) -> JinjaTemplate:
+        with open(self.template_file, "r") as f:
+            return REGISTRY.environment.from_string(f.read())
 
     def render(self, inputs: dict):
         return self.jtemplate.render({"job": inputs})
@@ -26,9 +47,74 @@ class Template:
 
     @classmethod
     def from_name(cls, template_name: str):
-        if not template_name.endswith(".sh"):
-            template_name += ".sh"
+        return REGISTRY.get(template_name)
+
+
+class PackagedTemplate(Template):
+    """Template shipped with a package, loaded through the
+    environment of the `registry`"""
+
+    def __init__(self, name: str, registry: "TemplateRegistry"):
+        self.name = name
+        self.registry = registry
+        self._jtemplate = None
+
+    def compile(self) -> JinjaTemplate:
+        return self.registry.environment.get_template(self.name)
+
+
+class TemplateRegistry:
+    """Process-wide registry of the templates shipped with `package`.
+    All templates share a single Jinja Environment, which keeps the
+    compiled templates in memory and, when possible, their bytecode
+    on disk across processes."""
+
+    def __init__(self, package: str = "mkwind.templates"):
+        self.package = package
+        self._environment = None
+        self._templates: Dict[str, PackagedTemplate] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def environment(self) -> Environment:
+        with self._lock:
+            if self._environment is None:
+                self._environment = Environment(
+                    loader=FunctionLoader(self.load_source),
+                    bytecode_cache=self.get_bytecode_cache(),
+                )
+
+        return self._environment
+
+    @staticmethod
+    def get_bytecode_cache():
+        try:
+            return FileSystemBytecodeCache()
+        except (OSError, RuntimeError):
+            return None
+
+    def get_resource(self, name: str):
+        return files(self.package).joinpath(name)
+
+    def load_source(self, name: str) -> str:
+        resource = self.get_resource(name)
+        if not resource.is_file():
+            return None
+
+        return resource.read_text()
+
+    def get(self, name: str) -> PackagedTemplate:
+        if not name.endswith(".sh"):
+            name += ".sh"
+
+        with self._lock:
+            if name not in self._templates:
+                if not self.get_resource(name).is_file():
+                    raise FileNotFoundError(f"Template {name} not found in {self.package}")
+
+                self._templates[name] = PackagedTemplate(name, self)
+
+            return self._templates[name]
 
-        path = resource_filename("mkwind.templates", template_name)
 
-        return cls(path)
+REGISTRY = TemplateRegistry()
@@ -0,0 +1,44 @@
+import unittest as ut
+from mkite_core.external import load_config
+from pkg_resources import resource_filename
+
+from mkwind.templates import Template
+from mkwind.templates.base import TemplateRegistry, REGISTRY
+
+CONFIG_PATH = resource_filename("mkwind.tests.files.clusters", "recipe.yaml")
+TEMPLATE_PATH = resource_filename("mkwind.templates", "slurm.sh")
+
+
+class TestTemplateRegistry(ut.TestCase):
+    def setUp(self):
+        self.inputs = load_config(CONFIG_PATH)
+        self.registry = TemplateRegistry()
+
+    def test_from_name(self):
+        template = Template.from_name("slurm")
+        self.assertIs(template, Template.from_name("slurm.sh"))
+        self.assertIs(template, REGISTRY.get("slurm.sh"))
+
+    def test_lazy(self):
+        template = self.registry.get("slurm.sh")
+        self.assertIsNone(template._jtemplate)
+        self.assertIsNone(self.registry._environment)
+
+        out = template.render(self.inputs)
+        jtemplate = template._jtemplate
+        self.assertIsNotNone(jtemplate)
+
+        template.render(self.inputs)
+        self.assertIs(template._jtemplate, jtemplate)
+
+        expected = Template(TEMPLATE_PATH).render(self.inputs)
+        self.assertEqual(out, expected)
+
+    def test_shared_environment(self):
+        slurm = self.registry.get("slurm.sh")
+        lsf = self.registry.get("lsf.sh")
+        self.assertIs(slurm.jtemplate.environment, lsf.jtemplate.environment)
+
+    def test_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            self.registry.get("nonexisting")
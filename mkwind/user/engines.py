@@ -0,0 +1,41 @@
+import os
+import threading
+from typing import Dict, Tuple
+
+from mkite_engines import BaseEngine, EngineRoles, RedisEngine, instantiate_from_path
+
+
+class EnginePool:
+    """Instantiates each engine once per config file and role, so that
+    daemons running in the same process share them. Redis engines
+    created from the same config file also share a single client
+    (and its pool of connections), regardless of their role."""
+
+    def __init__(self):
+        self._engines: Dict[Tuple[str, EngineRoles], BaseEngine] = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._engines)
+
+    def get(self, path: os.PathLike, role: EngineRoles) -> BaseEngine:
+        key = (os.path.abspath(path), role)
+
+        with self._lock:
+            if key not in self._engines:
+                self._engines[key] = self.create(path, role)
+
+            return self._engines[key]
+
+    def create(self, path: os.PathLike, role: EngineRoles) -> BaseEngine:
+        engine = instantiate_from_path(path, role=role)
+
+        if isinstance(engine, RedisEngine):
+            config = os.path.abspath(path)
+            if config not in self._clients:
+                self._clients[config] = engine._get_new_redis()
+
+            engine._r = self._clients[config]
+
+        return engine
@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import traceback
+import threading
+import ctypes
+import ctypes.util
+from typing import Callable, Dict
+
+from .logger import Logger, LoggerLevel
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+# items added to or removed from a queue folder
+ARRIVALS = IN_CREATE | IN_MOVED_TO
+DEPARTURES = IN_DELETE | IN_MOVED_FROM
+
+
+class Inotify:
+    """Minimal wrapper of the Linux inotify API, which notifies when
+    entries are added to or removed from a set of folders"""
+
+    def __init__(self, watches: Dict[os.PathLike, int]):
+        libc = self.get_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "could not initialize inotify")
+
+        try:
+            for path, mask in watches.items():
+                self.add_watch(path, mask)
+        except OSError:
+            self.close()
+            raise
+
+    @staticmethod
+    def get_libc():
+        if not sys.platform.startswith("linux"):
+            return None
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        except OSError:
+            return None
+
+        if not hasattr(libc, "inotify_init1"):
+            return None
+
+        return libc
+
+    @classmethod
+    def available(cls) -> bool:
+        return cls.get_libc() is not None
+
+    def add_watch(self, path: os.PathLike, mask: int):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"could not watch {path}: {os.strerror(err)}")
+
+    def drain(self):
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    return
+            except BlockingIOError:
+                return
+
+    def wait(self, timeout: float, interrupt: int = None) -> bool:
+        """Waits up to `timeout` seconds for an event, or until the file
+        descriptor `interrupt` becomes readable. Returns True if an
+        event happened."""
+        fds = [self.fd] if interrupt is None else [self.fd, interrupt]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self.fd not in ready:
+            return False
+
+        self.drain()
+        return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class EventLoop:
+    """Runs `run` repeatedly. If `watches` are given and inotify is
+    available, the loop wakes up as soon as the watched folders change,
+    and otherwise waits for `min_sleep` seconds, doubling up to `sleep`
+    seconds while nothing happens. Without inotify, it falls back to
+    running every `sleep` seconds. The loop can be stopped from another
+    thread with `stop`."""
+
+    def __init__(
+        self,
+        run: Callable,
+        logger: Logger,
+        sleep: float = 60,
+        min_sleep: float = 5,
+        watches: Dict[os.PathLike, int] = None,
+        debounce: float = 1,
+    ):
+        self.run_fn = run
+        self.logger = logger
+        self.sleep = sleep
+        self.min_sleep = min(min_sleep, sleep)
+        self.debounce = debounce
+
+        self._stop = threading.Event()
+        self.inotify = None
+        if watches:
+            self.inotify = self.get_inotify(watches)
+
+        # wakes up the inotify loop when stopping
+        if self.inotify is not None:
+            self._stop_r, self._stop_w = os.pipe()
+
+    def get_inotify(self, watches: Dict[os.PathLike, int]) -> Inotify:
+        try:
+            inotify = Inotify(watches)
+        except OSError as e:
+            self.logger.log(f"falling back to polling: {e}", level=LoggerLevel.WARNING)
+            return None
+
+        self.logger.log(f"watching {len(watches)} folders for changes")
+        return inotify
+
+    def stop(self):
+        """Stops the loop after the current cycle"""
+        if self.stopped:
+            return
+
+        self._stop.set()
+        if self.inotify is not None:
+            try:
+                os.write(self._stop_w, b"\0")
+            except OSError:
+                # the loop already finished and closed the pipe
+                pass
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        if self.inotify is None:
+            self._stop.wait(timeout)
+            return False
+
+        if not self.inotify.wait(timeout, interrupt=self._stop_r):
+            return False
+
+        # groups the bursts of events into a single wake up
+        time.sleep(self.debounce)
+        self.inotify.drain()
+        return True
+
+    def next_sleep(self, current: float, woke: bool) -> float:
+        if self.inotify is None:
+            return self.sleep
+
+        if woke:
+            return self.min_sleep
+
+        return min(current * 2, self.sleep)
+
+    def run(self, max_cycles: int = None):
+        delay = self.min_sleep if self.inotify is not None else self.sleep
+
+        cycles = 0
+        while not self.stopped and (max_cycles is None or cycles < max_cycles):
+            self.run_fn()
+            cycles += 1
+
+            if self.stopped:
+                break
+
+            self.logger.log(f"sleeping for up to {delay:.0f} seconds")
+            woke = self.wait(delay)
+            delay = self.next_sleep(delay, woke)
+
+        self._stop.set()
+        if self.inotify is not None:
+            self.inotify.close()
+            os.close(self._stop_r)
+            os.close(self._stop_w)
+
+
+class Supervisor:
+    """Runs several loops concurrently in the same process, each one in
+    its own thread and with its own cadence. An error in one cycle of a
+    loop is logged and does not stop the loop or the other loops."""
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+        self.loops: Dict[str, EventLoop] = {}
+        self.failures: Dict[str, int] = {}
+
+    def add(
+        self,
+        name: str,
+        run: Callable,
+        sleep: float = 60,
+        watches: Dict[os.PathLike, int] = None,
+        logger: Logger = None,
+    ) -> EventLoop:
+        logger = logger if logger is not None else self.logger.with_prefix(name)
+        loop = EventLoop(self.isolate(name, run, logger), logger, sleep=sleep, watches=watches)
+
+        self.loops[name] = loop
+        self.failures[name] = 0
+        return loop
+
+    def isolate(self, name: str, run: Callable, logger: Logger) -> Callable:
+        def run_isolated():
+            try:
+                run()
+            except Exception:
+                self.failures[name] += 1
+                logger.log(
+                    f"cycle failed:\n{traceback.format_exc()}", level=LoggerLevel.ERROR
+                )
+
+        return run_isolated
+
+    def stop(self):
+        for loop in self.loops.values():
+            loop.stop()
+
+    def run(self):
+        threads = [
+            threading.Thread(target=loop.run, name=f"mkwind-{name}", daemon=True)
+            for name, loop in self.loops.items()
+        ]
+
+        handler = None
+        if threading.current_thread() is threading.main_thread():
+            handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        for thread in threads:
+            thread.start()
+
+        self.logger.log(f"running {', '.join(self.loops.keys())}")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+
+        except KeyboardInterrupt:
+            self.logger.log("stopping after the current cycles")
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+        if handler is not None:
+            signal.signal(signal.SIGTERM, handler)
+
+        self.logger.log("all loops stopped")
@@ -0,0 +1,313 @@
+import os
+import time
+import getpass
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from mkite_core.models import Status
+
+
+JOURNAL_NAME = "journal-{root}.db"
+
+# SQLite relies on shared-memory locking for WAL, which these do not support
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "lustre", "gpfs", "cifs", "smb3", "smbfs",
+    "beegfs", "panfs", "ceph", "glusterfs", "fuse.sshfs",
+}
+
+# jobs that were in a queue folder, but are no longer found there
+MISSING = "missing"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    recipe TEXT,
+    status TEXT NOT NULL,
+    scheduler_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_scheduler_id ON jobs (scheduler_id);
+CREATE TABLE IF NOT EXISTS transitions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    src TEXT,
+    dst TEXT NOT NULL,
+    scheduler_id TEXT,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_name ON transitions (name);
+"""
+
+# jobs moved to READY or DOING are (re)submitted, and the scheduler ID of a
+# previous attempt no longer applies
+UPSERT = f"""
+INSERT INTO jobs (name, recipe, status, scheduler_id, attempts, created, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    status = excluded.status,
+    scheduler_id = CASE
+        WHEN excluded.status IN ('{Status.READY.value}', '{Status.DOING.value}')
+        THEN excluded.scheduler_id
+        ELSE COALESCE(excluded.scheduler_id, jobs.scheduler_id)
+    END,
+    attempts = jobs.attempts + excluded.attempts,
+    updated = excluded.updated
+"""
+
+
+class JournalError(Exception):
+    pass
+
+
+def get_filesystem_type(path: os.PathLike) -> Optional[str]:
+    """Type of the filesystem mounted at `path` (e.g., `ext4`, `lustre`),
+    or None if it cannot be determined"""
+    path = os.path.realpath(path)
+    try:
+        with open("/proc/mounts", "r") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+
+    best, fstype = "", None
+    for mount, fs in mounts:
+        mount = mount.replace("\\040", " ")
+        inside = path == mount or path.startswith(mount.rstrip("/") + "/")
+        if inside and len(mount) >= len(best):
+            best, fstype = mount, fs
+
+    return fstype
+
+
+def get_journal_path(root_path: os.PathLike, folder: os.PathLike = None) -> str:
+    """Default path of the journal of the local engine at `root_path`.
+    The journal is kept in the node-local temporary folder, as the root
+    is usually in a network filesystem. As it is rebuilt from the queue
+    folders by `reconcile`, losing it only costs a full listing."""
+    if folder is None:
+        folder = os.path.join(tempfile.gettempdir(), f"mkwind-{getpass.getuser()}")
+
+    root = hashlib.sha1(os.path.abspath(root_path).encode()).hexdigest()[:12]
+    return os.path.join(folder, JOURNAL_NAME.format(root=root))
+
+
+def get_recipe_name(name: str) -> str:
+    """Recipe of a job folder named `{recipe}_{uuid}_{timestamp}`"""
+    return name.rsplit("_", 2)[0]
+
+
+class JobJournal:
+    """Records the status of each job folder, and every transition between
+    queues, in a SQLite database in WAL mode. Queries such as the jobs in a
+    queue or the scheduler ID of a job are answered by the journal instead
+    of listing the folders. The filesystem remains the source of truth:
+    `reconcile` brings the journal back in sync with the queue folders,
+    e.g., after a daemon crashed between moving a folder and recording it.
+
+    The journal can be shared by several threads and processes of a
+    single host. As SQLite does not support WAL on network filesystems,
+    the journal must be in a node-local filesystem, and only one host may
+    write to it: the builder, job and postprocess daemons that enable it
+    have to run on the same node."""
+
+    def __init__(self, path: os.PathLike, timeout: float = 30):
+        folder = os.path.dirname(os.path.abspath(path))
+        fstype = get_filesystem_type(folder)
+        if fstype in NETWORK_FILESYSTEMS:
+            raise JournalError(
+                f"Cannot create the journal {path} in a {fstype} filesystem. "
+                "Use a node-local path."
+            )
+
+        os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_root(cls, root_path: os.PathLike, folder: os.PathLike = None) -> "JobJournal":
+        return cls(get_journal_path(root_path, folder))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(
+        self,
+        name: str,
+        dst: str,
+        src: str = None,
+        scheduler_id: str = None,
+        recipe: str = None,
+    ):
+        """Records that the job `name` moved from `src` to `dst`"""
+        self.record_many([name], dst, src=src, scheduler_id=scheduler_id, recipe=recipe)
+
+    def record_many(
+        self,
+        names: Iterable[str],
+        dst: str,
+        src: str = None,
+        scheduler_id: str = None,
+        recipe: str = None,
+    ):
+        """Records the transitions of several jobs in a single transaction.
+        Each move to DOING counts as a new attempt."""
+        if isinstance(dst, Status):
+            dst = dst.value
+
+        if isinstance(src, Status):
+            src = src.value
+
+        now = time.time()
+        attempts = 1 if dst == Status.DOING.value else 0
+        jobs = [
+            (
+                name,
+                recipe if recipe is not None else get_recipe_name(name),
+                dst,
+                scheduler_id,
+                attempts,
+                now,
+                now,
+            )
+            for name in names
+        ]
+        transitions = [(name, src, dst, scheduler_id, now) for name, *_ in jobs]
+
+        with self._lock, self._conn:
+            self._conn.executemany(UPSERT, jobs)
+            self._conn.executemany(
+                "INSERT INTO transitions (name, src, dst, scheduler_id, time) "
+                "VALUES (?, ?, ?, ?, ?)",
+                transitions,
+            )
+
+    def set_scheduler_id(self, name: str, scheduler_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET scheduler_id = ?, updated = ? WHERE name = ?",
+                (scheduler_id, time.time(), name),
+            )
+
+    def _query(self, sql: str, args: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def get(self, name: str) -> Optional[dict]:
+        """Returns the journal entry of the job, or None if it is unknown"""
+        cursor = self._query(
+            "SELECT name, recipe, status, scheduler_id, attempts, created, updated "
+            "FROM jobs WHERE name = ?",
+            (name,),
+        )
+        if not cursor:
+            return None
+
+        keys = ("name", "recipe", "status", "scheduler_id", "attempts", "created", "updated")
+        return dict(zip(keys, cursor[0]))
+
+    def get_history(self, name: str) -> List[tuple]:
+        """Returns the transitions of the job as (src, dst, scheduler_id, time)"""
+        return self._query(
+            "SELECT src, dst, scheduler_id, time FROM transitions "
+            "WHERE name = ? ORDER BY id",
+            (name,),
+        )
+
+    def names(self, status: str) -> Set[str]:
+        if isinstance(status, Status):
+            status = status.value
+
+        rows = self._query("SELECT name FROM jobs WHERE status = ?", (status,))
+        return {name for name, in rows}
+
+    def count(self, status: str) -> int:
+        if isinstance(status, Status):
+            status = status.value
+
+        rows = self._query("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))
+        return rows[0][0]
+
+    def count_by_recipe(self, status: str) -> Counter:
+        if isinstance(status, Status):
+            status = status.value
+
+        rows = self._query(
+            "SELECT recipe, COUNT(*) FROM jobs WHERE status = ? GROUP BY recipe",
+            (status,),
+        )
+        return Counter(dict(rows))
+
+    def scheduler_ids(self, status: str = Status.DOING.value) -> Dict[str, str]:
+        """Returns the scheduler IDs of the jobs in `status`, as {name: id}"""
+        if isinstance(status, Status):
+            status = status.value
+
+        rows = self._query(
+            "SELECT name, scheduler_id FROM jobs "
+            "WHERE status = ? AND scheduler_id IS NOT NULL",
+            (status,),
+        )
+        return dict(rows)
+
+    def reconcile(self, engine, queues: Iterable[str] = None) -> int:
+        """Updates the journal with the folders found in the `queues` of
+        the local `engine` (by default, all of its queues). Jobs recorded in one of these queues that are
+        no longer in any of them are marked as missing. Returns the
+        number of jobs that were updated."""
+        if queues is None:
+            queues = engine.queues
+
+        queues = [q.value if isinstance(q, Status) else q for q in queues]
+
+        found = {
+            name: queue
+            for queue in queues
+            for name in engine.list_path(engine.get_queue_path(queue))
+        }
+        known = {name: queue for queue in queues for name in self.names(queue)}
+
+        moves = {}
+        for name, queue in found.items():
+            if known.get(name) == queue:
+                continue
+
+            src = known.get(name)
+            if src is None:
+                entry = self.get(name)
+                src = None if entry is None else entry["status"]
+
+            moves.setdefault((src, queue), []).append(name)
+
+        for name, queue in known.items():
+            if name not in found:
+                moves.setdefault((queue, MISSING), []).append(name)
+
+        for (src, dst), names in moves.items():
+            self.record_many(names, dst, src=src)
+
+        return sum(len(names) for names in moves.values())
+
+
+def get_journal(settings, root_path: os.PathLike) -> Optional[JobJournal]:
+    """Returns the journal of the local engine at `root_path`, if the
+    journal is enabled in the settings. If `JOURNAL_PATH` is not given,
+    the journal is kept in the node-local temporary folder."""
+    if not settings.JOURNAL:
+        return None
+
+    if settings.JOURNAL_PATH is not None:
+        return JobJournal(settings.JOURNAL_PATH)
+
+    return JobJournal.from_root(root_path)
@@ -1,4 +1,5 @@
 import os
+import threading
 from enum import IntEnum
 from datetime import datetime
 from abc import ABC, abstractmethod
@@ -58,20 +59,36 @@ class FileHook(LoggerHook):
 
 
 class Logger:
-    def __init__(self, hooks: List[LoggerHook]):
+    def __init__(self, hooks: List[LoggerHook], prefix: str = None):
         self.hooks = hooks
+        self.prefix = prefix
+        self._lock = threading.Lock()
 
     def log(self, msg: str, format: bool = True, level: LoggerLevel = LoggerLevel.INFO):
-        for h in self.hooks:
-            h.log(msg, format=format, level=level)
+        if self.prefix is not None and format:
+            msg = f"[{self.prefix}] {msg}"
+
+        with self._lock:
+            for h in self.hooks:
+                h.log(msg, format=format, level=level)
 
     def newline(self):
-        for h in self.hooks:
-            h.log("\n", format=False)
+        with self._lock:
+            for h in self.hooks:
+                h.log("\n", format=False)
 
     def hbar(self, length=29):
-        for h in self.hooks:
-            h.log("=" * length, format=False)
+        with self._lock:
+            for h in self.hooks:
+                h.log("=" * length, format=False)
+
+    def with_prefix(self, prefix: str) -> "Logger":
+        """Returns a logger that writes to the same hooks, adding
+        `prefix` to each message. Both loggers can be used from
+        different threads."""
+        logger = Logger(self.hooks, prefix=prefix)
+        logger._lock = self._lock
+        return logger
 
     @classmethod
     def to_file(cls, filepath: os.PathLike, stdout: bool = False):
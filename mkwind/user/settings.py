@@ -1,8 +1,11 @@
 import os
+from typing import Any, Dict, List, Optional, Tuple
 from mkite_core.external import load_config
 from pydantic import Field, DirectoryPath, FilePath
 from pydantic_settings import BaseSettings
 
+from .logger import Logger, LoggerLevel
+
 
 class EnvSettings(BaseSettings):
     """Wraps and obtains all settings for the environmental variables"""
@@ -26,6 +29,18 @@ class EnvSettings(BaseSettings):
         "slurm",
         description="Name of the scheduler to use",
     )
+    SCHEDULER_TTL: float = Field(
+        30,
+        description="Number of seconds the status of the scheduler is cached",
+    )
+    SCHEDULER_SLOW_LATENCY: float = Field(
+        10,
+        description="Number of seconds a query to the scheduler can take before submissions are slowed down",
+    )
+    SCHEDULER_ACCOUNTING: bool = Field(
+        False,
+        description="If True, finished jobs are obtained from the accounting database of the scheduler",
+    )
     ENGINE_LOCAL: FilePath = Field(
         ...,
         description="Config file for the local engine that will run the jobs",
@@ -46,6 +61,46 @@ class EnvSettings(BaseSettings):
         None, 
         description="File containing the configuration files for building recipes",
     )
+    BUILD_STAGING: bool = Field(
+        False,
+        description="If True, jobs are built in a staging folder next to the READY queue and renamed into it",
+    )
+    BUILD_ENV_OVERRIDES: bool = Field(
+        False,
+        description="If True, job settings not defined in BUILD_CONFIG are read from environment variables (e.g., NODES)",
+    )
+    LOST_JOB_GRACE: float = Field(
+        600,
+        description="Number of seconds a job in DOING can be missing from the scheduler before it is considered lost",
+    )
+    LOST_JOB_POLICY: str = Field(
+        "requeue",
+        description="Queue for lost jobs without completion markers: 'requeue' (READY) or 'error' (ERROR)",
+    )
+    ARCHIVE_CODEC: str = Field(
+        "gzip",
+        description="Program used to compress the archived jobs: zstd, pigz, gzip or none",
+    )
+    ARCHIVE_LEVEL: Optional[int] = Field(
+        None,
+        description="Compression level of the archives. If not given, uses the default of the codec",
+    )
+    ARCHIVE_THREADS: int = Field(
+        0,
+        description="Number of threads used by zstd and pigz to compress each archive (0 uses all cores)",
+    )
+    ARCHIVE_STORE: bool = Field(
+        False,
+        description="If True, jobs are archived into a deduplicating content-addressed store in the archive engine instead of tar files",
+    )
+    JOURNAL: bool = Field(
+        False,
+        description="If True, the status of the jobs is recorded in a SQLite journal. All daemons using it must run on the same host",
+    )
+    JOURNAL_PATH: Optional[str] = Field(
+        None,
+        description="Path of the journal, which must be in a node-local filesystem. If not given, it is kept in the temporary folder of the node",
+    )
 
     class Config:
         case_sensitive = False
@@ -61,3 +116,86 @@ def get_settings(path: os.PathLike = None) -> EnvSettings:
         return EnvSettings.from_file(path)
 
     return EnvSettings()
+
+
+def get_watcher(path: os.PathLike, settings: EnvSettings) -> "SettingsWatcher":
+    """Returns a watcher for the settings file, if the settings
+    were loaded from a file"""
+    if path is None or not os.path.exists(path):
+        return None
+
+    return SettingsWatcher(path, settings)
+
+
+class SettingsWatcher:
+    """Reloads the EnvSettings from `path` whenever the file changes.
+    Fields that are used to set up the engines, the scheduler or the
+    logs keep their old value until the daemon is restarted."""
+
+    RESTART_FIELDS = [
+        "USER",
+        "SCHEDULER",
+        "SCHEDULER_ACCOUNTING",
+        "ENGINE_LOCAL",
+        "ENGINE_EXTERNAL",
+        "ENGINE_ARCHIVE",
+        "LOG_PATH",
+        "JOURNAL",
+        "JOURNAL_PATH",
+        "ARCHIVE_STORE",
+    ]
+
+    def __init__(self, path: os.PathLike, settings: EnvSettings = None):
+        self.path = path
+        self.settings = settings if settings is not None else EnvSettings.from_file(path)
+        self._stat = self.get_stat()
+
+    def get_stat(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self) -> Tuple[Dict[str, Tuple[Any, Any]], List[str]]:
+        """Reloads the settings if the file changed since it was last read.
+        Returns the changes that were applied, as `{field: (old, new)}`,
+        and the changed fields that require a restart. If the new file is
+        invalid, raises an error and keeps the current settings."""
+        stat = self.get_stat()
+        if stat == self._stat:
+            return {}, []
+
+        self._stat = stat
+        new = EnvSettings.from_file(self.path)
+
+        old = self.settings.model_dump()
+        changes = {k: (old[k], v) for k, v in new.model_dump().items() if old[k] != v}
+        ignored = [k for k in changes if k in self.RESTART_FIELDS]
+
+        for k in ignored:
+            changes.pop(k)
+
+        self.settings = self.settings.model_copy(
+            update={k: new for k, (old, new) in changes.items()}
+        )
+        return changes, ignored
+
+    def update(self, logger: Logger) -> bool:
+        """Reloads the settings and logs what changed. Returns True if
+        any of the settings changed."""
+        try:
+            changes, ignored = self.reload()
+
+        # a broken file should not stop the daemon
+        except Exception as e:
+            logger.log(f"could not reload {self.path}: {e}", level=LoggerLevel.ERROR)
+            return False
+
+        for field in ignored:
+            logger.log(
+                f"{field} changed in {self.path}, but requires a restart",
+                level=LoggerLevel.WARNING,
+            )
+
+        for field, (old, new) in changes.items():
+            logger.log(f"{field} changed from {old} to {new}")
+
+        return len(changes) > 0
@@ -0,0 +1,20 @@
+import unittest as ut
+from pkg_resources import resource_filename
+
+from mkite_engines import EngineRoles
+from mkwind.user.engines import EnginePool
+from mkite_core.tests.tempdirs import run_in_tempdir
+
+ENGINE = resource_filename("mkwind.tests.files.engines", "local.yaml")
+
+
+class TestEnginePool(ut.TestCase):
+    @run_in_tempdir
+    def test_get(self):
+        pool = EnginePool()
+        producer = pool.get(ENGINE, role=EngineRoles.producer)
+        consumer = pool.get(ENGINE, role=EngineRoles.consumer)
+
+        self.assertIs(pool.get(ENGINE, role=EngineRoles.producer), producer)
+        self.assertIsNot(producer, consumer)
+        self.assertEqual(len(pool), 2)
@@ -0,0 +1,117 @@
+import os
+import threading
+import unittest as ut
+from unittest.mock import patch, MagicMock
+
+from mkite_core.tests.tempdirs import run_in_tempdir
+from mkwind.user import Logger
+from mkwind.user.events import Inotify, EventLoop, Supervisor, ARRIVALS, DEPARTURES
+
+
+@ut.skipUnless(Inotify.available(), "inotify is not available")
+class TestInotify(ut.TestCase):
+    @run_in_tempdir
+    def test_wait(self):
+        os.mkdir("queue")
+        inotify = Inotify({"queue": ARRIVALS})
+        self.assertFalse(inotify.wait(0.01))
+
+        os.mkdir("job")
+        os.rename("job", "queue/job")
+        self.assertTrue(inotify.wait(1))
+        self.assertFalse(inotify.wait(0.01))
+        inotify.close()
+
+    @run_in_tempdir
+    def test_departures(self):
+        os.makedirs("queue/job")
+        inotify = Inotify({"queue": DEPARTURES})
+
+        os.mkdir("queue/new")
+        self.assertFalse(inotify.wait(0.01))
+
+        os.rename("queue/job", "job")
+        self.assertTrue(inotify.wait(1))
+        inotify.close()
+
+    def test_missing(self):
+        with self.assertRaises(OSError):
+            Inotify({"nonexisting": ARRIVALS})
+
+
+class TestEventLoop(ut.TestCase):
+    def test_polling(self):
+        run = MagicMock()
+        loop = EventLoop(run, Logger([]), sleep=60)
+        self.assertIsNone(loop.inotify)
+        self.assertEqual(loop.next_sleep(60, woke=False), 60)
+
+        with patch.object(loop._stop, "wait") as wait:
+            loop.run(max_cycles=2)
+
+        self.assertEqual(run.call_count, 2)
+        wait.assert_called_with(60)
+
+    def test_stop(self):
+        loop = EventLoop(MagicMock(), Logger([]), sleep=60)
+        loop.run_fn.side_effect = loop.stop
+        loop.run()
+        self.assertEqual(loop.run_fn.call_count, 1)
+
+    @ut.skipUnless(Inotify.available(), "inotify is not available")
+    @run_in_tempdir
+    def test_stop_events(self):
+        os.mkdir("queue")
+        loop = EventLoop(MagicMock(), Logger([]), sleep=60, watches={"queue": ARRIVALS})
+
+        thread = threading.Thread(target=loop.run)
+        thread.start()
+        loop.stop()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_fallback(self):
+        loop = EventLoop(MagicMock(), Logger([]), watches={"nonexisting": ARRIVALS})
+        self.assertIsNone(loop.inotify)
+
+    @ut.skipUnless(Inotify.available(), "inotify is not available")
+    @run_in_tempdir
+    def test_backoff(self):
+        os.mkdir("queue")
+        loop = EventLoop(
+            MagicMock(), Logger([]), sleep=60, min_sleep=5, watches={"queue": ARRIVALS}
+        )
+        self.assertIsNotNone(loop.inotify)
+
+        self.assertEqual(loop.next_sleep(5, woke=False), 10)
+        self.assertEqual(loop.next_sleep(40, woke=False), 60)
+        self.assertEqual(loop.next_sleep(40, woke=True), 5)
+
+        loop.debounce = 0
+        os.mkdir("queue/job")
+        self.assertTrue(loop.wait(1))
+        self.assertFalse(loop.wait(0.01))
+        loop.inotify.close()
+
+
+class TestSupervisor(ut.TestCase):
+    def test_isolation(self):
+        supervisor = Supervisor(Logger([]))
+        runs = []
+
+        def fail():
+            runs.append("fail")
+            raise ValueError("broken stage")
+
+        def work():
+            runs.append("work")
+            if runs.count("work") >= 3:
+                supervisor.stop()
+
+        supervisor.add("fail", fail, sleep=0.01)
+        supervisor.add("work", work, sleep=0.01)
+        supervisor.run()
+
+        self.assertEqual(runs.count("work"), 3)
+        self.assertGreaterEqual(supervisor.failures["fail"], 1)
+        self.assertEqual(supervisor.failures["work"], 0)
@@ -0,0 +1,105 @@
+import os
+import unittest as ut
+from pkg_resources import resource_filename
+
+from mkite_core.models import Status
+from mkite_engines import EngineRoles, instantiate_from_path
+from mkite_core.tests.tempdirs import run_in_tempdir
+from unittest.mock import patch, mock_open
+
+from mkwind.user.journal import (
+    JobJournal,
+    JournalError,
+    MISSING,
+    get_filesystem_type,
+    get_journal_path,
+)
+
+ENGINE = resource_filename("mkwind.tests.files.engines", "local.yaml")
+
+JOB = "vasp.pbe.relax_7615c560_1658944102"
+
+
+class TestJobJournal(ut.TestCase):
+    @run_in_tempdir
+    def test_record(self):
+        journal = JobJournal("journal.db")
+        journal.record(JOB, Status.READY)
+        journal.record(JOB, Status.DOING, src=Status.READY, scheduler_id="123")
+        journal.record(JOB, Status.READY, src=Status.DOING)
+        journal.record(JOB, Status.DOING, src=Status.READY)
+
+        entry = journal.get(JOB)
+        self.assertEqual(entry["recipe"], "vasp.pbe.relax")
+        self.assertEqual(entry["status"], Status.DOING.value)
+        self.assertEqual(entry["attempts"], 2)
+        self.assertGreaterEqual(entry["updated"], entry["created"])
+
+        history = journal.get_history(JOB)
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history[1][:3], ("ready", "doing", "123"))
+        self.assertIsNone(journal.get("unknown"))
+
+        # the ID of the previous attempt is dropped when requeued, but
+        # kept once the job leaves the scheduler
+        self.assertIsNone(entry["scheduler_id"])
+        journal.set_scheduler_id(JOB, "456")
+        journal.record(JOB, Status.DONE, src=Status.DOING)
+        self.assertEqual(journal.get(JOB)["scheduler_id"], "456")
+
+        mode = journal._query("PRAGMA journal_mode")[0][0]
+        self.assertEqual(mode, "wal")
+
+    def test_journal_path(self):
+        path = get_journal_path("/lustre/project/queues")
+        self.assertNotIn("/lustre", path)
+        self.assertNotEqual(path, get_journal_path("/lustre/project/other"))
+
+    @run_in_tempdir
+    def test_network_filesystem(self):
+        mounts = "/dev/sda1 / ext4 rw 0 0\n10.0.0.1@tcp:/fs /lustre lustre rw 0 0\n"
+        with patch("builtins.open", mock_open(read_data=mounts)):
+            self.assertEqual(get_filesystem_type("/lustre/project"), "lustre")
+            self.assertEqual(get_filesystem_type("/lustrefs"), "ext4")
+
+        with patch("mkwind.user.journal.get_filesystem_type", return_value="lustre"):
+            with self.assertRaises(JournalError):
+                JobJournal("journal.db")
+
+    @run_in_tempdir
+    def test_queries(self):
+        journal = JobJournal("journal.db")
+        journal.record_many(["a_1_1", "a_2_1", "b_1_1"], Status.READY)
+        journal.record("a_1_1", Status.DOING, src=Status.READY, scheduler_id="1")
+
+        self.assertEqual(journal.names(Status.READY), {"a_2_1", "b_1_1"})
+        self.assertEqual(journal.count(Status.READY), 2)
+        self.assertEqual(journal.count_by_recipe(Status.READY), {"a": 1, "b": 1})
+        self.assertEqual(journal.scheduler_ids(), {"a_1_1": "1"})
+
+        # other connections see the same journal
+        other = JobJournal("journal.db")
+        self.assertEqual(other.count(Status.DOING), 1)
+
+    @run_in_tempdir
+    def test_reconcile(self):
+        engine = instantiate_from_path(ENGINE, role=EngineRoles.producer)
+        for queue in (Status.READY, Status.DOING):
+            engine.add_queue(queue)
+
+        journal = JobJournal.from_root(engine.root_path, folder="journals")
+        self.assertTrue(os.path.exists(get_journal_path(engine.root_path, "journals")))
+
+        journal.record_many(["a_1_1", "a_2_1", "a_3_1"], Status.READY)
+        os.mkdir(engine.item_path(Status.READY.value, "a_1_1"))
+        os.mkdir(engine.item_path(Status.DOING.value, "a_2_1"))
+        os.mkdir(engine.item_path(Status.DOING.value, "a_4_1"))
+
+        fixed = journal.reconcile(engine)
+
+        self.assertEqual(fixed, 3)
+        self.assertEqual(journal.names(Status.READY), {"a_1_1"})
+        self.assertEqual(journal.names(Status.DOING), {"a_2_1", "a_4_1"})
+        self.assertEqual(journal.names(MISSING), {"a_3_1"})
+        self.assertEqual(journal.get_history("a_2_1")[-1][:2], ("ready", "doing"))
+        self.assertEqual(journal.reconcile(engine), 0)
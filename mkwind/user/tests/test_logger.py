@@ -1,5 +1,19 @@
 import unittest as ut
+from unittest.mock import MagicMock
+
+from mkwind.user.logger import Logger, LoggerLevel
 
 
 class TestLogger(ut.TestCase):
-    pass
+    def test_prefix(self):
+        hook = MagicMock()
+        logger = Logger([hook])
+        prefixed = logger.with_prefix("build")
+
+        prefixed.log("message")
+        hook.log.assert_called_with("[build] message", format=True, level=LoggerLevel.INFO)
+        self.assertIs(prefixed.hooks, logger.hooks)
+        self.assertIs(prefixed._lock, logger._lock)
+
+        prefixed.hbar()
+        hook.log.assert_called_with("=" * 29, format=False)
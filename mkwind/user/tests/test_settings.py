@@ -0,0 +1,55 @@
+import os
+import yaml
+import unittest as ut
+from pkg_resources import resource_filename
+
+from mkite_core.external import load_config
+from mkite_core.tests.tempdirs import run_in_tempdir
+from mkwind.user import Logger
+from mkwind.user.settings import EnvSettings, SettingsWatcher, get_watcher
+
+SETTINGS = resource_filename("mkwind.tests.files", "settings.yaml")
+
+
+def write_settings(path: str, offset: int = 0, **kwargs):
+    data = {k: str(v) for k, v in load_config(SETTINGS).items()}
+    data.update(kwargs)
+    with open(path, "w") as f:
+        yaml.safe_dump(data, f)
+
+    # ensures the mtime changes even on coarse filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset * 10**9))
+
+
+class TestSettingsWatcher(ut.TestCase):
+    @run_in_tempdir
+    def test_reload(self):
+        write_settings("settings.yaml", MAX_PENDING=10)
+        watcher = SettingsWatcher("settings.yaml")
+        settings = watcher.settings
+        self.assertEqual(watcher.reload(), ({}, []))
+
+        write_settings("settings.yaml", MAX_PENDING=20, USER="other", offset=1)
+        changes, ignored = watcher.reload()
+
+        self.assertEqual(changes, {"MAX_PENDING": (10, 20)})
+        self.assertEqual(ignored, ["USER"])
+        self.assertEqual(watcher.settings.MAX_PENDING, 20)
+        self.assertEqual(watcher.settings.USER, settings.USER)
+
+        # the previous object is not modified
+        self.assertEqual(settings.MAX_PENDING, 10)
+
+    @run_in_tempdir
+    def test_invalid(self):
+        write_settings("settings.yaml", MAX_PENDING=10)
+        watcher = SettingsWatcher("settings.yaml")
+
+        write_settings("settings.yaml", MAX_PENDING="many", offset=1)
+        self.assertFalse(watcher.update(Logger([])))
+        self.assertEqual(watcher.settings.MAX_PENDING, 10)
+
+    def test_get_watcher(self):
+        self.assertIsNone(get_watcher(None, None))
+        self.assertIsNone(get_watcher("nonexisting.yaml", None))